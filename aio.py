@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+
+def run(coro):
+    # the sync API drives the async one; inside a running loop (e.g. Jupyter) it gets a loop of its own
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    result = {}
+
+    def target():
+        try:
+            result['value'] = asyncio.run(coro)
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    if 'error' in result:
+        raise result['error']
+    return result.get('value')
+
+
+class AsyncLicenses:
+    # waits for a LicenseBroker reservation without blocking the loop. the broker call itself
+    # never waits (timeout=0) and runs off the loop, since it may shell out to licadmin
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._released = {}
+        self.waiting = 0
+
+    def __getstate__(self):
+        return {'broker': self.broker, '_released': {}, 'waiting': 0}
+
+    def _condition(self):
+        # asyncio primitives belong to one loop, and each sync call runs a fresh one
+        loop = asyncio.get_running_loop()
+        if loop not in self._released:
+            self._released = {loop: asyncio.Condition()}
+        return self._released[loop]
+
+    async def acquire(self, lic, tokens=None):
+        if lic is None:
+            return None
+        released = self._condition()
+        self.waiting += 1
+        try:
+            while True:
+                reservation = await asyncio.to_thread(self.broker.acquire, lic, tokens, 0)
+                if reservation is not None:
+                    return reservation
+                # retry on a release, or once the broker's licadmin snapshot has gone stale
+                async with released:
+                    try:
+                        await asyncio.wait_for(released.wait(), self.broker.ttl)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            self.waiting -= 1
+
+    async def release(self, reservation):
+        if reservation is None:
+            return
+        self.broker.release(reservation)
+        released = self._condition()
+        async with released:
+            released.notify_all()
@@ -0,0 +1,134 @@
+import os
+import csv
+from collections import OrderedDict
+
+from maestrowrapper import mae
+from maestrowrapper.mae import MAE, write_structures
+
+
+SD = ('.sd', '.sdf', '.mol')
+SMILES = ('.smi', '.smiles')
+MAE_EXTS = ('.mae', '.maegz', '.mae.gz')
+
+
+def ext(file):
+    file = file.lower()
+    if file.endswith('.mae.gz'):
+        return '.mae.gz'
+    return os.path.splitext(file)[-1]
+
+
+def sd_records(file):
+    # yields (title, text) for each record; the title is the first line of the record
+    with open(file, 'r') as f:
+        record = []
+        for line in f:
+            record.append(line)
+            if line.startswith('$$$$'):
+                yield record[0].strip(), ''.join(record)
+                record = []
+        if any(line.strip() for line in record):
+            yield record[0].strip(), ''.join(record)
+
+
+def read_titles(file):
+    kind = ext(file)
+    if kind in SD:
+        return [title for (title, _) in sd_records(file)]
+    if kind in MAE_EXTS:
+        return [structure.title for structure in MAE(file).structures()]
+    if kind in SMILES:
+        with open(file, 'r') as f:
+            return [line.split()[1] if len(line.split()) > 1 else '' for line in f if line.strip()]
+    raise ValueError('cannot batch {} files'.format(kind))
+
+
+def make_batches(files, batch_size):
+    # titles must be unique within a batch, or results could not be split back to their files;
+    # files without usable titles run on their own, and a batch never mixes input formats
+    batches = []
+    current = {}
+    for file in files:
+        kind = ext(file)
+        titles = set(read_titles(file))
+        if not titles or '' in titles:
+            batches.append(OrderedDict([(file, titles)]))
+            continue
+        batch, taken = current.get(kind, (None, None))
+        if batch is None or len(batch) >= batch_size or titles & taken:
+            batch, taken = OrderedDict(), set()
+            batches.append(batch)
+            current[kind] = (batch, taken)
+        batch[file] = titles
+        taken |= titles
+    return batches
+
+
+def write_batch(files, out):
+    kind = ext(files[0])
+    if kind in MAE_EXTS:
+        return mae.concat(files, out)
+    with open(out, 'w') as f:
+        for file in files:
+            with open(file, 'r') as src:
+                text = src.read()
+            f.write(text)
+            if text and not text.endswith('\n'):
+                f.write('\n')
+    return out
+
+
+def check_titles(output, owners, titles):
+    # every input has to get its results back before the combined output can go; nothing is written otherwise
+    missing = sorted(set(owners) - set(titles))
+    if missing:
+        raise RuntimeError('{} has no results for {}'.format(os.path.basename(output), ', '.join(missing)))
+
+
+def leftover(output, dest, suffix):
+    # where results whose title no input owns go
+    base = os.path.basename(output)[:-len(ext(output))]
+    return os.path.join(dest, '{}_unmatched{}'.format(base, suffix))
+
+
+def split_structures(output, owners, dest, suffix):
+    # owners maps structure title -> basename of the input file it came from
+    if ext(output) in SD:
+        records = list(sd_records(output))
+        check_titles(output, owners, [title for (title, _) in records])
+        written = {}
+        for title, text in records:
+            out = os.path.join(dest, owners[title] + suffix) if title in owners else leftover(output, dest, suffix)
+            written.setdefault(out, []).append(text)
+        for out, texts in written.items():
+            with open(out, 'w') as f:
+                f.write(''.join(texts))
+        return list(written)
+    # titles are read first (compressed output is streamed twice) so a short batch writes nothing
+    titles = read_titles(output)
+    check_titles(output, owners, titles)
+    return write_structures(output, {n: os.path.join(dest, owners[title] + suffix) if title in owners
+                                     else leftover(output, dest, suffix) for (n, title) in enumerate(titles)})
+
+
+def split_csv(output, owners, dest, suffix, column='molecule'):
+    written = {}
+    titles = []
+    with open(output, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            header = []
+        key = header.index(column) if column in header else 0
+        for row in reader:
+            title = row[key].strip() if row else ''
+            titles.append(title)
+            out = os.path.join(dest, owners[title] + suffix) if title in owners else leftover(output, dest, suffix)
+            written.setdefault(out, []).append(row)
+    check_titles(output, owners, titles)
+    for out, rows in written.items():
+        with open(out, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+    return list(written)
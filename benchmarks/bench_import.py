@@ -0,0 +1,48 @@
+import sys
+import argparse
+import subprocess
+import statistics
+
+
+def timed(statement, runs):
+    # each run is a fresh interpreter, so nothing is already imported
+    code = 'import time\nt = time.perf_counter()\n{}\nprint(time.perf_counter() - t)'.format(statement)
+    times = []
+    for _ in range(runs):
+        process = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True)
+        times.append(float(process.stdout.decode().split()[-1]))
+    return statistics.median(times)
+
+
+def heaviest(statement, top):
+    # top-level packages by cumulative import time, from -X importtime (microseconds, on stderr)
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+    packages = {}
+    for line in process.stderr.decode().splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        name = name.strip()
+        if cumulative.strip().isdigit() and '.' not in name:
+            packages[name] = int(cumulative) / 1e6
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time importing maestrowrapper and loading each job type')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8)
+    args = parser.parse_args()
+
+    from maestrowrapper import plugins
+    print('{:<28} {:8.3f} s'.format('import maestrowrapper', timed('import maestrowrapper', args.runs)))
+    for name, seconds in heaviest('import maestrowrapper', args.top):
+        print('    {:<24} {:8.3f} s'.format(name, seconds))
+    for name in plugins.names():
+        statement = 'import maestrowrapper\nfrom maestrowrapper import plugins\nplugins.get({!r})'.format(name)
+        print('{:<28} {:8.3f} s'.format('+ job type {}'.format(name), timed(statement, args.runs)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+from maestrowrapper.mae import MAE
+from maestrowrapper.maecache import StructureCache
+from maestrowrapper.benchmarks.synthetic import write_mae
+
+
+def measure(func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    # tracing slows allocation-heavy code down, so memory is measured on a second pass
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def legacy(file):
+    return len(MAE(file).parse_file_to_dict(file))
+
+
+def streaming(file):
+    atoms = 0
+    for structure in MAE(file, cache=False).structures():
+        atoms += len(structure)
+    return atoms
+
+
+def cached(file):
+    # the first call writes the StructureCache, every later one maps it
+    atoms = 0
+    for structure in MAE(file, cache=True).structures():
+        atoms += len(structure)
+    return atoms
+
+
+def coordinates(file):
+    return sum(len(structure.coordinates) for structure in MAE(file, cache=True).structures())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the legacy MAE parser, the streaming reader and the structure cache')
+    parser.add_argument('--structures', type=int, default=2000)
+    parser.add_argument('--atoms', type=int, default=300)
+    parser.add_argument('--file', default=None, help='reuse an existing .mae instead of generating one')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        file = args.file
+        if file is None:
+            file = write_mae(os.path.join(tmp, 'bench.mae'), args.structures, args.atoms)
+        size = os.path.getsize(file) / 1e6
+        print('{}: {:.1f} MB'.format(file, size))
+        sidecar = StructureCache.sidecar(file)
+        if os.path.isfile(sidecar):
+            os.remove(sidecar)
+        start = time.perf_counter()
+        cached(file)
+        print('{:<20} {:8.2f} s  {:.1f} MB'.format('cache build', time.perf_counter() - start, os.path.getsize(sidecar) / 1e6))
+        for name, func in (('parse_file_to_dict', legacy), ('structures', streaming), ('structures, cached', cached),
+                           ('coordinates, cached', coordinates)):
+            result, elapsed, peak = measure(lambda: func(file))
+            print('{:<20} {:8.2f} s {:8.1f} MB/s  peak {:8.1f} MB  ({})'.format(
+                name, elapsed, size / elapsed, peak / 1e6, result))
+
+
+if __name__ == '__main__':
+    main()
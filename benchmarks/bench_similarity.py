@@ -0,0 +1,56 @@
+import time
+import argparse
+
+import numpy as np
+
+from maestrowrapper import similarity
+from maestrowrapper.benchmarks.synthetic import packed_fingerprints
+
+
+def timed(name, func):
+    start = time.perf_counter()
+    result = func()
+    print('{:<28} {:8.2f} s'.format(name, time.perf_counter() - start))
+    return result
+
+
+def legacy_top_k(frame, reference, k):
+    # what the pandas loop did: one row at a time
+    ref = frame.iloc[reference].values.astype(bool)
+    sims = []
+    for _, row in frame.iterrows():
+        row = row.values.astype(bool)
+        union = (ref | row).sum()
+        sims.append((ref & row).sum() / union if union else 1.0)
+    return np.argsort(sims)[::-1][:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time fingerprint search and clustering on synthetic poses')
+    parser.add_argument('--poses', type=int, default=100000)
+    parser.add_argument('--bits', type=int, default=1024)
+    parser.add_argument('--clusters', type=int, default=500)
+    parser.add_argument('--pairs', type=int, default=10000, help='poses in the all-pairs run')
+    parser.add_argument('--legacy', type=int, default=2000, help='poses in the pandas baseline, 0 to skip')
+    args = parser.parse_args()
+    packed = timed('generate {} x {}'.format(args.poses, args.bits),
+                   lambda: packed_fingerprints(args.poses, args.bits, args.clusters))
+    print('{:<28} {:8.1f} MB'.format('packed size', packed.nbytes / 1e6))
+    if args.legacy:
+        import pandas as pd
+        from maestrowrapper.fingerprint import unpack
+        frame = pd.DataFrame(unpack(packed[:args.legacy], args.bits).astype(np.uint8))
+        timed('pandas top-10 ({})'.format(args.legacy), lambda: legacy_top_k(frame, 0, 10))
+        timed('packed top-10 ({})'.format(args.legacy), lambda: similarity.top_k(packed[0], packed[:args.legacy], 10))
+    rows, sims = timed('tanimoto top-10', lambda: similarity.top_k(packed[0], packed, 10))
+    timed('tversky top-10', lambda: similarity.top_k(packed[0], packed, 10, 'tversky', 0.9, 0.1))
+    n = min(args.pairs, args.poses)
+    pairs = timed('all pairs ({0} x {0})'.format(n),
+                  lambda: len(similarity.neighbours(packed[:n], 0.7)[0]))
+    labels, leaders = timed('leader clusters (0.6)', lambda: similarity.leader_cluster(packed, 0.6))
+    print('top hit {} ({:.3f}), {} pairs >= 0.7 in the all-pairs run, {} clusters'.format(
+        rows[1], sims[1], pairs, len(leaders)))
+
+
+if __name__ == '__main__':
+    main()
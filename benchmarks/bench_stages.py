@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+
+import numpy as np
+
+from maestrowrapper.benchmarks import fake_schrodinger
+from maestrowrapper.benchmarks.synthetic import write_ligands, write_mae
+
+
+def parse_pool(text):
+    # LIGPREP_MAIN=8,PSP_PLOP=16
+    return {lic.strip().upper(): int(n) for (lic, _, n) in (item.partition('=') for item in text.split(',') if item)}
+
+
+def job_latencies(trace):
+    # a job's latency is every phase it went through, from queued to collected
+    latencies = []
+    if not os.path.isfile(trace):
+        return latencies
+    with open(trace, 'r') as f:
+        for line in f:
+            record = json.loads(line)
+            if 'timings' in record and record.get('event') != 'summary' and not record.get('cached'):
+                latencies.append(sum(record['timings'].values()))
+    return latencies
+
+
+def licence_usage(state, start, end):
+    # integrates tokens in use over [start, end] from the fakes' checkout log
+    with open(os.path.join(state, 'pool.json'), 'r') as f:
+        issued = json.load(f)['issued']
+    events = {}
+    with open(os.path.join(state, 'usage.log'), 'r') as f:
+        for line in f:
+            t, lic, tokens = line.split()
+            events.setdefault(lic, []).append((float(t), int(tokens)))
+    usage = {}
+    for lic, total in issued.items():
+        used, last, busy, peak = 0, start, 0.0, 0
+        for t, tokens in sorted(events.get(lic, [])):
+            t = min(max(t, start), end)
+            busy += used * (t - last)
+            used += tokens
+            peak = max(peak, used)
+            last = t
+        busy += used * (end - last)
+        usage[lic] = {'issued': total, 'busy': busy, 'idle': total * (end - start) - busy, 'peak': peak}
+    return usage
+
+
+def run_stage(mw, stage, args):
+    if stage == 'ligprep':
+        mw.ligprep(output_type='mae', nt=args.nt, batch_size=args.batch_size)
+        return 'ligprep', os.path.join(os.path.dirname(mw.path), 'ligprep')
+    if stage == 'qikprop':
+        mw.qikprop(nt=args.nt, batch_size=args.batch_size)
+        return 'qikprop', os.path.join(os.path.dirname(mw.path), 'qikprop')
+    if stage == 'mmgbsa':
+        mw.primeMMGBSA(nt=args.nt)
+        return 'primeMMGBSA', mw.mmgbsa_path
+    mw.pipeline(protein='protein.mae', nt={'prepwizard': args.nt, 'complex': args.nt, 'primeMMGBSA': args.nt})
+    return 'primeMMGBSA', mw.mmgbsa_path
+
+
+# what each stage writes per input, which every input must have when no job is made to fail
+OUTPUTS = {'ligprep': '.mae', 'qikprop': '.CSV', 'mmgbsa': '-out.csv', 'pipeline': '-out.csv'}
+
+
+def count_outputs(stage, path):
+    return len([file for file in os.listdir(path) if file.endswith(OUTPUTS[stage]) and not file.startswith('.')
+                and '_unmatched' not in file])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run stage methods against simulated Schrodinger binaries')
+    parser.add_argument('--inputs', type=int, default=1000)
+    parser.add_argument('--stage', choices=('ligprep', 'qikprop', 'mmgbsa', 'pipeline'), default='ligprep')
+    parser.add_argument('--nt', type=lambda value: value if value == 'auto' else int(value), default=8,
+                        help="jobs at once, or 'auto' to let the AutoTuner pick")
+    parser.add_argument('--cores', type=int, default=None, help="cores nt 'auto' may fill (default: this machine's)")
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--pool', default='LIGPREP_MAIN=8,QIKPROP_MAIN=8,MAESTRO_MAIN=8,PSP_PLOP=64',
+                        help='licence tokens issued, LIC=N,...')
+    parser.add_argument('--tokens', default='PSP_PLOP=8', help='tokens one job checks out, LIC=N,...')
+    parser.add_argument('--runtime', default='lognormal:60,0.5',
+                        help='simulated job runtime: fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA')
+    parser.add_argument('--scale', type=float, default=60, help='simulated seconds per real second')
+    parser.add_argument('--fail', type=float, default=0.0, help='fraction of jobs that write no output')
+    parser.add_argument('--workdir', default=None, help='kept afterwards if given')
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='mw_bench_')
+    schrodinger = os.path.join(workdir, 'schrodinger')
+    state = os.path.join(workdir, 'licences')
+    inputs = os.path.join(workdir, 'inputs')
+    pool, tokens = parse_pool(args.pool), parse_pool(args.tokens)
+    fake_schrodinger.install(schrodinger, state, pool, tokens)
+    write_ligands(inputs, args.inputs)
+    if args.stage == 'pipeline':
+        write_mae(os.path.join(inputs, 'protein.mae'), 1, n_atoms=2000)
+
+    # MaestroWrapper copies the environment when it is made, so the fakes' settings go in first
+    os.environ.setdefault('COMPUTERNAME', socket.gethostname())
+    os.environ.update({'FAKE_STATE': state, 'FAKE_RUNTIME': args.runtime, 'FAKE_SCALE': str(args.scale),
+                       'FAKE_FAIL': str(args.fail)})
+    from maestrowrapper import MaestroWrapper
+    mw = MaestroWrapper(schrodinger, path=inputs)
+    mw.lics_per_job.update(tokens)
+    mw.license_broker.lics_per_job.update(tokens)
+    # the tuner looks again every five simulated minutes
+    mw.tuning = {'interval': 300 / args.scale, 'cores': args.cores}
+
+    home = os.getcwd()
+    start = time.time()
+    try:
+        name, path = run_stage(mw, args.stage, args)
+    finally:
+        os.chdir(home)
+    end = time.time()
+    wall = end - start
+    outputs = count_outputs(args.stage, path)
+    # a fake that exits without writing anything would otherwise benchmark as fast
+    if not args.fail and outputs < args.inputs:
+        raise SystemExit('{}: only {} of {} inputs have outputs in {}'.format(args.stage, outputs, args.inputs, path))
+    latencies = np.asarray(job_latencies(os.path.join(path, '.metrics.jsonl')), dtype=float) * args.scale
+    usage = licence_usage(state, start, end)
+
+    simulated = wall * args.scale
+    print()
+    print('{} on {} inputs, nt={}, batch size {}, runtime {}'.format(args.stage, args.inputs, args.nt,
+                                                                    args.batch_size, args.runtime))
+    print('{:<28} {:10.1f} s real, {:.1f} h simulated'.format('wall', wall, simulated / 3600))
+    print('{:<28} {:10.0f}'.format('inputs per simulated hour', args.inputs / simulated * 3600))
+    print('{:<28} {:10d}'.format('outputs written', outputs))
+    if len(latencies):
+        print('{:<28} {:10.0f}'.format('{} jobs per hour'.format(name), len(latencies) / simulated * 3600))
+        print('{:<28} p50 {:.0f} s  p95 {:.0f} s  p99 {:.0f} s  max {:.0f} s'.format(
+            '{} job latency'.format(name), np.percentile(latencies, 50), np.percentile(latencies, 95),
+            np.percentile(latencies, 99), latencies.max()))
+    for lic, u in sorted(usage.items()):
+        if not u['busy']:
+            continue
+        print('{:<28} {:5.1f}% busy, peak {}/{}, {:.1f} idle token-hours'.format(
+            lic, 100 * u['busy'] / (u['issued'] * wall) if wall else 0, u['peak'], u['issued'],
+            u['idle'] * args.scale / 3600))
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+import os
+import sys
+import gzip
+import time
+import json
+import fcntl
+import random
+import signal
+import shutil
+import subprocess
+
+# stand-ins for the Schrodinger executables MaestroWrapper calls. job control programs take a licence from a
+# shared pool, print a JobId, leave a .{COMPUTERNAME} lock file in their working directory while the "job"
+# runs in the background and write their outputs when it ends. jobcontrol -kill and -dump act on those ids.
+# configured through the environment:
+#   FAKE_STATE    directory holding the licence pool and usage log
+#   FAKE_RUNTIME  fixed:SECONDS, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA in simulated seconds
+#   FAKE_SCALE    simulated seconds per real second
+#   FAKE_FAIL     fraction of jobs that die without writing outputs
+#   FAKE_HANG     fraction of jobs that never finish, until killed
+
+LICENSES = {'ligprep': 'LIGPREP_MAIN', 'qikprop': 'QIKPROP_MAIN', 'prime_mmgbsa': 'PSP_PLOP',
+            'prepwizard': 'MAESTRO_MAIN', 'prepwizard.exe': 'MAESTRO_MAIN'}
+PROGRAMS = ('ligprep', 'qikprop', 'prime_mmgbsa', 'structcat', 'maesubset', 'licadmin', 'prepwizard', 'jobcontrol')
+# the directory holding the maestrowrapper package, for maesubset
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def state_dir():
+    return os.environ['FAKE_STATE']
+
+
+def pool_file():
+    return os.path.join(state_dir(), 'pool.json')
+
+
+def job_file(job_id):
+    # job ids are host-pid, pid being the background job's
+    return os.path.join(state_dir(), 'jobs', job_id.rsplit('-', 1)[-1])
+
+
+def install(bin_dir, state, pool, tokens=None):
+    # pool maps licence -> tokens issued, tokens maps licence -> tokens one job checks out
+    for path in (bin_dir, os.path.join(bin_dir, 'utilities'), state, os.path.join(state, 'jobs')):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+    with open(os.path.join(state, 'pool.json'), 'w') as f:
+        json.dump({'issued': pool, 'tokens': tokens or {}, 'used': {}}, f)
+    open(os.path.join(state, 'usage.log'), 'w').close()
+    for program in PROGRAMS:
+        path = os.path.join(bin_dir, 'utilities', 'prepwizard.exe') if program == 'prepwizard' else os.path.join(bin_dir, program)
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\nPYTHONPATH="{}${{PYTHONPATH:+:$PYTHONPATH}}" exec "{}" "{}" {} "$@"\n'.format(
+                ROOT, sys.executable, os.path.abspath(__file__), program))
+        os.chmod(path, 0o755)
+    return bin_dir
+
+
+class Pool:
+
+    def __enter__(self):
+        self.f = open(pool_file(), 'r+')
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+        self.state = json.load(self.f)
+        return self
+
+    def __exit__(self, *exc):
+        self.f.seek(0)
+        self.f.truncate()
+        json.dump(self.state, self.f)
+        self.f.flush()
+        fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
+
+    def take(self, lic):
+        tokens = self.state['tokens'].get(lic, 1)
+        issued = self.state['issued'].get(lic)
+        used = self.state['used'].get(lic, 0)
+        if issued is not None and used + tokens > issued:
+            return 0
+        self.state['used'][lic] = used + tokens
+        log_usage(lic, tokens)
+        return tokens
+
+    def give(self, lic, tokens):
+        self.state['used'][lic] = self.state['used'].get(lic, 0) - tokens
+        log_usage(lic, -tokens)
+
+
+def log_usage(lic, tokens):
+    with open(os.path.join(state_dir(), 'usage.log'), 'a') as f:
+        f.write('{} {} {}\n'.format(time.time(), lic, tokens))
+
+
+def runtime():
+    kind, _, args = os.environ.get('FAKE_RUNTIME', 'fixed:1').partition(':')
+    args = [float(arg) for arg in args.split(',') if arg]
+    if kind == 'uniform':
+        seconds = random.uniform(*args)
+    elif kind == 'lognormal':
+        seconds = random.lognormvariate(__import__('math').log(args[0]), args[1])
+    else:
+        seconds = args[0]
+    return seconds / float(os.environ.get('FAKE_SCALE', 1))
+
+
+def licadmin(args):
+    with Pool() as pool:
+        for lic, issued in sorted(pool.state['issued'].items()):
+            print('Users of {}:  (Total of {} licenses issued;  Total of {} licenses in use)'.format(
+                lic, issued, pool.state['used'].get(lic, 0)))
+
+
+def titles(file):
+    # structure titles without importing maestrowrapper, which would dominate a short fake job
+    found = []
+    with read(file) as f:
+        lines = iter(f)
+        if file.lower().endswith(('.sd', '.sdf')):
+            record = True
+            for line in lines:
+                if record:
+                    found.append(line.strip())
+                record = line.startswith('$$$$')
+        else:
+            for line in lines:
+                if not line.startswith('f_m_ct'):
+                    continue
+                keys = []
+                for line in lines:
+                    if line.strip() == ':::':
+                        break
+                    keys.append(line.strip())
+                values = [next(lines).strip() for _ in keys]
+                if 's_m_title' in keys:
+                    found.append(values[keys.index('s_m_title')].strip('"'))
+    return found or [os.path.splitext(os.path.basename(file))[0]]
+
+
+def read(file):
+    # .maegz inputs and outputs are gzip, as the real programs write them
+    with open(file, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    return gzip.open(file, 'rt') if compressed else open(file, 'r')
+
+
+def replace(dest, text=None, src=None):
+    # outputs are written beside dest and renamed over it, as a program writing its output over its input
+    # (ligprep -imae lig1.mae -omae lig1.mae) has to
+    tmp = '{}.{}.tmp'.format(dest, os.getpid())
+    if src is not None and dest.lower().endswith(('.maegz', '.gz')):
+        with read(src) as f, gzip.open(tmp, 'wt') as out:
+            shutil.copyfileobj(f, out)
+    elif src is not None:
+        shutil.copyfile(src, tmp)
+    else:
+        with open(tmp, 'w') as f:
+            f.write(text)
+    os.replace(tmp, dest)
+
+
+def write(program, args):
+    # what the real program leaves behind, with one result per input structure
+    if program == 'ligprep':
+        # ligprep -imae in.mae -osd out.sd
+        src, dest = args[1], args[3]
+        if dest.lower().endswith('.sd') or dest.lower().endswith('.sdf'):
+            replace(dest, ''.join('{}\n  fake\n\n  0  0  0  0  0  0  0  0  0  0999 V2000\nM  END\n$$$$\n'.format(title)
+                                  for title in titles(src)))
+        else:
+            replace(dest, src=src)
+    elif program == 'qikprop':
+        # qikprop in.mae
+        # the job is named after the input, less .mae, .maegz or .mae.gz
+        base = os.path.splitext(args[0][:-3] if args[0].lower().endswith('.gz') else args[0])[0]
+        with open(base + '.CSV', 'w') as f:
+            f.write('molecule,r_qp_mol_MW,r_qp_QPlogPo/w\n')
+            for title in titles(args[0]):
+                f.write('{},{:.3f},{:.3f}\n'.format(title, random.uniform(150, 600), random.uniform(-2, 6)))
+    elif program == 'prime_mmgbsa':
+        # prime_mmgbsa -prime_opt OPT job.inp
+        base = os.path.splitext(args[-1])[0]
+        with open(base + '-out.csv', 'w') as f:
+            f.write('title,r_psp_MMGBSA_dG_Bind\n{},{:.3f}\n'.format(base, random.uniform(-80, -10)))
+    elif program == 'prepwizard':
+        # prepwizard in.mae out.mae
+        replace(args[1], src=args[0])
+    with open('{}.log'.format(program), 'a') as f:
+        f.write('{} job finished\n'.format(program))
+
+
+def job(program, args):
+    lic = LICENSES[program]
+    with Pool() as pool:
+        tokens = pool.take(lic)
+    if not tokens:
+        sys.stderr.write('{}: failed to check out {} license\n'.format(program, lic))
+        return 1
+    lock = '.{}-{}-{}'.format(os.environ.get('COMPUTERNAME', ''), program, os.getpid())
+    open(lock, 'w').close()
+    cmd = [sys.executable, os.path.abspath(__file__), '--run', program, lic, str(tokens), lock] + args
+    # the job leaves the launcher's session, as under job control, so only jobcontrol -kill reaches it
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    print('JobId: {}-{}'.format(os.environ.get('COMPUTERNAME', 'fake'), process.pid))
+    sys.stdout.flush()
+    if '-WAIT' in args:
+        return process.wait()
+    # the launcher returns at once and the job carries on
+    return 0
+
+
+def killed(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def run(program, lic, tokens, lock, args):
+    args = [arg for arg in args if arg != '-WAIT']
+    record = {'program': program, 'cwd': os.getcwd(), 'ExitStatus': None}
+    with open(job_file(str(os.getpid())), 'w') as f:
+        json.dump(record, f)
+    signal.signal(signal.SIGTERM, killed)
+    try:
+        if random.random() < float(os.environ.get('FAKE_HANG', 0)):
+            while True:
+                time.sleep(60)
+        time.sleep(runtime())
+        if random.random() >= float(os.environ.get('FAKE_FAIL', 0)):
+            write(program, args)
+            record['ExitStatus'] = 'finished'
+        else:
+            with open('{}.log'.format(program), 'a') as f:
+                f.write('{}: fatal error\n{} job finished with exit code 1\n'.format(program, program))
+            record['ExitStatus'] = 'died'
+    except SystemExit:
+        record['ExitStatus'] = 'killed'
+        raise
+    except Exception:
+        record['ExitStatus'] = 'died'
+        raise
+    finally:
+        # job control gives the licence back however the job ends
+        with Pool() as pool:
+            pool.give(lic, int(tokens))
+        if os.path.exists(lock):
+            os.remove(lock)
+        with open(job_file(str(os.getpid())), 'w') as f:
+            json.dump(record, f)
+    return 0
+
+
+def jobcontrol(args):
+    # jobcontrol -kill <jobid> | -dump <jobid>
+    option, job_id = args[0], args[1]
+    if not os.path.isfile(job_file(job_id)):
+        sys.stderr.write('jobcontrol: no job {}\n'.format(job_id))
+        return 1
+    pid = int(job_id.rsplit('-', 1)[-1])
+    if option == '-kill':
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return 0
+        # returns once the job is gone and its licence given back
+        for _ in range(200):
+            with open(job_file(job_id), 'r') as f:
+                if json.load(f)['ExitStatus'] is not None:
+                    break
+            time.sleep(0.05)
+        return 0
+    with open(job_file(job_id), 'r') as f:
+        record = json.load(f)
+    print('JobId: {}'.format(job_id))
+    print('Status: {}'.format('running' if record['ExitStatus'] is None else 'completed'))
+    if record['ExitStatus'] is not None:
+        print('ExitStatus: {}'.format(record['ExitStatus']))
+    return 0
+
+
+def strip_host(args):
+    # -HOST host:n goes to job control, not to the program
+    if len(args) > 1 and args[0] == '-HOST':
+        return args[2:]
+    return args
+
+
+def main(argv):
+    if argv[0] == '--run':
+        return run(*argv[1:5], strip_host(argv[5:]))
+    program, args = argv[0], argv[1:]
+    if program == 'licadmin':
+        return licadmin(args)
+    if program == 'jobcontrol':
+        return jobcontrol(args)
+    if program == 'structcat':
+        # structcat -imae a.mae b.mae -omae out.mae
+        with open(args[-1], 'w') as out:
+            for file in args[1:-2]:
+                with open(file, 'r') as f:
+                    out.write(f.read())
+        return 0
+    if program == 'maesubset':
+        # maesubset -n N in.mae > out.mae
+        from maestrowrapper.mae import MAEIndex
+        with MAEIndex.load(args[-1], save=False) as index:
+            sys.stdout.buffer.write(index.header() + index[int(args[1]) - 1])
+        return 0
+    return job(program, strip_host(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,67 @@
+import os
+import random
+
+
+ATOM_KEYS = ['i_m_mmod_type', 'r_m_x_coord', 'r_m_y_coord', 'r_m_z_coord', 'i_m_residue_number',
+             's_m_pdb_residue_name', 's_m_pdb_atom_name', 's_m_chain_name', 'i_m_atomic_number',
+             'r_m_pdb_occupancy', 'r_m_pdb_tfactor', 's_m_insertion_code']
+ELEMENTS = [(6, 'C', 3), (7, 'N', 25), (8, 'O', 15), (16, 'S', 49)]
+
+
+def write_structure(f, title, n_atoms, rng):
+    f.write('f_m_ct {\n')
+    f.write(' s_m_title\n r_i_docking_score\n i_m_ct_format\n :::\n')
+    f.write(' "{}"\n {:.4f}\n 2\n'.format(title, rng.uniform(-12, -2)))
+    f.write(' m_atom[{}] {{\n'.format(n_atoms))
+    f.write(' # First column is atom index #\n')
+    for key in ATOM_KEYS:
+        f.write('  {}\n'.format(key))
+    f.write('  :::\n')
+    for i in range(1, n_atoms + 1):
+        number, symbol, mmod = rng.choice(ELEMENTS)
+        f.write('  {} {} {:.6f} {:.6f} {:.6f} {} LIG " {}{} " A {} 1.00 0.00 " "\n'.format(
+            i, mmod, rng.uniform(-50, 50), rng.uniform(-50, 50), rng.uniform(-50, 50),
+            1 + i // 20, symbol, i % 100, number))
+    f.write('  :::\n }\n')
+    f.write(' m_bond[{}] {{\n  i_m_from\n  i_m_to\n  i_m_order\n  :::\n'.format(n_atoms - 1))
+    for i in range(1, n_atoms):
+        f.write('  {} {} {} 1\n'.format(i, i, i + 1))
+    f.write('  :::\n }\n}\n\n')
+
+
+def write_mae(path, n_structures, n_atoms, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('{\n s_m_m2io_version\n :::\n 2.0.0\n}\n\n')
+        for i in range(n_structures):
+            write_structure(f, 'pose_{}'.format(i + 1), n_atoms, rng)
+    return path
+
+
+def write_ligands(path, n, n_atoms=40, seed=0):
+    # one small single-structure .mae per ligand, as docking exports produce them
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    rng = random.Random(seed)
+    files = []
+    for i in range(n):
+        file = os.path.join(path, 'lig{}.mae'.format(i + 1))
+        with open(file, 'w') as f:
+            f.write('{\n s_m_m2io_version\n :::\n 2.0.0\n}\n\n')
+            write_structure(f, 'lig{}'.format(i + 1), rng.randint(n_atoms // 2, n_atoms * 2), rng)
+        files.append(file)
+    return files
+
+
+def packed_fingerprints(n, n_bits=1024, clusters=500, density=0.1, noise=0.02, seed=0, chunk=8192):
+    # poses scattered around random centroids, packed the way fingerprint.pack does it
+    import numpy as np
+    from maestrowrapper.fingerprint import pack
+    rng = np.random.default_rng(seed)
+    centroids = rng.random((clusters, n_bits)) < density
+    packed = np.empty((n, (n_bits + 63) // 64), dtype='<u8')
+    for start in range(0, n, chunk):
+        size = min(chunk, n - start)
+        bits = centroids[rng.integers(0, clusters, size)] ^ (rng.random((size, n_bits), dtype=np.float32) < noise)
+        packed[start:start + size] = pack(bits)
+    return packed
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+from contextlib import closing
+
+
+def file_digest(file, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def schrodinger_version(schrodinger):
+    # the install directory name plus its mmshare build identify a release
+    parts = [os.path.basename(os.path.normpath(schrodinger))]
+    if os.path.isdir(schrodinger):
+        parts += sorted(d for d in os.listdir(schrodinger) if d.startswith('mmshare-v'))
+    return '/'.join(parts)
+
+
+def link(src, dest):
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+class ResultCache:
+
+    def __init__(self, root, max_size=None):
+        self.root = os.path.abspath(root)
+        self.max_size = max_size
+        self.objects = os.path.join(self.root, 'objects')
+        self.db = os.path.join(self.root, 'cache.sqlite')
+        self._digests = {}
+        if not os.path.isdir(self.objects):
+            os.makedirs(self.objects)
+        with closing(self._connect()) as conn, conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, stage TEXT, size INTEGER, files TEXT,
+                created REAL, used REAL, hits INTEGER DEFAULT 0)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_used ON entries (used)')
+
+    def _connect(self):
+        return sqlite3.connect(self.db, timeout=30)
+
+    def digest(self, file):
+        stat = os.stat(file)
+        memo = (os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+        if memo not in self._digests:
+            self._digests[memo] = file_digest(file)
+        return self._digests[memo]
+
+    def key(self, job, stage, version=''):
+        # paths are reduced to basenames so the same inputs hit the cache from any directory
+        def normalise(text):
+            for file in job.files:
+                text = text.replace(os.path.dirname(os.path.abspath(file)) + os.sep, '')
+            return text
+
+        h = hashlib.sha256()
+        for part in (stage, version, normalise(job.cmd)):
+            h.update(part.encode())
+            h.update(b'\0')
+        for file in sorted(job.files, key=os.path.basename):
+            h.update(os.path.basename(file).encode())
+            h.update(self.digest(file).encode())
+        for text in getattr(job, 'extra', []):
+            h.update(normalise(text).encode())
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.objects, key[:2], key)
+
+    def lookup(self, key):
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT files FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None or not os.path.isdir(self.path(key)):
+            return None
+        return json.loads(row[0])
+
+    def restore(self, key, dest):
+        files = self.lookup(key)
+        if files is None:
+            return None
+        if not os.path.isdir(dest):
+            os.makedirs(dest)
+        for file in files:
+            target = os.path.join(dest, file)
+            if os.path.exists(target):
+                os.remove(target)
+            link(os.path.join(self.path(key), file), target)
+        with closing(self._connect()) as conn, conn:
+            conn.execute('UPDATE entries SET used = ?, hits = hits + 1 WHERE key = ?', (time.time(), key))
+        return [os.path.join(dest, file) for file in files]
+
+    def store(self, key, stage, src):
+        # hidden files are job lock files; nested log directories are not cached
+        files = [file for file in os.listdir(src) if not file.startswith('.') and os.path.isfile(os.path.join(src, file))]
+        path = self.path(key)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        size = 0
+        for file in files:
+            link(os.path.join(src, file), os.path.join(path, file))
+            size += os.path.getsize(os.path.join(path, file))
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO entries (key, stage, size, files, created, used, hits) '
+                         'VALUES (?, ?, ?, ?, ?, ?, 0)', (key, stage, size, json.dumps(files), now, now))
+        if self.max_size is not None:
+            self.evict(self.max_size)
+        return files
+
+    def entries(self, stage=None):
+        query = 'SELECT key, stage, size, files, created, used, hits FROM entries'
+        params = ()
+        if stage is not None:
+            query += ' WHERE stage = ?'
+            params = (stage,)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query + ' ORDER BY used DESC', params).fetchall()
+        keys = ('key', 'stage', 'size', 'files', 'created', 'used', 'hits')
+        entries = [dict(zip(keys, row)) for row in rows]
+        for entry in entries:
+            entry['files'] = json.loads(entry['files'])
+        return entries
+
+    def stats(self):
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT stage, COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) '
+                                'FROM entries GROUP BY stage').fetchall()
+        stages = {stage: {'entries': count, 'size': size, 'hits': hits} for (stage, count, size, hits) in rows}
+        return {'entries': sum(s['entries'] for s in stages.values()),
+                'size': sum(s['size'] for s in stages.values()),
+                'hits': sum(s['hits'] for s in stages.values()),
+                'stages': stages}
+
+    def remove(self, keys):
+        for key in keys:
+            shutil.rmtree(self.path(key), ignore_errors=True)
+        with closing(self._connect()) as conn, conn:
+            conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key in keys])
+        return len(keys)
+
+    def evict(self, max_size):
+        # least recently used entries go first
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT key, size FROM entries ORDER BY used ASC').fetchall()
+        total = sum(size for (_, size) in rows)
+        evicted = []
+        for (key, size) in rows:
+            if total <= max_size:
+                break
+            evicted.append(key)
+            total -= size
+        return self.remove(evicted)
+
+    def purge(self, stage=None, older_than=None):
+        query = 'SELECT key FROM entries WHERE 1 = 1'
+        params = []
+        if stage is not None:
+            query += ' AND stage = ?'
+            params.append(stage)
+        if older_than is not None:
+            query += ' AND used < ?'
+            params.append(time.time() - older_than)
+        with closing(self._connect()) as conn:
+            keys = [key for (key,) in conn.execute(query, params).fetchall()]
+        return self.remove(keys)
@@ -0,0 +1,228 @@
+import os
+import re
+import sqlite3
+import threading
+
+from maestrowrapper.results import ResultStore, quote, structure_title
+
+
+# descriptors most screens filter or rank on; any column named like one of these, with or without its
+# r_qp_/i_qp_/r_psp_ prefix, is indexed as it is added
+DESCRIPTORS = ('mol_MW', 'QPlogPo/w', 'QPlogS', 'QPlogHERG', 'QPPCaco', 'QPlogBB', 'PercentHumanOralAbsorption',
+               '#stars', 'RuleOfFive', 'RuleOfThree', 'donorHB', 'accptHB', 'PSA', 'SASA', '#rtvFG',
+               'MMGBSA_dG_Bind', 'MMGBSA_dG_Bind(NS)', 'MMGBSA_dG_Bind_Coulomb', 'MMGBSA_dG_Bind_vdW')
+PREFIX = re.compile(r'^[rib]_[a-z]+_')
+OPERATORS = ('<', '<=', '>', '>=', '=', '==', '!=', 'between', 'in', 'like', 'glob', 'is null', 'is not null')
+
+
+def descriptor(name):
+    return PREFIX.sub('', name) in DESCRIPTORS
+
+
+class Campaign:
+    # one SQLite file holding every stage's results for a screen, keyed by structure title (see
+    # results.structure_title), so questions that join stages run as one indexed query:
+    #
+    #   campaign.select([('QPlogPo/w', '<', 5), ('#stars', '<=', 2)], contacts=['*ASP123*'],
+    #                   order_by='r_psp_MMGBSA_dG_Bind', limit=500)
+    #
+    # qikprop and mmgbsa rows are ResultStore tables; fingerprints are kept as (title, pose, interaction) rows
+    # for the bits that are set. stages are read incrementally, a file only when it is new or changed
+
+    STAGES = {'qikprop': ('qikprop', '.csv'), 'primeMMGBSA': ('mmgbsa', '-out.csv')}
+    FINGERPRINTS = ('fingerprint', '_fingerprint.csv')
+
+    def __init__(self, path):
+        if os.path.isdir(path):
+            path = os.path.join(path, 'campaign.sqlite')
+        self.path = os.path.abspath(path)
+        # stages add to it from the thread aio.run runs them on, which is not the one that made it inside
+        # Jupyter; the stores share the connection and its lock
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.RLock()
+        self.stores = {table: ResultStore(self.path, table, conn=self.conn, lock=self.lock)
+                       for (table, _) in self.STAGES.values()}
+        with self.lock, self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS contacts (
+                title TEXT, pose INTEGER, interaction TEXT, source TEXT)''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS contacts_interaction ON contacts (interaction, title)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS contacts_title ON contacts (title)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS contacts_source ON contacts (source)')
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, stage, path):
+        # reads what a stage left in its directory; job types this does not know about are skipped
+        if stage == self.FINGERPRINTS[0]:
+            return self.add_fingerprints(path)
+        if stage not in self.STAGES:
+            return 0
+        table, suffix = self.STAGES[stage]
+        store = self.stores[table]
+        count = 0
+        for file in sorted(os.listdir(path)):
+            if file.lower().endswith(suffix) and not file.startswith('.') and file != 'mmgbsa_all.csv':
+                count += store.ingest(os.path.join(path, file), title=structure_title(file))
+        self.index_descriptors(table)
+        return count
+
+    def add_fingerprints(self, path):
+        from maestrowrapper.fingerprint import read_csv
+        count = 0
+        for file in sorted(os.listdir(path)):
+            if not file.endswith(self.FINGERPRINTS[1]):
+                continue
+            source = os.path.join(os.path.abspath(path), file)
+            # the files table every ResultStore in the database keeps says whether this one is already in
+            if self.stores['mmgbsa'].ingested(source):
+                continue
+            labels, _, rows = read_csv(source)
+            title = structure_title(file)
+            stat = os.stat(source)
+            with self.lock, self.conn:
+                self.conn.execute('DELETE FROM contacts WHERE source = ?', (source,))
+                self.conn.executemany('INSERT INTO contacts VALUES (?, ?, ?, ?)',
+                                      [(title, pose, labels[n], source)
+                                       for (pose, row) in enumerate(rows) for n in row])
+                self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                                  (source, stat.st_size, stat.st_mtime_ns, len(rows)))
+            count += len(rows)
+        return count
+
+    def update(self, root):
+        # picks up every stage below a campaign root, e.g. after runs that were not given this campaign
+        count = 0
+        for directory, _, files in os.walk(root):
+            name = os.path.basename(directory)
+            if any(file.endswith(self.FINGERPRINTS[1]) for file in files):
+                count += self.add_fingerprints(directory)
+            elif name.startswith('primeMMGBSA') or any(file.endswith('-out.csv') for file in files):
+                count += self.add('primeMMGBSA', directory)
+            elif name.startswith('qikprop'):
+                count += self.add('qikprop', directory)
+        return count
+
+    def index_descriptors(self, table):
+        for name in self.stores[table].columns():
+            if descriptor(name):
+                self.stores[table].index(name)
+
+    def index(self, column):
+        # an index for a column not in DESCRIPTORS, e.g. before ranking on it repeatedly
+        table, name = self.resolve(column)
+        self.stores[table].index(name)
+
+    def columns(self):
+        return {table: store.columns() for (table, store) in self.stores.items()}
+
+    def resolve(self, column):
+        # 'table.column', or a bare column name that only one table has
+        if column == 'title':
+            return None, 'title'
+        columns = self.columns()
+        table, _, name = column.partition('.')
+        if name and table in columns and name in columns[table]:
+            return table, name
+        tables = [table for (table, names) in columns.items() if column in names]
+        if not tables:
+            raise KeyError('no column {!r} in {}'.format(column, ', '.join(columns)))
+        if len(tables) > 1:
+            raise KeyError('{!r} is in {}; say which as table.column'.format(column, ' and '.join(tables)))
+        return tables[0], column
+
+    def sql(self, where=(), contacts=(), order_by=None, descending=False, limit=None, columns=()):
+        # builds the query select() runs. where is [(column, operator, value), ...], all of which must hold;
+        # contacts are interaction labels or GLOB patterns ('*ASP123*') that some pose of the structure must show
+        where = [(column, op.lower(), value) for (column, op, *value) in where]
+        for _, op, _ in where:
+            if op not in OPERATORS:
+                raise ValueError('{!r} is not one of {}'.format(op, ', '.join(OPERATORS)))
+        # the table ranked on drives the query, so an index on order_by is walked in order and stops at limit
+        tables = []
+        for column in ([order_by] if order_by else []) + [column for (column, _, _) in where] + list(columns):
+            table, _ = self.resolve(column)
+            if table is not None and table not in tables:
+                tables.append(table)
+        if tables:
+            driver = tables[0]
+            source = quote(driver)
+        else:
+            driver = 'qikprop' if not contacts else 'contacts'
+            source = quote(driver) if not contacts else '(SELECT DISTINCT title FROM contacts) AS contacts'
+        title = '{}.title'.format(quote(driver))
+
+        def expr(column):
+            table, name = self.resolve(column)
+            return title if table is None else '{}.{}'.format(quote(table), quote(name))
+
+        params = []
+        conditions = []
+        for column, op, value in where:
+            if op in ('is null', 'is not null'):
+                conditions.append('{} {}'.format(expr(column), op.upper()))
+            elif op == 'between':
+                conditions.append('{} BETWEEN ? AND ?'.format(expr(column)))
+                params.extend(value[0])
+            elif op == 'in':
+                conditions.append('{} IN ({})'.format(expr(column), ', '.join('?' for _ in value[0])))
+                params.extend(value[0])
+            else:
+                conditions.append('{} {} ?'.format(expr(column), '=' if op == '==' else op.upper()))
+                params.append(value[0])
+        for contact in contacts:
+            conditions.append('EXISTS (SELECT 1 FROM contacts c WHERE c.interaction GLOB ? AND c.title = {})'.format(title))
+            params.append(contact)
+        selected = [title + ' AS title'] + ['{} AS {}'.format(expr(column), quote(column)) for column in columns]
+        sql = 'SELECT {} FROM {}'.format(', '.join(selected), source)
+        for table in tables[1:]:
+            sql += ' JOIN {0} ON {0}.title = {1}'.format(quote(table), title)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        if order_by is not None:
+            sql += ' ORDER BY {}{}'.format(expr(order_by), ' DESC' if descending else '')
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        return sql, params
+
+    def select(self, where=(), contacts=(), order_by=None, descending=False, limit=None, columns=()):
+        # rows come off the cursor as they are found; nothing is read that the query does not need.
+        # order_by and where columns are returned alongside the title unless columns says otherwise
+        shown = list(columns) or [column for (column, *_) in where] + ([order_by] if order_by else [])
+        shown = [column for (n, column) in enumerate(shown) if column != 'title' and column not in shown[:n]]
+        sql, params = self.sql(where, contacts, order_by, descending, limit, shown)
+        with self.lock:
+            return self.conn.execute(sql, params)
+
+    def frame(self, where=(), contacts=(), order_by=None, descending=False, limit=None, columns=()):
+        import pandas as pd
+        with self.lock:
+            cursor = self.select(where, contacts, order_by, descending, limit, columns)
+            rows = cursor.fetchall()
+        return pd.DataFrame.from_records(rows, columns=[d[0] for d in cursor.description])
+
+    def explain(self, *args, **kwargs):
+        # SQLite's plan for a select(), to check a filter or ranking is using an index
+        sql, params = self.sql(*args, **kwargs)
+        with self.lock:
+            return [row[-1] for row in self.conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+    def titles(self):
+        sql = ' UNION '.join('SELECT title FROM {}'.format(quote(table)) for table in list(self.stores) + ['contacts'])
+        with self.lock:
+            return [row[0] for row in self.conn.execute(sql + ' ORDER BY title')]
+
+    def count(self):
+        counts = {table: store.count() for (table, store) in self.stores.items()}
+        with self.lock:
+            counts['contacts'] = self.conn.execute('SELECT COUNT(*) FROM contacts').fetchone()[0]
+        return counts
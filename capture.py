@@ -0,0 +1,222 @@
+import os
+import re
+import time
+import signal
+import asyncio
+import threading
+import subprocess
+from collections import deque
+
+
+# how Schrodinger programs and job control report the end of a job in their output and .log files
+EXIT_STATUS = re.compile(r'exit(?:ed|ing)?(?: with)? (?:exit )?(?:status|code)[\s:=]*(-?\d+)', re.IGNORECASE)
+# what a launcher prints once job control has the job, and how job control records how it ended
+JOBID = re.compile(r'^\s*JobId:\s*(\S+)', re.MULTILINE)
+JOB_EXIT = re.compile(r'^\s*ExitStatus:\s*(\S+)', re.MULTILINE)
+CHUNK = 65536
+
+
+def schrodinger_status(text):
+    # the last exit status reported wins. only a status job control or the program states counts: words
+    # like "killed" or "license error" turn up in the output of jobs that went fine
+    codes = EXIT_STATUS.findall(text)
+    if codes:
+        return int(codes[-1])
+    return None
+
+
+def job_exit_status(text):
+    # from jobcontrol -dump <jobid>: finished is success, anything else (died, killed, fizzled) is not
+    match = JOB_EXIT.search(text)
+    if match is None:
+        return None
+    return 0 if match.group(1).lower() == 'finished' else 1
+
+
+def jobcontrol(env=None):
+    env = env if env is not None else os.environ
+    if env.get('SCHRODINGER'):
+        return os.path.join(env['SCHRODINGER'], 'jobcontrol')
+    return 'jobcontrol'
+
+
+def kill_group(process):
+    # the launcher and everything it started, which is its own process group (start_new_session)
+    if process is None:
+        return
+    try:
+        if os.name == 'posix':
+            os.killpg(process.pid, signal.SIGKILL)
+        elif process.returncode is None:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+class JobFailed(RuntimeError):
+
+    def __init__(self, message, lines=(), log=None):
+        self.lines = list(lines)
+        self.log = log
+        text = message
+        if log is not None and os.path.isfile(log):
+            text += ' (log {})'.format(log)
+        if self.lines:
+            text += '\n' + '\n'.join('    ' + line for line in self.lines)
+        super().__init__(text)
+
+    def __repr__(self):
+        # the scheduler prints repr(e); keep the output tail readable there
+        return 'JobFailed: {}'.format(self)
+
+
+class JobLog:
+    # a job's stdout and stderr, written to disk as they arrive. the file rolls over to .1, .2, ...
+    # once it passes max_bytes and only the last `tail` lines stay in memory, so a chatty job costs neither
+
+    def __init__(self, path, max_bytes=1 << 20, backups=2, tail=40):
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.lines = deque(maxlen=tail)
+        self.written = 0
+        self.last_output = None
+        # the job control id the launcher printed, if it printed one
+        self.job_id = None
+        self._partial = b''
+        self._f = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_job(cls, job, **kwargs):
+        # beside the tmpdir, not in it: the tmpdir is collected wholesale and watched for lock files
+        tmpdir = os.path.abspath(job.tmpdir)
+        return cls(os.path.join(os.path.dirname(tmpdir), '.logs', '{}.out'.format(os.path.basename(tmpdir))), **kwargs)
+
+    def open(self):
+        if self._f is None:
+            directory = os.path.dirname(self.path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory, exist_ok=True)
+            self._f = open(self.path, 'ab')
+            self.written = self._f.tell()
+        return self
+
+    def rotate(self):
+        self._f.close()
+        for n in range(self.backups, 0, -1):
+            src = self.path if n == 1 else '{}.{}'.format(self.path, n - 1)
+            if os.path.exists(src):
+                os.replace(src, '{}.{}'.format(self.path, n))
+        if not self.backups:
+            os.remove(self.path)
+        self._f = open(self.path, 'ab')
+        self.written = 0
+
+    def write(self, data):
+        if not data:
+            return
+        with self._lock:
+            self.open()
+            self.last_output = time.time()
+            if self.written + len(data) > self.max_bytes and self.written:
+                self.rotate()
+            self._f.write(data)
+            self._f.flush()
+            self.written += len(data)
+            if self.job_id is None and b'JobId' in data:
+                match = JOBID.search((self._partial + data).decode(errors='replace'))
+                if match is not None:
+                    self.job_id = match.group(1)
+            lines = (self._partial + data).split(b'\n')
+            # a line longer than a chunk is kept only up to a chunk's worth
+            self._partial = lines.pop()[-CHUNK:]
+            # only lines that can still be in the tail are worth decoding
+            for line in lines[-self.lines.maxlen:]:
+                self.lines.append(line.rstrip(b'\r').decode(errors='replace'))
+
+    def load(self):
+        # fills the tail from a log another process wrote, reading no more than its last chunk
+        if not os.path.isfile(self.path):
+            return self
+        with open(self.path, 'rb') as f:
+            f.seek(max(os.path.getsize(self.path) - CHUNK, 0))
+            lines = f.read().split(b'\n')
+        if lines and not lines[-1]:
+            lines.pop()
+        self.lines.extend(line.rstrip(b'\r').decode(errors='replace') for line in lines)
+        return self
+
+    def close(self):
+        with self._lock:
+            if self._partial:
+                self.lines.append(self._partial.decode(errors='replace'))
+                self._partial = b''
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+    def tail(self, n=None):
+        lines = list(self.lines)
+        return lines if n is None else lines[-n:]
+
+    def text(self):
+        return '\n'.join(self.lines)
+
+    def status(self):
+        return schrodinger_status(self.text())
+
+
+async def drain(stream, log):
+    # copies a subprocess pipe to log as it is written
+    while True:
+        data = await stream.read(CHUNK)
+        if not data:
+            break
+        log.write(data)
+
+
+def last_activity(path):
+    # a running job shows it is alive by writing to its directory
+    with os.scandir(path) as entries:
+        return max((entry.stat().st_mtime for entry in entries if entry.is_file()), default=0)
+
+
+def quiet(started, cwd, log=None):
+    # seconds since the job last printed anything or touched its directory
+    last_output = log.last_output or 0 if log is not None else 0
+    return time.time() - max(started, last_output, last_activity(cwd))
+
+
+def hung_message(cmd, hang_timeout):
+    return '{} hung: no output for {} s, killed'.format(' '.join(cmd), hang_timeout)
+
+
+async def arun(cmd, cwd, log, env=None, hang_timeout=None):
+    cmd = cmd.split() if isinstance(cmd, str) else list(cmd)
+    started = time.time()
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                                   stdin=subprocess.DEVNULL, env=env, cwd=cwd, start_new_session=True)
+    reader = asyncio.ensure_future(drain(process.stdout, log))
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(asyncio.shield(process.wait()), 1 if hang_timeout is not None else None)
+                break
+            except asyncio.TimeoutError:
+                if quiet(started, cwd, log) > hang_timeout:
+                    kill_group(process)
+                    await process.wait()
+                    raise JobFailed(hung_message(cmd, hang_timeout), log.tail(), log.path)
+        await reader
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            kill_group(process)
+        raise
+    finally:
+        reader.cancel()
+        log.close()
+    status = process.returncode or log.status() or 0
+    if status != 0:
+        raise JobFailed('{} exited with {}'.format(' '.join(cmd), status), log.tail(), log.path)
+    return status
@@ -0,0 +1,143 @@
+import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from maestrowrapper.mae import MAE
+
+
+ELEMENTS = np.array(['', 'H', 'He', 'Li', 'Be', 'B', 'C', 'N', 'O', 'F', 'Ne', 'Na', 'Mg', 'Al', 'Si', 'P', 'S',
+                     'Cl', 'Ar', 'K', 'Ca', 'Sc', 'Ti', 'V', 'Cr', 'Mn', 'Fe', 'Co', 'Ni', 'Cu', 'Zn', 'Ga', 'Ge',
+                     'As', 'Se', 'Br', 'Kr', 'Rb', 'Sr', 'Y', 'Zr', 'Nb', 'Mo', 'Tc', 'Ru', 'Rh', 'Pd', 'Ag', 'Cd',
+                     'In', 'Sn', 'Sb', 'Te', 'I', 'Xe', 'Cs', 'Ba', 'La', 'Ce', 'Pr', 'Nd', 'Pm', 'Sm', 'Eu', 'Gd',
+                     'Tb', 'Dy', 'Ho', 'Er', 'Tm', 'Yb', 'Lu', 'Hf', 'Ta', 'W', 'Re', 'Os', 'Ir', 'Pt', 'Au', 'Hg',
+                     'Tl', 'Pb', 'Bi', 'Po', 'At', 'Rn'])
+POLYMER = {'ALA', 'ARG', 'ASN', 'ASP', 'CYS', 'GLN', 'GLU', 'GLY', 'HIS', 'ILE', 'LEU', 'LYS', 'MET', 'PHE',
+           'PRO', 'SER', 'THR', 'TRP', 'TYR', 'VAL', 'HID', 'HIE', 'HIP', 'CYX', 'ASH', 'GLH', 'LYN', 'ARN',
+           'ACE', 'NMA', 'A', 'C', 'G', 'T', 'U', 'DA', 'DC', 'DG', 'DT', 'DU'}
+REQUIRED = ('r_m_x_coord', 'r_m_y_coord', 'r_m_z_coord', 'i_m_atomic_number')
+
+
+def column(atoms, key, default):
+    if key in atoms:
+        return atoms[key]
+    return np.full(len(atoms), default)
+
+
+def fmt(spec, values):
+    return np.char.mod(spec, values)
+
+
+def atom_records(structure):
+    atoms = structure.atoms
+    if atoms is None or any(key not in atoms for key in REQUIRED):
+        raise ValueError('{}: no coordinates or elements to convert'.format(structure.title))
+    n = len(atoms)
+    if n > 99999:
+        raise ValueError('{}: {} atoms do not fit the PDB serial field'.format(structure.title, n))
+    numbers = atoms['i_m_atomic_number'].astype(np.int64)
+    elements = ELEMENTS[np.clip(numbers, 0, len(ELEMENTS) - 1)]
+    names = column(atoms, 's_m_pdb_atom_name', '')
+    # atom names without a PDB name fall back to the element, aligned as in column 13-14
+    blank = np.char.strip(names) == ''
+    names = np.where(blank, np.char.add(np.where(np.char.str_len(elements) == 1, ' ', ''), elements), names)
+    names = np.char.ljust(names.astype(str), 4)
+    residues = np.char.strip(column(atoms, 's_m_pdb_residue_name', 'UNK').astype(str))
+    residues = np.where(residues == '', 'UNK', residues)
+    # three-letter names sit in columns 18-20; four-letter names spill into column 21
+    residues = np.where(np.char.str_len(residues) <= 3, np.char.add(np.char.rjust(residues, 3), ' '),
+                        np.char.ljust(residues, 4))
+    records = np.where(np.isin(np.char.strip(residues), list(POLYMER)), 'ATOM  ', 'HETATM')
+    chains = np.char.ljust(column(atoms, 's_m_chain_name', ' ').astype(str), 1)
+    resnums = np.nan_to_num(column(atoms, 'i_m_residue_number', 1), nan=1).astype(np.int64)
+    icodes = np.char.ljust(column(atoms, 's_m_insertion_code', ' ').astype(str), 1)
+    occupancy = np.nan_to_num(column(atoms, 'r_m_pdb_occupancy', 1.0), nan=1.0)
+    tfactor = np.nan_to_num(column(atoms, 'r_m_pdb_tfactor', 0.0))
+    charges = np.nan_to_num(column(atoms, 'i_m_formal_charge', 0)).astype(np.int64)
+    charge = np.where(charges == 0, '  ', np.char.add(fmt('%d', np.abs(charges)), np.where(charges > 0, '+', '-')))
+    parts = [records, fmt('%5d', np.arange(1, n + 1)), ' ', names, ' ', residues, chains, fmt('%4d', resnums % 10000),
+             icodes, '   ', fmt('%8.3f', atoms['r_m_x_coord']), fmt('%8.3f', atoms['r_m_y_coord']),
+             fmt('%8.3f', atoms['r_m_z_coord']), fmt('%6.2f', occupancy), fmt('%6.2f', tfactor), '          ',
+             np.char.rjust(np.char.upper(elements), 2), charge]
+    lines = parts[0]
+    for part in parts[1:]:
+        lines = np.char.add(lines, part)
+    return lines, records == 'HETATM'
+
+
+def conect_records(structure, het):
+    bonds = structure.bonds
+    if bonds is None or len(bonds) == 0:
+        return []
+    a = bonds['i_m_from'].astype(np.int64)
+    b = bonds['i_m_to'].astype(np.int64)
+    # both directions, restricted to bonds that touch a HETATM
+    pairs = np.concatenate([np.column_stack([a, b]), np.column_stack([b, a])])
+    pairs = pairs[het[pairs[:, 0] - 1]]
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    lines = []
+    for atom in np.unique(pairs[:, 0]):
+        partners = pairs[pairs[:, 0] == atom, 1]
+        for i in range(0, len(partners), 4):
+            lines.append('CONECT{:5d}'.format(atom) + ''.join('{:5d}'.format(p) for p in partners[i:i+4]))
+    return lines
+
+
+def native_mae2pdb(mae, pdb):
+    structures = MAE(mae).structures()
+    structure = next(structures, None)
+    if structure is None:
+        raise ValueError('{}: no structures'.format(mae))
+    if next(structures, None) is not None:
+        raise ValueError('{}: multi-structure files are left to pdbconvert'.format(mae))
+    lines, het = atom_records(structure)
+    with open(pdb, 'w') as f:
+        if structure.title:
+            f.write('TITLE     {}\n'.format(structure.title))
+        f.write('\n'.join(lines))
+        f.write('\n')
+        for line in conect_records(structure, het):
+            f.write(line + '\n')
+        f.write('END\n')
+    return pdb
+
+
+def schrodinger_environ(schrodinger=None):
+    environ = os.environ.copy()
+    schrodinger = schrodinger if schrodinger is not None else environ.get('SCHRODINGER')
+    if schrodinger is not None:
+        pathlist = [schrodinger]
+        program_dirs = ['unxutils', 'utilities', 'tools']
+        for program_dir in program_dirs:
+            pathlist.append(os.path.join(schrodinger, program_dir))
+        environ['PATH'] += os.pathsep + os.pathsep.join(pathlist)
+    return environ
+
+
+def pdbconvert(mae, pdb, schrodinger=None):
+    cmd = ['pdbconvert', '-noindex', '-imae', mae, '-opdb', pdb]
+    process = subprocess.Popen(cmd, shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               env=schrodinger_environ(schrodinger))
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError('pdbconvert failed on {}: {}'.format(mae, stderr.decode().strip()))
+    return pdb
+
+
+def mae2pdb(mae, pdb, schrodinger=None, native=True):
+    if native:
+        try:
+            return native_mae2pdb(mae, pdb)
+        except (ValueError, KeyError) as e:
+            print('{}; falling back to pdbconvert'.format(e))
+    return pdbconvert(mae, pdb, schrodinger)
+
+
+def mae2pdb_batch(pairs, nt=4, schrodinger=None, native=True):
+    # at most nt conversions run at once, and all of them have finished on return
+    pairs = list(pairs)
+    if nt <= 1 or len(pairs) <= 1:
+        return [mae2pdb(mae, pdb, schrodinger, native) for (mae, pdb) in pairs]
+    with ProcessPoolExecutor(max_workers=nt) as pool:
+        futures = [pool.submit(mae2pdb, mae, pdb, schrodinger, native) for (mae, pdb) in pairs]
+        return [future.result() for future in futures]
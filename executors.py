@@ -0,0 +1,300 @@
+import os
+import re
+import time
+import shlex
+import asyncio
+import subprocess
+
+from maestrowrapper.jobs import AsyncJobHandle, log_tail
+from maestrowrapper.capture import JobLog, JobFailed, last_activity, schrodinger_status, jobcontrol, job_exit_status
+
+
+HOST = re.compile(r'-HOST\s+(\S+)')
+
+
+def job_slots(cmd):
+    # -HOST host:N asks job control for N processors; a command without it uses one
+    match = HOST.search(cmd)
+    if match and ':' in match.group(1):
+        try:
+            return int(match.group(1).rsplit(':', 1)[1])
+        except ValueError:
+            pass
+    return 1
+
+
+def requested_slots(job):
+    # a tuner's choice wins over what the command asks for
+    return job.slots if getattr(job, 'slots', None) else job_slots(job.cmd)
+
+
+def with_host(cmd, host, slots):
+    # only commands already under job control get a host; the rest run where they are launched
+    return HOST.sub('-HOST {}:{}'.format(host, slots), cmd, count=1)
+
+
+def exit_status(returncode, log, tmpdir):
+    # the launcher's exit code, else what it printed, else what the job wrote to its own .log;
+    # returns the status and the lines that explain it
+    status = returncode or log.status()
+    if status:
+        return status, log.tail()
+    text = log_tail(tmpdir)
+    status = schrodinger_status(text) if text is not None else None
+    if status:
+        return status, text.splitlines()[-log.lines.maxlen:]
+    return 0, []
+
+
+async def job_status(job_id, env=None, timeout=30):
+    # how job control recorded the job ending, or None where it cannot be asked
+    try:
+        process = await asyncio.create_subprocess_exec(jobcontrol(env), '-dump', job_id, stdin=subprocess.DEVNULL,
+                                                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env)
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    return job_exit_status(stdout.decode(errors='replace')) if process.returncode == 0 else None
+
+
+class Executor:
+    # runs one job in its tmpdir and returns (output, b'') once it has finished, where output is the last
+    # lines the job printed; everything it printed is in a rotating log under .logs beside the tmpdir.
+    # a job that fails, or shows no sign of life for hang_timeout seconds, raises capture.JobFailed.
+
+    def __init__(self, poll=0.05, launch_timeout=30, hang_timeout=None, log_bytes=1 << 20, tail=40):
+        self.poll = poll
+        self.launch_timeout = launch_timeout
+        self.hang_timeout = hang_timeout
+        self.log_bytes = log_bytes
+        self.tail = tail
+        self._loop = None
+        self._changed = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_loop'] = None
+        state['_changed'] = None
+        return state
+
+    def condition(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    @property
+    def slots(self):
+        return None
+
+    def job_log(self, job):
+        log = JobLog.for_job(job, max_bytes=self.log_bytes, tail=self.tail)
+        job.log = log.path
+        return log
+
+    async def launch(self, job, cmd, env, computer):
+        log = self.job_log(job)
+        handle = await AsyncJobHandle(cmd, job.tmpdir, env=env, computer=computer, poll=self.poll,
+                                      launch_timeout=self.launch_timeout, log=log,
+                                      hang_timeout=self.hang_timeout).start()
+        try:
+            await handle.wait()
+        finally:
+            handle.cancel()
+            log.close()
+        # launch is until job control has the job (or the launcher returns), run is the rest
+        launched = handle.seen or handle.exited or handle.finished
+        job.timings['launch'] = launched - handle.started
+        job.timings['run'] = handle.finished - launched
+        if handle.hung:
+            await handle.kill()
+            raise JobFailed('{} on {} hung: no output for {} s, killed'.format(cmd, job.host, self.hang_timeout),
+                            log.tail(), log.path)
+        status, lines = exit_status(handle.returncode, log, handle.cwd)
+        if status == 0 and log.job_id is not None:
+            # the launcher returns once job control has the job; job control knows how it ended
+            status = await job_status(log.job_id, env) or 0
+            lines = log.tail() if status else lines
+        if status != 0:
+            raise JobFailed('{} exited with {} on {}'.format(cmd, status, job.host), lines, log.path)
+        return log.text().encode(), b''
+
+    async def run(self, job, env=None, computer=None):
+        # the command as it is, launched from here; LocalExecutor and HostExecutor choose its -HOST
+        job.host = 'localhost'
+        return await self.launch(job, job.cmd, env, computer)
+
+
+class LocalExecutor(Executor):
+
+    def __init__(self, host='localhost', poll=0.05, launch_timeout=30, hang_timeout=None, log_bytes=1 << 20, tail=40):
+        super().__init__(poll, launch_timeout, hang_timeout, log_bytes, tail)
+        self.host = host
+
+    async def run(self, job, env=None, computer=None):
+        job.host = self.host
+        return await self.launch(job, with_host(job.cmd, self.host, requested_slots(job)), env, computer)
+
+
+class HostExecutor(LocalExecutor):
+    # spreads job control jobs over several machines: hosts maps host name -> processor slots.
+    # a job waits until some host has as many free slots as it asks for, and the least loaded one is used
+
+    def __init__(self, hosts, poll=0.05, launch_timeout=30, hang_timeout=None, log_bytes=1 << 20, tail=40):
+        super().__init__(None, poll, launch_timeout, hang_timeout, log_bytes, tail)
+        self.hosts = dict(hosts)
+        self.used = {host: 0 for host in self.hosts}
+
+    @property
+    def slots(self):
+        return sum(self.hosts.values())
+
+    def pick(self, slots):
+        # a job bigger than any host gets the biggest host to itself
+        slots = min(slots, max(self.hosts.values()))
+        free = [(self.hosts[host] - self.used[host], host) for host in self.hosts
+                if self.hosts[host] - self.used[host] >= slots]
+        if not free:
+            return None, slots
+        return max(free)[1], slots
+
+    async def run(self, job, env=None, computer=None):
+        changed = self.condition()
+        start = time.time()
+        async with changed:
+            while True:
+                host, slots = self.pick(requested_slots(job))
+                if host is not None:
+                    break
+                await changed.wait()
+            self.used[host] += slots
+        job.timings['host_wait'] = time.time() - start
+        job.host = host
+        try:
+            return await self.launch(job, with_host(job.cmd, host, slots), env, computer)
+        finally:
+            async with changed:
+                self.used[host] -= slots
+                changed.notify_all()
+
+
+class BatchExecutor(Executor):
+    # submits each job as a script to a batch queue and polls until it leaves the queue. the tmpdir has to be
+    # on a filesystem the compute nodes share; job control commands run with -WAIT so the batch job lasts
+    # as long as the Schrodinger job does. submit and poll are argument lists where {script}, {name},
+    # {cwd} and {id} are filled in; the job id is the first number printed by submit
+
+    SCRIPT = 'batch_job.sh'
+    STATUS = 'batch_job.status'
+
+    def __init__(self, submit=('sbatch', '--parsable', '--job-name={name}', '{script}'),
+                 poll_cmd=('squeue', '-h', '-j', '{id}', '-o', '%i'), cancel=('scancel', '{id}'),
+                 interval=10, host='localhost', shell='/bin/sh', prologue=(), hang_timeout=None, tail=40):
+        super().__init__(hang_timeout=hang_timeout, tail=tail)
+        self.submit = list(submit)
+        self.poll_cmd = list(poll_cmd)
+        self.cancel = list(cancel) if cancel is not None else None
+        self.interval = interval
+        self.host = host
+        self.shell = shell
+        # lines run before the command, e.g. module loads or exporting SCHRODINGER
+        self.prologue = list(prologue)
+        self.submitted = 0
+        self.polls = 0
+
+    @classmethod
+    def background(cls, interval=0.2):
+        # the shell as a stand-in batch system, for trying the backend out without a queue
+        return cls(submit=('sh', '-c', 'nohup sh "$0" > /dev/null 2>&1 & echo $!', '{script}'),
+                   # a finished job whose zombie nobody has reaped yet counts as gone
+                   poll_cmd=('sh', '-c', 'ps -o stat= -p "$0" | grep -qv Z && echo "$0"', '{id}'),
+                   cancel=('kill', '{id}'), interval=interval)
+
+    @staticmethod
+    def fill(args, **values):
+        return [arg.format(**values) for arg in args]
+
+    def script(self, job, env, log):
+        cmd = with_host(job.cmd, self.host, requested_slots(job))
+        if HOST.search(cmd) and '-WAIT' not in cmd.split():
+            cmd += ' -WAIT'
+        lines = ['#!{}'.format(self.shell), 'cd {}'.format(shlex.quote(os.path.abspath(job.tmpdir)))]
+        if env is not None and 'PATH' in env:
+            lines.append('export PATH={}'.format(shlex.quote(env['PATH'])))
+        lines += self.prologue
+        lines += ['mkdir -p {}'.format(shlex.quote(os.path.dirname(log.path))),
+                  '{} > {} 2>&1'.format(cmd, shlex.quote(log.path)), 'echo $? > {}'.format(self.STATUS)]
+        path = os.path.join(os.path.abspath(job.tmpdir), self.SCRIPT)
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.chmod(path, 0o755)
+        return path
+
+    async def call(self, args):
+        process = await asyncio.create_subprocess_exec(*args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = await process.communicate()
+        return process.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+
+    async def queued(self, batch_id):
+        self.polls += 1
+        returncode, stdout, _ = await self.call(self.fill(self.poll_cmd, id=batch_id))
+        return returncode == 0 and batch_id in stdout.split()
+
+    async def run(self, job, env=None, computer=None):
+        tmpdir = os.path.abspath(job.tmpdir)
+        log = self.job_log(job)
+        script = self.script(job, env, log)
+        name = '{}_{}'.format(os.path.basename(tmpdir), job.job_id)
+        start = time.time()
+        returncode, stdout, stderr = await self.call(self.fill(self.submit, script=script, name=name, cwd=tmpdir))
+        match = re.search(r'\d+', stdout)
+        if returncode != 0 or match is None:
+            raise RuntimeError('submitting {} failed: {}'.format(job.cmd, (stderr or stdout).strip()))
+        batch_id = match.group(0)
+        job.host = 'batch:{}'.format(batch_id)
+        self.submitted += 1
+        submitted = time.time()
+        job.timings['launch'] = submitted - start
+        try:
+            while await self.queued(batch_id):
+                await asyncio.sleep(self.interval)
+                if self.hang_timeout is not None and self.quiet(tmpdir, log) > self.hang_timeout:
+                    if self.cancel is not None:
+                        await self.call(self.fill(self.cancel, id=batch_id))
+                    log.load()
+                    raise JobFailed('{} on {} hung: no output for {} s'.format(job.cmd, job.host, self.hang_timeout),
+                                    log.tail(), log.path)
+        except asyncio.CancelledError:
+            if self.cancel is not None:
+                await self.call(self.fill(self.cancel, id=batch_id))
+            raise
+        # the queue may drop the job a moment before the status file shows up on a network filesystem
+        status_file = os.path.join(tmpdir, self.STATUS)
+        deadline = time.time() + 30
+        while not os.path.isfile(status_file) and time.time() < deadline:
+            await asyncio.sleep(min(self.interval, 1))
+        # time in the queue counts as run time; the queue does not say when the job started
+        job.timings['run'] = time.time() - submitted
+        log.load()
+        status = None
+        if os.path.isfile(status_file):
+            with open(status_file, 'r') as f:
+                status = f.read().strip()
+        for file in (self.SCRIPT, self.STATUS):
+            if os.path.isfile(os.path.join(tmpdir, file)):
+                os.remove(os.path.join(tmpdir, file))
+        if status is None or not status.lstrip('-').isdigit():
+            raise JobFailed('{} on {} left no exit status'.format(job.cmd, job.host), log.tail(), log.path)
+        status, lines = exit_status(int(status), log, tmpdir)
+        if status != 0:
+            raise JobFailed('{} exited with {} on {}'.format(job.cmd, status, job.host), lines, log.path)
+        return log.text().encode(), b''
+
+    @staticmethod
+    def quiet(tmpdir, log):
+        # seconds since the job last wrote to its directory or its log. the log appears when the batch job
+        # starts, so time spent waiting in the queue never counts
+        if not os.path.isfile(log.path):
+            return 0
+        return time.time() - max(last_activity(tmpdir), os.path.getmtime(log.path))
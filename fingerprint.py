@@ -0,0 +1,217 @@
+import os
+import csv
+import json
+import struct
+import numpy as np
+
+from maestrowrapper import similarity
+from maestrowrapper.plugins import JobType
+from maestrowrapper.scheduler import Job
+
+
+def read_csv(file):
+    # interaction_fingerprints.py writes a title column, then one 0/1 column per residue interaction
+    with open(file, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return [], [], []
+        titles = []
+        rows = []
+        for row in reader:
+            if not row:
+                continue
+            titles.append(row[0])
+            rows.append([n for (n, value) in enumerate(row[1:]) if value.strip() not in ('', '0', '0.0')])
+    return header[1:], titles, rows
+
+
+def words(nbits):
+    return (nbits + 63) // 64
+
+
+def pack(bits):
+    # bits is (rows, nbits) of 0/1; bit j of a row lives in word j // 64 at position j % 64
+    bits = np.asarray(bits, dtype=bool)
+    n, nbits = bits.shape
+    padded = np.zeros((n, words(nbits) * 64), dtype=bool)
+    padded[:, :nbits] = bits
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8')
+
+
+def unpack(packed, nbits):
+    packed = np.ascontiguousarray(packed, dtype='<u8')
+    return np.unpackbits(packed.view(np.uint8), axis=1, bitorder='little')[:, :nbits].astype(bool)
+
+
+class FingerprintMatrix:
+
+    MAGIC = b'MAEFPM1\n'
+    HEAD = struct.Struct('<qq')
+    ALIGN = 64
+
+    def __init__(self, titles, labels, packed):
+        self.titles = list(titles)
+        self.labels = list(labels)
+        self.packed = packed
+
+    def __len__(self):
+        return len(self.titles)
+
+    @property
+    def shape(self):
+        return len(self.titles), len(self.labels)
+
+    def bits(self, rows=None):
+        packed = self.packed if rows is None else self.packed[rows]
+        return unpack(packed, len(self.labels))
+
+    def row(self, title):
+        return self.titles.index(title)
+
+    def column(self, label):
+        n = self.labels.index(label)
+        return (self.packed[:, n // 64] >> np.uint64(n % 64)) & np.uint64(1)
+
+    def counts(self):
+        # how many poses make each interaction
+        return self.bits().sum(axis=0)
+
+    def query(self, reference):
+        # a title, a row number or an already packed fingerprint
+        if isinstance(reference, str):
+            return self.packed[self.row(reference)]
+        if isinstance(reference, (int, np.integer)):
+            return self.packed[reference]
+        return np.asarray(reference, dtype='<u8')
+
+    def search(self, reference, k=10, metric='tanimoto', alpha=1.0, beta=1.0):
+        rows, sims = similarity.top_k(self.query(reference), self.packed, k, metric, alpha, beta)
+        return [(self.titles[row], float(sim)) for (row, sim) in zip(rows, sims)]
+
+    def cluster(self, threshold=0.7, metric='tanimoto', alpha=1.0, beta=1.0):
+        # {leader title: [member titles]}
+        labels, leaders = similarity.leader_cluster(self.packed, threshold, metric=metric, alpha=alpha, beta=beta)
+        clusters = {self.titles[leader]: [] for leader in leaders}
+        for row, label in enumerate(labels):
+            clusters[self.titles[leaders[label]]].append(self.titles[row])
+        return clusters
+
+    def frame(self):
+        import pandas as pd
+        return pd.DataFrame(self.bits().astype(np.uint8), index=self.titles, columns=self.labels)
+
+    def save(self, file):
+        # magic, header length and data offset, json header, then the packed rows aligned for np.memmap
+        header = json.dumps({'titles': self.titles, 'labels': self.labels,
+                             'shape': [len(self.titles), self.packed.shape[1] if self.packed.ndim == 2 else 0]}).encode()
+        start = len(self.MAGIC) + self.HEAD.size + len(header)
+        offset = (start + self.ALIGN - 1) // self.ALIGN * self.ALIGN
+        with open(file, 'wb') as f:
+            f.write(self.MAGIC)
+            f.write(self.HEAD.pack(len(header), offset))
+            f.write(header)
+            f.write(b'\0' * (offset - start))
+            f.write(np.ascontiguousarray(self.packed, dtype='<u8').tobytes())
+        return file
+
+    @classmethod
+    def load(cls, file, mmap=True):
+        with open(file, 'rb') as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError('{} is not a fingerprint matrix'.format(file))
+            length, offset = cls.HEAD.unpack(f.read(cls.HEAD.size))
+            header = json.loads(f.read(length).decode())
+        shape = tuple(header['shape'])
+        if mmap and shape[0] * shape[1] > 0:
+            packed = np.memmap(file, dtype='<u8', mode='r', offset=offset, shape=shape)
+        else:
+            packed = np.fromfile(file, dtype='<u8', offset=offset).reshape(shape)
+        return cls(header['titles'], header['labels'], packed)
+
+
+class FingerprintBuilder:
+    # rows are kept as column indices until the full label set is known
+
+    def __init__(self):
+        self.titles = []
+        self.labels = []
+        self._columns = {}
+        self._rows = []
+
+    def __len__(self):
+        return len(self.titles)
+
+    def add(self, labels, titles, rows):
+        mapping = np.array([self._label(label) for label in labels], dtype=np.int64)
+        for title, row in zip(titles, rows):
+            self.titles.append(title)
+            self._rows.append(mapping[row] if len(row) else np.zeros(0, dtype=np.int64))
+
+    def add_csv(self, file, title=None):
+        labels, titles, rows = read_csv(file)
+        if title is not None:
+            titles = [title] * len(titles) if len(titles) == 1 else ['{}_{}'.format(title, n + 1) for n in range(len(titles))]
+        self.add(labels, titles, rows)
+        return len(titles)
+
+    def _label(self, label):
+        if label not in self._columns:
+            self._columns[label] = len(self.labels)
+            self.labels.append(label)
+        return self._columns[label]
+
+    def build(self):
+        packed = np.zeros((len(self.titles), words(len(self.labels))), dtype='<u8')
+        for n, row in enumerate(self._rows):
+            if len(row):
+                np.bitwise_or.at(packed[n], row // 64, np.left_shift(np.uint64(1), (row % 64).astype(np.uint64)))
+        return FingerprintMatrix(self.titles, self.labels, packed)
+
+
+class InteractionFingerprints(JobType):
+    # interaction_fingerprints.py over every pose; each csv is folded into one FingerprintMatrix as its
+    # job lands, and the matrix is saved to output in the fingerprint directory
+
+    name = 'fingerprint'
+    foreground = True
+    SUFFIX = '_fingerprint.csv'
+
+    def __init__(self, output='fingerprints.fpm'):
+        self.output = output
+        self.builder = FingerprintBuilder()
+        self.read = set()
+
+    def jobs(self, mw, path):
+        return [self.file_job(mw, path, job_index, os.path.join(mw.path, file)) for (job_index, file) in enumerate(mw.files)]
+
+    def file_job(self, mw, path, job_index, file):
+        base, _ = os.path.splitext(os.path.basename(file))
+        out = '{}{}'.format(base, self.SUFFIX)
+        cmd = 'run interaction_fingerprints.py -i {} -ocsv {}'.format(os.path.basename(file), out)
+        tmpdir = os.path.join(path, 'fingerprint{}'.format(job_index))
+        return Job(job_index, cmd, files=[file], tmpdir=tmpdir)
+
+    def collect(self, mw, path, job):
+        # the staged input is dropped rather than collected
+        tmpdir = os.path.abspath(job.tmpdir)
+        for file in job.files:
+            staged = os.path.join(tmpdir, os.path.basename(file))
+            if os.path.isfile(staged):
+                os.remove(staged)
+        outputs = mw.collect(job, path)
+        for output in outputs:
+            if output.endswith(self.SUFFIX):
+                self.builder.add_csv(output, title=os.path.basename(output)[:-len(self.SUFFIX)])
+                self.read.add(output)
+        return outputs
+
+    def finish(self, mw, path):
+        # jobs collected by an earlier, interrupted run are read back from their csvs
+        for file in sorted(os.listdir(path)):
+            if file.endswith(self.SUFFIX) and os.path.join(path, file) not in self.read:
+                self.builder.add_csv(os.path.join(path, file), title=file[:-len(self.SUFFIX)])
+        matrix = self.builder.build()
+        matrix.save(os.path.join(path, self.output))
+        print('fingerprint: {} poses x {} interactions written to {}'.format(len(matrix), len(matrix.labels), self.output))
+        return FingerprintMatrix.load(os.path.join(path, self.output))
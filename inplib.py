@@ -1,10 +1,33 @@
+# INP file templates by job name. a template is only built when asked for; new job types add theirs with
+# @template('name')
+TEMPLATES = {}
+
+
+def template(job_name):
+    def register(func):
+        TEMPLATES[job_name] = func
+        return func
+    return register
+
+
 def get(job_name, mae):
-    lib = {
-        'primeMMGBSA':primeMMGBSA(mae)
-    }
-    return lib[job_name]
+    if job_name not in TEMPLATES:
+        raise KeyError('no INP template for {!r}'.format(job_name))
+    return TEMPLATES[job_name](mae)
+
+
+def text(inp, **kwargs):
+    return ''.join(inp) + ''.join(f'{k.upper()} {v} \n' for (k, v) in kwargs.items())
+
+
+def write(inp, out, **kwargs):
+    f = open(out, 'w')
+    f.write(text(inp, **kwargs))
+    f.close()
+
 
+@template('primeMMGBSA')
 def primeMMGBSA(mae):
     return [f'STRUCT_FILE	{mae}\n',
             'JOB_TYPE	REAL_MIN\n',
-            'LCONS	SMARTS.C']
\ No newline at end of file
+            'LCONS	SMARTS.C']
@@ -0,0 +1,238 @@
+import os
+import re
+import time
+import asyncio
+import threading
+import subprocess
+
+from maestrowrapper.capture import drain, quiet, jobcontrol, kill_group
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+# last lines of a Schrodinger job log once the job has stopped, whatever the outcome
+LOG_DONE = re.compile(r'(job (finished|completed|failed|died|killed|stopped)|exiting|finished with)', re.IGNORECASE)
+
+
+class _EventHandler(FileSystemEventHandler):
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def on_any_event(self, event):
+        self.callback()
+
+
+_observer = None
+_observer_pid = None
+_observer_lock = threading.Lock()
+
+
+def shared_observer():
+    # one observer serves every watch; inotify instances are a limited per-user resource
+    global _observer, _observer_pid
+    with _observer_lock:
+        # a forked worker inherits the object but not the thread behind it
+        if _observer is None or _observer_pid != os.getpid():
+            _observer_pid = os.getpid()
+            _observer = Observer()
+            _observer.daemon = True
+            _observer.start()
+        return _observer
+
+
+class DirectoryWatch:
+
+    def __init__(self, path, callback, poll=0.05, thread=True):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.poll = poll
+        self.thread = thread
+        self.watch = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def interval(self):
+        # the poller is the only notifier without watchdog, and a slow safety net with it
+        return self.poll if self.watch is None else 1.0
+
+    def start(self):
+        if Observer is not None:
+            try:
+                self.watch = shared_observer().schedule(_EventHandler(self.callback), self.path, recursive=False)
+            except OSError:
+                # each watch costs an inotify instance, and there are only so many per user; past that, poll
+                self.watch = None
+        # an event loop polls for itself rather than through a thread per watch
+        if self.thread:
+            self._thread = threading.Thread(target=self._run, args=(self.interval,), daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.callback()
+
+    def stop(self):
+        self._stop.set()
+        if self.watch is not None:
+            watch, self.watch = self.watch, None
+            observer = shared_observer()
+            if threading.current_thread() is observer:
+                # unscheduling from inside an event callback would wait on the dispatcher itself
+                threading.Thread(target=observer.unschedule, args=(watch,), daemon=True).start()
+            else:
+                observer.unschedule(watch)
+
+
+def has_lock(path, computer):
+    prefix = '.{}'.format(computer)
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith(prefix):
+                return True
+    return False
+
+
+def log_tail(path, tail=4096):
+    # the end of the newest .log in path, or None without one
+    logs = [entry for entry in os.scandir(path) if entry.name.endswith('.log') and entry.is_file()]
+    if not logs:
+        return None
+    log = max(logs, key=lambda entry: entry.stat().st_mtime)
+    with open(log.path, 'rb') as f:
+        f.seek(max(log.stat().st_size - tail, 0))
+        return f.read().decode(errors='replace')
+
+
+def log_finished(path, tail=4096):
+    text = log_tail(path, tail)
+    return text is not None and LOG_DONE.search(text) is not None
+
+
+class AsyncJobHandle:
+    # a job-control job launched under asyncio; completion is an asyncio.Event
+
+    def __init__(self, cmd, cwd, env=None, computer=None, poll=0.05, launch_timeout=30, log=None, hang_timeout=None):
+        self.cmd = cmd.split() if isinstance(cmd, str) else list(cmd)
+        self.cwd = os.path.abspath(cwd)
+        self.env = env
+        self.computer = computer if computer is not None else os.environ.get('COMPUTERNAME', '')
+        self.poll = poll
+        self.launch_timeout = launch_timeout
+        self.log = log
+        self.hang_timeout = hang_timeout
+        self.hung = False
+        self.process = None
+        self.launched = False
+        # when the job was first seen running under job control
+        self.seen = None
+        self.exited = None
+        self.started = None
+        self.finished = None
+        self.done = None
+        self._loop = None
+        self._watch = None
+        self._tasks = []
+
+    @property
+    def returncode(self):
+        return None if self.process is None else self.process.returncode
+
+    async def start(self):
+        self.started = time.time()
+        self._loop = asyncio.get_running_loop()
+        self.done = asyncio.Event()
+        # watchdog calls back on its own thread, so checks are handed to the loop
+        self._watch = DirectoryWatch(self.cwd, self._notify, poll=self.poll, thread=False).start()
+        self.process = await asyncio.create_subprocess_exec(
+            *self.cmd, stdin=subprocess.DEVNULL, stderr=subprocess.STDOUT,
+            stdout=subprocess.PIPE if self.log is not None else subprocess.DEVNULL, env=self.env, cwd=self.cwd,
+            start_new_session=True)
+        self._tasks = [asyncio.ensure_future(self._wait_process()), asyncio.ensure_future(self._poll())]
+        return self
+
+    def _notify(self):
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.check)
+
+    async def _wait_process(self):
+        if self.log is not None:
+            await drain(self.process.stdout, self.log)
+            self.log.close()
+        await self.process.wait()
+        self.exited = time.time()
+        self.check()
+
+    async def _poll(self):
+        while not self.done.is_set():
+            await asyncio.sleep(self._watch.interval)
+            self.check()
+
+    def check(self):
+        if self.done.is_set():
+            return
+        if has_lock(self.cwd, self.computer):
+            if not self.launched:
+                self.seen = time.time()
+            self.launched = True
+            # only a job job control has taken can hang; until then launch_timeout applies
+            if self.hang_timeout is not None and quiet(self.started, self.cwd, self.log) > self.hang_timeout:
+                self.hung = True
+                self.finished = time.time()
+                self._watch.stop()
+                self.done.set()
+            return
+        if self.exited is None:
+            return
+        if (self.launched or self.process.returncode != 0 or log_finished(self.cwd)
+                or time.time() - self.exited > self.launch_timeout):
+            self.finished = time.time()
+            self._watch.stop()
+            self.done.set()
+
+    async def wait(self, timeout=None):
+        try:
+            await asyncio.wait_for(self.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def kill(self, timeout=30):
+        # a hung job still holds its licence tokens, so it is stopped before they are handed back: through job
+        # control when the launcher printed a JobId, and by signalling the launcher's process group either way
+        job_id = self.log.job_id if self.log is not None else None
+        if job_id is not None:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    jobcontrol(self.env), '-kill', job_id, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL, env=self.env, cwd=self.cwd)
+                await asyncio.wait_for(process.wait(), timeout)
+            except (OSError, asyncio.TimeoutError):
+                pass
+        kill_group(self.process)
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._watch is not None:
+            self._watch.stop()
+
+
+def wait_unlocked(path, computer, poll=0.05):
+    unlocked = threading.Event()
+
+    def check():
+        if not has_lock(path, computer):
+            unlocked.set()
+
+    watch = DirectoryWatch(path, check, poll=poll).start()
+    check()
+    unlocked.wait()
+    watch.stop()
@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import sqlite3
+
+
+STATES = ('queued', 'running', 'done', 'failed', 'cached', 'collected')
+
+
+class Journal:
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                stage TEXT, cmd TEXT, job_id INTEGER, tmpdir TEXT, state TEXT, status TEXT,
+                queued REAL, started REAL, finished REAL, collected REAL, worker INTEGER, outputs TEXT,
+                PRIMARY KEY (stage, cmd))''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS events (
+                stage TEXT, cmd TEXT, state TEXT, time REAL)''')
+
+    @classmethod
+    def for_stage(cls, path):
+        return cls(os.path.join(path, '.journal.sqlite'))
+
+    def close(self):
+        self.conn.close()
+
+    def queue(self, stage, jobs):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany('''INSERT INTO jobs (stage, cmd, job_id, tmpdir, state, queued)
+                VALUES (?, ?, ?, ?, 'queued', ?)
+                ON CONFLICT (stage, cmd) DO UPDATE SET job_id = excluded.job_id, tmpdir = excluded.tmpdir,
+                state = 'queued', status = NULL, queued = excluded.queued, started = NULL, finished = NULL,
+                collected = NULL, outputs = NULL''',
+                [(stage, job.cmd, job.job_id, job.tmpdir, now) for job in jobs])
+            self.conn.executemany('INSERT INTO events VALUES (?, ?, ?, ?)',
+                                  [(stage, job.cmd, 'queued', now) for job in jobs])
+
+    def record(self, stage, job, state, t=None, worker=None, status=None, outputs=None):
+        t = time.time() if t is None else t
+        column = {'running': 'started', 'done': 'finished', 'failed': 'finished',
+                  'cached': 'finished', 'collected': 'collected'}[state]
+        updates = ['state = ?', '{} = ?'.format(column)]
+        params = [state, t]
+        if worker is not None:
+            updates.append('worker = ?')
+            params.append(worker)
+        if status is not None:
+            updates.append('status = ?')
+            params.append(str(status))
+        if outputs is not None:
+            updates.append('outputs = ?')
+            params.append(json.dumps(outputs))
+        with self.conn:
+            self.conn.execute('UPDATE jobs SET {} WHERE stage = ? AND cmd = ?'.format(', '.join(updates)),
+                              params + [stage, job.cmd])
+            self.conn.execute('INSERT INTO events VALUES (?, ?, ?, ?)', (stage, job.cmd, state, t))
+
+    def states(self, stage):
+        rows = self.conn.execute('SELECT cmd, state, tmpdir FROM jobs WHERE stage = ?', (stage,)).fetchall()
+        return {cmd: (state, tmpdir) for (cmd, state, tmpdir) in rows}
+
+    def outputs(self, stage, cmd):
+        row = self.conn.execute('SELECT outputs FROM jobs WHERE stage = ? AND cmd = ?', (stage, cmd)).fetchone()
+        return json.loads(row[0]) if row is not None and row[0] else []
+
+    def next_id(self, stage):
+        row = self.conn.execute('SELECT MAX(job_id) FROM jobs WHERE stage = ?', (stage,)).fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def jobs(self, stage=None, state=None):
+        query = 'SELECT stage, cmd, job_id, tmpdir, state, status, queued, started, finished, collected, worker, outputs FROM jobs WHERE 1 = 1'
+        params = []
+        if stage is not None:
+            query += ' AND stage = ?'
+            params.append(stage)
+        if state is not None:
+            query += ' AND state = ?'
+            params.append(state)
+        keys = ('stage', 'cmd', 'job_id', 'tmpdir', 'state', 'status', 'queued', 'started', 'finished',
+                'collected', 'worker', 'outputs')
+        rows = [dict(zip(keys, row)) for row in self.conn.execute(query, params).fetchall()]
+        for row in rows:
+            row['outputs'] = json.loads(row['outputs']) if row['outputs'] else []
+        return rows
+
+    def summary(self, stage=None):
+        query = 'SELECT state, COUNT(*) FROM jobs'
+        params = ()
+        if stage is not None:
+            query += ' WHERE stage = ?'
+            params = (stage,)
+        return dict(self.conn.execute(query + ' GROUP BY state', params).fetchall())
@@ -0,0 +1,167 @@
+import os
+import time
+import itertools
+import threading
+import subprocess
+
+
+def parse_licadmin(text):
+    stats = {}
+    for line in text.split('\n'):
+        if line.startswith('Users'):
+            lic = line.split(':')[0].split()[-1].upper()
+            issued = int(line.split(';')[0].split('of')[-1].strip().split()[0])
+            inuse = int(line.split(';')[-1].split('of')[-1].strip().split()[0])
+            stats[lic] = (issued, inuse)
+    return stats
+
+
+class LicenseBroker:
+
+    def __init__(self, environ=None, lics_per_job=None, ttl=10, headroom=1, cmd=('licadmin', 'stat')):
+        self.environ = environ if environ is not None else os.environ.copy()
+        self.lics_per_job = dict(lics_per_job) if lics_per_job is not None else {}
+        self.ttl = ttl
+        self.headroom = headroom
+        self.cmd = list(cmd)
+        self.calls = 0
+        self.poll_time = 0.0
+        self._init_state()
+
+    def _init_state(self):
+        self._cond = threading.Condition()
+        # one licadmin call at a time; the others wait for its result here rather than on _cond
+        self._polling = threading.Lock()
+        self._stats = {}
+        self._polled = None
+        self._reservations = {}
+        self._ids = itertools.count(1)
+
+    def __getstate__(self):
+        # locks cannot cross process boundaries; a pickled broker is a fresh copy of the config
+        state = self.__dict__.copy()
+        for key in ('_cond', '_polling', '_stats', '_polled', '_reservations', '_ids'):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
+
+    def poll(self):
+        # licadmin runs outside _cond, so a release never waits for it; only its result is swapped in under it
+        start = time.time()
+        process = subprocess.Popen(self.cmd, shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.environ)
+        stdout, stderr = process.communicate()
+        stats = parse_licadmin(stdout.decode())
+        with self._cond:
+            self.calls += 1
+            self.poll_time += time.time() - start
+            # licadmin only gives totals, so a reservation counts as checked out once the in-use count has risen
+            # by its tokens since the last poll, oldest first. until then it is held on top of what licadmin reports
+            for lic, (issued, inuse) in stats.items():
+                if lic not in self._stats:
+                    continue
+                rise = inuse - self._stats[lic][1]
+                for reservation in self._reservations.values():
+                    if reservation[0] == lic and not reservation[3] and reservation[1] <= rise:
+                        reservation[3] = True
+                        rise -= reservation[1]
+            self._stats = stats
+            self._polled = time.time()
+            self._cond.notify_all()
+            return dict(self._stats)
+
+    def _fresh(self):
+        return self._polled is not None and (time.time() - self._polled) < self.ttl
+
+    def refresh(self, force=False):
+        # polls when the cached state has expired; threads that find a poll running take its result
+        polled = self._polled
+        with self._polling:
+            if (force and self._polled == polled) or not self._fresh():
+                self.poll()
+
+    def stat(self, lic=None, refresh=False):
+        self.refresh(refresh)
+        with self._cond:
+            if lic is None:
+                return dict(self._stats)
+            return self._stats.get(lic.upper())
+
+    def tokens(self, lic):
+        return self.lics_per_job.get(lic.upper(), self.lics_per_job.get(lic, 1))
+
+    def _pending(self, lic):
+        # reservations licadmin has not reported yet: granted, but the job has not checked its tokens out
+        return sum(tokens for (_lic, tokens, _, seen) in self._reservations.values() if _lic == lic and not seen)
+
+    def _free(self, lic):
+        if lic not in self._stats:
+            return None
+        issued, inuse = self._stats[lic]
+        return issued - inuse - self._pending(lic)
+
+    def free(self, lic):
+        # tokens nobody holds, less the headroom; None for licences licadmin does not report on
+        self.refresh()
+        with self._cond:
+            free = self._free(lic.upper())
+            return None if free is None else max(free - self.headroom, 0)
+
+    def available(self, lic, tokens=None):
+        if lic is None:
+            return True
+        lic = lic.upper()
+        tokens = self.tokens(lic) if tokens is None else tokens
+        self.refresh()
+        with self._cond:
+            free = self._free(lic)
+            # licences licadmin does not report on are not limited
+            return free is None or free - tokens >= self.headroom
+
+    def acquire(self, lic, tokens=None, timeout=None):
+        if lic is None:
+            return None
+        lic = lic.upper()
+        tokens = self.tokens(lic) if tokens is None else tokens
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            self.refresh()
+            with self._cond:
+                free = self._free(lic)
+                if free is None or free - tokens >= self.headroom:
+                    reservation = next(self._ids)
+                    # lic, tokens, when granted, and whether licadmin has reported it in use
+                    self._reservations[reservation] = [lic, tokens, time.time(), False]
+                    return reservation
+                # wake on release, or when the cached licadmin state expires
+                wait = self.ttl - (time.time() - self._polled)
+                if deadline is not None:
+                    wait = min(wait, deadline - time.time())
+                    if wait <= 0:
+                        return None
+                self._cond.wait(max(wait, 0))
+
+    def release(self, reservation):
+        if reservation is None:
+            return
+        with self._cond:
+            lic, tokens, granted, seen = self._reservations.pop(reservation)
+            if lic in self._stats and seen:
+                # licadmin has seen this job, so its tokens are in the cached in-use count. one it never saw
+                # (released before it checked out, or between polls) only stops being pending
+                issued, inuse = self._stats[lic]
+                self._stats[lic] = (issued, max(inuse - tokens, 0))
+            self._cond.notify_all()
+
+    def held(self, lic=None):
+        with self._cond:
+            return sum(tokens for (_lic, tokens, _, _) in self._reservations.values()
+                       if lic is None or _lic == lic.upper())
+
+    def num_calls(self):
+        return self.calls
+
+    def poll_seconds(self):
+        return self.poll_time
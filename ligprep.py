@@ -0,0 +1,46 @@
+import os
+
+from maestrowrapper import batching
+from maestrowrapper.plugins import JobType
+from maestrowrapper.scheduler import Job
+
+
+class LigPrep(JobType):
+
+    name = 'ligprep'
+    lic = 'LIGPREP_MAIN'
+
+    def __init__(self, output_type='sd', options=[], kwarg_options={}, batch_size=1):
+        self.output_type = output_type
+        self.options = options
+        self.kwarg_options = kwarg_options
+        self.batch_size = batch_size
+
+    def jobs(self, mw, path):
+        jobs = [self.batch_job(mw, path, job_index, batch) for (job_index, batch) in enumerate(mw.batches(self.batch_size))]
+        print(jobs[0].cmd)
+        return jobs
+
+    def batch_job(self, mw, path, job_index, batch):
+        tmpdir = os.path.join(path, 'ligprep{}'.format(job_index))
+        file, owners = mw.batch_file(batch, job_index)
+        ext = batching.ext(file)
+        basename = os.path.basename(file)[:-len(ext)]
+        # -imae reads compressed files as well; there is no -imaegz
+        inp_option = '-i{}'.format('mae' if ext in batching.MAE_EXTS else ext[1:])
+        out_option = '-o{}'.format(self.output_type)
+        out_file = '{}{}'.format(basename, '.{}'.format(self.output_type))
+        cmd = f'ligprep -HOST localhost:12 {inp_option} {file} {out_option} {out_file}'
+        for option in self.options:
+            cmd = cmd + ' {}'.format(option)
+        for k, v in self.kwarg_options.items():
+            cmd = cmd + ' {} {}'.format(k, str(v))
+        return Job(job_index, cmd, files=list(batch), tmpdir=tmpdir, lic=self.lic,
+                   batch=(file, out_file, owners) if owners else None,
+                   setup=mw.write_batch(batch, file) if owners else None)
+
+    def file_job(self, mw, path, job_index, file):
+        return self.batch_job(mw, path, job_index, {file: None})
+
+    def collect(self, mw, path, job):
+        return mw.collect_batch(job, path, batching.split_structures, '.{}'.format(self.output_type))
@@ -1,18 +1,420 @@
 import os
+import re
+import sys
+import gzip
+import mmap
+import shutil
+import struct
+from array import array
+from itertools import islice
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[^\s"]+')
+BLOCK_NAME = re.compile(r'^(\w+)(?:\[(\d+)\])?$')
+MISSING = '<>'
+HEADER = b'{\n s_m_m2io_version\n :::\n 2.0.0 \n} \n\n'
+CHUNK = 1 << 22
+
+
+def split(line):
+    tokens = TOKEN.findall(line) if '"' in line else line.split()
+    # comments (#...#) sit on their own line between property names
+    if tokens and tokens[0][0] == '#':
+        return []
+    return tokens
+
+
+class Tokens:
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.buffer = []
+        self.pos = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while self.pos >= len(self.buffer):
+            self.buffer = split(next(self.lines))
+            self.pos = 0
+        token = self.buffer[self.pos]
+        self.pos += 1
+        return token
+
+    def take(self, n):
+        tokens = self.buffer[self.pos:self.pos + n]
+        self.pos += len(tokens)
+        while len(tokens) < n:
+            line = split(next(self.lines))
+            need = n - len(tokens)
+            tokens.extend(line[:need])
+            self.buffer = line
+            self.pos = min(need, len(line))
+        return tokens
+
+    def take_rows(self, rows, width):
+        n = rows * width
+        tokens = self.buffer[self.pos:self.pos + n]
+        self.pos += len(tokens)
+        if len(tokens) < n:
+            # table rows are normally one per line, so read them in one go
+            for line in islice(self.lines, (n - len(tokens)) // width):
+                tokens.extend(split(line))
+            if len(tokens) > n:
+                self.buffer = tokens[n:]
+                self.pos = 0
+                del tokens[n:]
+            elif len(tokens) < n:
+                tokens.extend(self.take(n - len(tokens)))
+        return tokens
+
+
+def unquote(token):
+    if token[0] == '"':
+        return token[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return token
+
+
+def convert(key, token):
+    if token == MISSING:
+        return None
+    if key.startswith('r_'):
+        return float(token)
+    if key.startswith('i_'):
+        return int(token)
+    if key.startswith('b_'):
+        return token != '0'
+    return unquote(token)
+
+
+def column(key, tokens):
+    # numpy is only needed once a structure is parsed, not to index or copy them
+    import numpy as np
+    missing = MISSING in tokens
+    if key.startswith('s_'):
+        values = [token[1:-1] if token[0] == '"' else token for token in tokens]
+        if '\\' in ''.join(values):
+            values = [unquote('"{}"'.format(value)) for value in values]
+        if missing:
+            values = ['' if token == MISSING else value for (token, value) in zip(tokens, values)]
+        return np.array(values, dtype=str)
+    if key.startswith('b_'):
+        return np.array([token == '1' for token in tokens], dtype=bool)
+    if key.startswith('i_') and not missing:
+        return np.fromiter(map(int, tokens), dtype=np.int64, count=len(tokens))
+    if not missing:
+        return np.fromiter(map(float, tokens), dtype=np.float64, count=len(tokens))
+    # integer columns with missing values are promoted to float so they can hold NaN
+    return np.array([np.nan if token == MISSING else float(token) for token in tokens], dtype=np.float64)
+
+
+class Table:
+
+    __slots__ = ('name', 'columns', 'size')
+
+    def __init__(self, name, columns, size):
+        self.name = name
+        self.columns = columns
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def keys(self):
+        return self.columns.keys()
+
+    def __repr__(self):
+        return 'Table({}[{}], {} columns)'.format(self.name, self.size, len(self.columns))
+
+
+class Block:
+
+    __slots__ = ('name', 'properties', 'tables', 'blocks')
+
+    def __init__(self, name, properties, tables=None, blocks=None):
+        self.name = name
+        self.properties = properties
+        self.tables = tables if tables is not None else {}
+        self.blocks = blocks if blocks is not None else []
+
+    def __getitem__(self, key):
+        return self.properties[key]
+
+    def get(self, key, default=None):
+        return self.properties.get(key, default)
+
+
+class Structure(Block):
+
+    __slots__ = ()
+
+    @property
+    def title(self):
+        return self.properties.get('s_m_title', '')
+
+    @property
+    def atoms(self):
+        return self.tables.get('m_atom')
+
+    @property
+    def bonds(self):
+        return self.tables.get('m_bond')
+
+    @property
+    def coordinates(self):
+        import numpy as np
+        atoms = self.atoms
+        return np.column_stack([atoms['r_m_x_coord'], atoms['r_m_y_coord'], atoms['r_m_z_coord']])
+
+    def __len__(self):
+        atoms = self.atoms
+        return 0 if atoms is None else len(atoms)
+
+    def __repr__(self):
+        return 'Structure({!r}, {} atoms)'.format(self.title, len(self))
+
+
+def parse_block(tokens, name, size=None, cls=Block):
+    keys = []
+    for token in tokens:
+        if token == ':::':
+            break
+        if token == '}':
+            return cls(name, {})
+        keys.append(token)
+    if size is not None:
+        # indexed block: each row is the row index followed by one value per key
+        width = len(keys) + 1
+        flat = tokens.take_rows(size, width)
+        columns = {key: column(key, flat[i+1::width]) for (i, key) in enumerate(keys)}
+        depth = 0
+        for token in tokens:
+            if token == '{':
+                depth += 1
+            elif token == '}':
+                if depth == 0:
+                    break
+                depth -= 1
+        return Table(name, columns, size)
+    values = tokens.take(len(keys))
+    properties = {key: convert(key, value) for (key, value) in zip(keys, values)}
+    block = cls(name, properties)
+    for token in tokens:
+        if token == '}':
+            break
+        child, child_size = BLOCK_NAME.match(token).groups()
+        next(tokens)
+        if child_size is not None:
+            block.tables[child] = parse_block(tokens, child, int(child_size))
+        else:
+            block.blocks.append(parse_block(tokens, child))
+    return block
+
+
+class MAEIndex:
+
+    MAGIC = b'MAEIDX1\n'
+    HEAD = struct.Struct('<qqq')
+
+    def __init__(self, file, offsets, size, mtime):
+        self.file = file
+        self.offsets = offsets
+        self.size = size
+        self.mtime = mtime
+        self._f = None
+        self._mm = None
+
+    @staticmethod
+    def sidecar(file):
+        return os.path.join(os.path.dirname(file), '.{}.idx'.format(os.path.basename(file)))
+
+    @classmethod
+    def build(cls, file):
+        # offsets are into the bytes on disk, which for a .maegz are not the structures
+        if is_compressed(file):
+            raise ValueError('{} is compressed; only uncompressed .mae files can be indexed'.format(file))
+        stat = os.stat(file)
+        offsets = array('q')
+        if stat.st_size > 0:
+            with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:6] == b'f_m_ct':
+                    offsets.append(0)
+                pos = mm.find(b'\nf_m_ct')
+                while pos != -1:
+                    offsets.append(pos + 1)
+                    pos = mm.find(b'\nf_m_ct', pos + 1)
+        return cls(file, offsets, stat.st_size, stat.st_mtime_ns)
+
+    @classmethod
+    def load(cls, file, save=True):
+        # the sidecar is reused only while the .mae it describes is unchanged
+        if is_compressed(file):
+            raise ValueError('{} is compressed; only uncompressed .mae files can be indexed'.format(file))
+        stat = os.stat(file)
+        sidecar = cls.sidecar(file)
+        if os.path.isfile(sidecar):
+            with open(sidecar, 'rb') as f:
+                if f.read(len(cls.MAGIC)) == cls.MAGIC:
+                    size, mtime, count = cls.HEAD.unpack(f.read(cls.HEAD.size))
+                    if (size, mtime) == (stat.st_size, stat.st_mtime_ns):
+                        offsets = array('q')
+                        offsets.frombytes(f.read(count * offsets.itemsize))
+                        return cls(file, offsets, size, mtime)
+        index = cls.build(file)
+        if save:
+            try:
+                index.save()
+            except OSError:
+                pass
+        return index
+
+    def save(self):
+        with open(self.sidecar(self.file), 'wb') as f:
+            f.write(self.MAGIC)
+            f.write(self.HEAD.pack(self.size, self.mtime, len(self.offsets)))
+            f.write(self.offsets.tobytes())
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def span(self, n):
+        if n < 0:
+            n += len(self.offsets)
+        start = self.offsets[n]
+        end = self.offsets[n + 1] if n + 1 < len(self.offsets) else self.size
+        return start, end
+
+    @property
+    def header_end(self):
+        return self.offsets[0] if self.offsets else self.size
+
+    def open(self):
+        if self._mm is None and self.size > 0:
+            self._f = open(self.file, 'rb')
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._f.close()
+            self._mm = None
+            self._f = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def header(self):
+        self.open()
+        return self._mm[:self.header_end] if self._mm is not None else b''
+
+    def __getitem__(self, n):
+        self.open()
+        start, end = self.span(n)
+        return self._mm[start:end]
+
+    def structure(self, n):
+        return block_structure(self[n])
+
+    def write(self, out, structures):
+        # structures are 0-based; each is copied straight out of the mapped file
+        with self.open(), open(out, 'wb') as f:
+            f.write(self.header())
+            for n in structures:
+                block = self[n]
+                f.write(block)
+                if not block.endswith(b'\n'):
+                    f.write(b'\n')
+        return out
 
 
 class MAE:
 
-    def __init__(self, file):
+    def __init__(self, file, cache=False):
         self.file = file
-        dic = self.parse_file_to_dict(self.file)
-        for key, val in dic.items():
-            print(key)
-            print(val)
-            print('\n')
-            for item in dic[key]:
-                print(item)
-            print('\n')
+        self.header = None
+        self._index = None
+        # with cache=True the file is parsed once into a StructureCache written beside it (see maecache) and
+        # read from that afterwards. off unless asked for, since it leaves a .mcache sidecar next to the input
+        self.cache = cache
+        self._cache = None
+        self._len = None
+
+    def __iter__(self):
+        return self.structures()
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = MAEIndex.load(self.file)
+        return self._index
+
+    def __len__(self):
+        if self.use_cache():
+            return len(self.cached())
+        if is_compressed(self.file):
+            # no index into compressed bytes, so the blocks are counted as they stream past
+            if self._len is None:
+                self._len = sum(1 for _ in iter_blocks(self.file)) - 1
+            return self._len
+        return len(self.index)
+
+    def __getitem__(self, n):
+        if self.use_cache():
+            return self.cached()[n]
+        if is_compressed(self.file):
+            if n < 0:
+                n += len(self)
+            block = next(islice(iter_blocks(self.file), n + 1, None), None) if n >= 0 else None
+            if block is None:
+                raise IndexError(n)
+            return block_structure(block)
+        return self.index.structure(n)
+
+    def use_cache(self):
+        return self.cache
+
+    def cached(self):
+        if self._cache is None:
+            from maestrowrapper.maecache import StructureCache
+            self._cache = StructureCache.load(self.file)
+        return self._cache
+
+    def subset(self, structures, out):
+        if is_compressed(self.file):
+            return write_structures(self.file, {n: out for n in structures})[0]
+        return self.index.write(out, structures)
+
+    def structures(self):
+        if self.use_cache():
+            return iter(self.cached())
+        return self.parse()
+
+    def parse(self):
+        with open_mae(self.file, 'r') as f:
+            tokens = Tokens(f)
+            for token in tokens:
+                if token == '{':
+                    self.header = parse_block(tokens, None)
+                    continue
+                name = BLOCK_NAME.match(token).group(1)
+                next(tokens)
+                if name in ('f_m_ct', 'p_m_ct'):
+                    yield parse_block(tokens, name, cls=Structure)
+                else:
+                    parse_block(tokens, name)
 
     def parse_file_to_dict(self, filename):
         # this dont work lol need to fix
@@ -48,3 +450,200 @@ class MAE:
                         data[parent_key][sub_key].append(line.strip('\n'))
         return data
 
+
+
+def is_compressed(file):
+    if os.path.isfile(file):
+        with open(file, 'rb') as f:
+            return f.read(2) == b'\x1f\x8b'
+    return file.endswith(('.maegz', '.gz'))
+
+
+def open_mae(file, mode='rb'):
+    # .maegz is plain gzip, possibly made of several concatenated members
+    if is_compressed(file):
+        return gzip.open(file, mode if 'b' in mode else mode + 't')
+    return open(file, mode)
+
+
+def block_structure(block):
+    # a raw f_m_ct block, as MAEIndex and iter_blocks give them
+    text = block.decode() if isinstance(block, bytes) else block
+    return parse_block(Tokens(text.splitlines()[1:]), 'f_m_ct', cls=Structure)
+
+
+def iter_blocks(file):
+    # the header, then each f_m_ct block, as bytes. an uncompressed file is read through its index; a compressed
+    # one is decompressed as it streams and cut at each f_m_ct that starts a line
+    if not is_compressed(file):
+        with MAEIndex.load(file) as index:
+            yield index.header()
+            for n in range(len(index)):
+                yield index[n]
+        return
+    with open_mae(file, 'rb') as f:
+        data = b''
+        first = True
+        for chunk in iter(lambda: f.read(CHUNK), b''):
+            data += chunk
+            if first and data.startswith(b'f_m_ct'):
+                yield b''
+            first = False
+            start = 0
+            pos = data.find(b'\nf_m_ct')
+            while pos != -1:
+                yield data[start:pos + 1]
+                start = pos + 1
+                pos = data.find(b'\nf_m_ct', start)
+            data = data[start:]
+        if data or first:
+            yield data
+
+
+def open_out(file):
+    # outputs named .maegz/.gz are written compressed
+    if file.endswith(('.maegz', '.gz')):
+        return gzip.open(file, 'wb', compresslevel=6)
+    return open(file, 'wb')
+
+
+def write_structures(file, outs):
+    # outs maps 0-based structure numbers to the file each is copied to, in file order after the header.
+    # one pass over the input, compressed or not; an output is closed as soon as it has all of its structures
+    remaining = {}
+    for out in outs.values():
+        remaining[out] = remaining.get(out, 0) + 1
+    handles = {}
+    blocks = iter_blocks(file)
+    header = next(blocks, b'')
+    try:
+        for n, block in enumerate(blocks):
+            out = outs.get(n)
+            if out is None:
+                continue
+            if out not in handles:
+                handles[out] = open_out(out)
+                handles[out].write(header)
+            handles[out].write(block)
+            if not block.endswith(b'\n'):
+                handles[out].write(b'\n')
+            remaining[out] -= 1
+            if not remaining[out]:
+                handles.pop(out).close()
+    finally:
+        for handle in handles.values():
+            handle.close()
+        blocks.close()
+    if any(remaining.values()):
+        raise IndexError('{} has fewer structures than asked for ({})'.format(file, max(outs) + 1))
+    return list(remaining)
+
+
+def body_start(file):
+    if is_compressed(file):
+        return None
+    return MAEIndex.load(file).header_end
+
+
+def iter_body(file, start=None):
+    if start is not None:
+        with open(file, 'rb') as f:
+            f.seek(start)
+            for chunk in iter(lambda: f.read(CHUNK), b''):
+                yield chunk
+        return
+    with open_mae(file, 'rb') as f:
+        # skip the header of a compressed file by looking for the first f_m_ct at a line start
+        tail = b''
+        for chunk in iter(lambda: f.read(CHUNK), b''):
+            data = tail + chunk
+            if not tail and data.startswith(b'f_m_ct'):
+                pos = 0
+            else:
+                pos = data.find(b'\nf_m_ct')
+                pos = pos + 1 if pos != -1 else -1
+            if pos != -1:
+                yield data[pos:]
+                break
+            # keep enough of the end to catch a marker split across chunks
+            tail = data[-7:]
+        for chunk in iter(lambda: f.read(CHUNK), b''):
+            yield chunk
+
+
+def copy_range(file, start, out):
+    size = os.path.getsize(file) - start
+    if sys.platform.startswith('linux'):
+        # kernel-side copy, the data never passes through Python
+        out.flush()
+        with open(file, 'rb') as f:
+            while size > 0:
+                sent = os.sendfile(out.fileno(), f.fileno(), start, min(size, 1 << 30))
+                if sent == 0:
+                    break
+                start += sent
+                size -= sent
+        return
+    with open(file, 'rb') as f:
+        f.seek(start)
+        shutil.copyfileobj(f, out, CHUNK)
+
+
+def last_byte(file):
+    # a file not ending in a newline would run its last line into the f_m_ct of the next one concat copies
+    with open(file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return b''
+        f.seek(-1, os.SEEK_END)
+        return f.read(1)
+
+
+def ordered(pool, func, items, window):
+    # like pool.map, but never more than window results held in memory
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def concat(files, output, header=HEADER, threads=4, compresslevel=6):
+    compress = output.endswith(('.maegz', '.gz'))
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        starts = list(pool.map(body_start, files))
+        with open(output, 'wb') as out:
+            if not compress:
+                out.write(header)
+                for (file, start) in zip(files, starts):
+                    if start is not None:
+                        copy_range(file, start, out)
+                        last = last_byte(file)
+                    else:
+                        last = b''
+                        for chunk in iter_body(file):
+                            out.write(chunk)
+                            last = chunk[-1:] or last
+                    if last not in (b'', b'\n'):
+                        out.write(b'\n')
+                return output
+            # every chunk becomes its own gzip member, so they can be compressed in parallel;
+            # concatenated members are still a single valid gzip stream
+            def chunks():
+                yield header
+                for (file, start) in zip(files, starts):
+                    last = b''
+                    for chunk in iter_body(file, start):
+                        last = chunk[-1:] or last
+                        yield chunk
+                    if last not in (b'', b'\n'):
+                        yield b'\n'
+
+            def deflate(chunk):
+                return gzip.compress(chunk, compresslevel=compresslevel, mtime=0)
+
+            for member in ordered(pool, deflate, chunks(), threads * 2):
+                out.write(member)
+    return output
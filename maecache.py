@@ -0,0 +1,338 @@
+import os
+import json
+import struct
+import hashlib
+import numpy as np
+
+from maestrowrapper.mae import MAE, Block, Table, Structure
+
+
+def kind(key):
+    # ct properties are one value per structure, so they keep the parser's types
+    if key.startswith('r_'):
+        return np.float64, np.nan
+    if key.startswith('i_'):
+        return np.int64, 0
+    if key.startswith('b_'):
+        return np.bool_, False
+    return np.str_, ''
+
+
+def intern(values):
+    # distinct strings once, and an int32 code per value into them
+    lookup = {}
+    codes = np.array([lookup.setdefault(value, len(lookup)) for value in values], dtype=np.int32)
+    return np.array(list(lookup), dtype=str), codes
+
+
+def digest(file, chunk=1 << 22):
+    h = hashlib.blake2b(digest_size=16)
+    with open(file, 'rb') as f:
+        for data in iter(lambda: f.read(chunk), b''):
+            h.update(data)
+    return h.hexdigest()
+
+
+class Column:
+    # one table column over every structure, kept as the pieces each structure contributed (a row count
+    # where it is padding) and written out piece by piece, so it is never copied into one array to save.
+    # values keep the parser's types. an integer column with <> in some structure stays integer, with a
+    # column of its own (missing) saying which rows had no value. strings are codes into lookup, since
+    # residue, atom and chain names repeat endlessly
+
+    def __init__(self, rows=0, structures=0):
+        self.parts = [rows] if rows else []
+        self.has = [False] * structures
+        self.lookup = None
+        self.missing = None
+
+    def add(self, table, key):
+        values = table.columns.get(key) if table is not None else None
+        if values is None:
+            if table is not None:
+                self.parts.append(table.size)
+                if self.missing is not None:
+                    self.missing.parts.append(table.size)
+            self.has.append(False)
+            return
+        missing = None
+        if values.dtype.kind == 'f' and key.startswith('i_'):
+            # the parser made it float to hold NaN where the values were <>
+            missing = np.isnan(values)
+            values = np.where(missing, 0, values).astype(np.int64)
+        if missing is not None and self.missing is None:
+            self.missing = Column(self.shape[0])
+        if self.missing is not None:
+            self.missing.parts.append(missing if missing is not None else len(values))
+        if values.dtype.kind == 'U':
+            if self.lookup is None:
+                self.lookup = {}
+            distinct, inverse = np.unique(values, return_inverse=True)
+            codes = np.array([self.lookup.setdefault(str(value), len(self.lookup)) for value in distinct], dtype=np.int32)
+            values = codes[inverse.reshape(-1)]
+        self.parts.append(values)
+        self.has.append(True)
+
+    @property
+    def dtype(self):
+        dtypes = [part.dtype for part in self.parts if not isinstance(part, int)]
+        return dtypes[0] if dtypes else np.dtype(np.int32)
+
+    @property
+    def shape(self):
+        return (sum(part if isinstance(part, int) else len(part) for part in self.parts),)
+
+    @property
+    def nbytes(self):
+        return self.shape[0] * self.dtype.itemsize
+
+    def chunks(self):
+        dtype = self.dtype
+        for part in self.parts:
+            yield np.zeros(part, dtype=dtype) if isinstance(part, int) else part.astype(dtype, copy=False)
+
+    def concatenate(self):
+        return np.concatenate(list(self.chunks())) if self.parts else np.zeros(0, dtype=self.dtype)
+
+
+def block_to_json(block):
+    # child blocks other than tables are rare (m_depend and the like), so they go in the header as they are
+    return {'name': block.name, 'properties': block.properties,
+            'tables': {name: {'size': table.size, 'columns': {key: values.tolist() for (key, values) in table.columns.items()}}
+                       for (name, table) in block.tables.items()},
+            'blocks': [block_to_json(child) for child in block.blocks]}
+
+
+def block_from_json(data):
+    tables = {name: Table(name, {key: np.array(values) for (key, values) in table['columns'].items()}, table['size'])
+              for (name, table) in data['tables'].items()}
+    return Block(data['name'], data['properties'], tables, [block_from_json(child) for child in data['blocks']])
+
+
+class StructureCache:
+    # every structure of an .mae/.maegz, parsed once and kept beside it as flat arrays: a column of each
+    # ct property over all structures, and each table column (m_atom coordinates, elements, ...) over all
+    # structures end to end, with per-structure row counts. loading maps the file, so a structure's
+    # columns are views into it and nothing is read until used.
+    #
+    # the cache belongs to the .mae it was made from while size and mtime match; a file with the same size
+    # but a new mtime (copied, touched) is hashed, and kept if the contents are the same
+
+    MAGIC = b'MAECCH1\n'
+    HEAD = struct.Struct('<qq')
+    ALIGN = 64
+    VERSION = 3
+
+    def __init__(self, file, header, buffer=None, arrays=None):
+        self.file = file
+        self.header = header
+        self._buffer = buffer
+        self._arrays = arrays if arrays is not None else {}
+        self._starts = {}
+
+    @staticmethod
+    def sidecar(file):
+        return os.path.join(os.path.dirname(file), '.{}.mcache'.format(os.path.basename(file)))
+
+    def __len__(self):
+        return self.header['count']
+
+    def __iter__(self):
+        for n in range(len(self)):
+            yield self[n]
+
+    def array(self, name):
+        if isinstance(self._arrays.get(name), Column):
+            # built and not saved
+            self._arrays[name] = self._arrays[name].concatenate()
+        if name not in self._arrays:
+            offset, dtype, shape = self.header['arrays'][name]
+            count = int(np.prod(shape))
+            dtype = np.dtype(dtype)
+            self._arrays[name] = self._buffer[offset:offset + count * dtype.itemsize].view(dtype).reshape(shape)
+        return self._arrays[name]
+
+    def has(self, name):
+        return name in self._arrays or name in self.header.get('arrays', ())
+
+    @property
+    def titles(self):
+        if 's_m_title' not in self.header['properties']:
+            return [''] * len(self)
+        return [str(title) for title in self.array('p/s_m_title/values')[self.array('p/s_m_title')]]
+
+    def starts(self, table):
+        if table not in self._starts:
+            sizes = np.maximum(self.array('t/{}'.format(table)), 0)
+            self._starts[table] = np.concatenate([[0], np.cumsum(sizes)])
+        return self._starts[table]
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError(n)
+        properties = {}
+        for key in self.header['properties']:
+            has = self.array('p/{}/has'.format(key))[n]
+            if has == 1:
+                value = self.array('p/{}'.format(key))[n]
+                if self.has('p/{}/values'.format(key)):
+                    value = self.array('p/{}/values'.format(key))[value]
+                properties[key] = str(value) if value.dtype.kind == 'U' else value.item()
+            elif has == 2:
+                properties[key] = None
+        tables = {}
+        for name, keys in self.header['tables'].items():
+            size = int(self.array('t/{}'.format(name))[n])
+            if size < 0:
+                continue
+            start = self.starts(name)[n]
+            columns = {}
+            for key in keys:
+                if not self.array('t/{}/{}/has'.format(name, key))[n]:
+                    continue
+                values = self.array('t/{}/{}'.format(name, key))[start:start + size]
+                if self.has('t/{}/{}/values'.format(name, key)):
+                    values = self.array('t/{}/{}/values'.format(name, key))[values]
+                if self.has('t/{}/{}/missing'.format(name, key)):
+                    missing = self.array('t/{}/{}/missing'.format(name, key))[start:start + size]
+                    if missing.any():
+                        # as the parser gives it: float, with NaN for <>
+                        values = np.where(missing, np.nan, values)
+                columns[key] = values
+            tables[name] = Table(name, columns, size)
+        blocks = [block_from_json(block) for block in self.header['blocks'].get(str(n), [])]
+        return Structure(self.header['names'].get(str(n), 'f_m_ct'), properties, tables, blocks)
+
+    @classmethod
+    def build(cls, file, structures=None):
+        # one pass over the parser, so only this structure is ever held as parsed; what is kept between them
+        # is the columns, about what the sidecar ends up holding. the stat is taken first, so a file rewritten
+        # while it is parsed leaves the cache stale rather than wrong
+        stat = os.stat(file)
+        structures = MAE(file, cache=False).parse() if structures is None else structures
+        properties = {}
+        tables = {}
+        blocks = {}
+        names = {}
+        count = 0
+        for n, structure in enumerate(structures):
+            count = n + 1
+            for key in structure.properties:
+                if key not in properties:
+                    properties[key] = ([None] * n, bytearray(n))
+            for key, (values, has) in properties.items():
+                # 0 where a structure has no such property, 1 with a value, 2 for <>
+                value = structure.properties.get(key)
+                values.append(value)
+                has.append(0 if key not in structure.properties else 2 if value is None else 1)
+            for name in structure.tables:
+                if name not in tables:
+                    tables[name] = ([-1] * n, {})
+            for name, (sizes, columns) in tables.items():
+                table = structure.tables.get(name)
+                for key in table.columns if table is not None else ():
+                    if key not in columns:
+                        # a column only some structures have is padded, and marked absent, for the rest
+                        columns[key] = Column(sum(size for size in sizes if size > 0), n)
+                for key, column in columns.items():
+                    column.add(table, key)
+                sizes.append(-1 if table is None else table.size)
+            if structure.blocks:
+                blocks[str(n)] = [block_to_json(block) for block in structure.blocks]
+            if structure.name != 'f_m_ct':
+                names[str(n)] = structure.name
+        arrays = {}
+        for key, (values, has) in properties.items():
+            dtype, fill = kind(key)
+            values = [fill if value is None else value for value in values]
+            if dtype is np.str_:
+                arrays['p/{}/values'.format(key)], arrays['p/{}'.format(key)] = intern(values)
+            else:
+                arrays['p/{}'.format(key)] = np.array(values, dtype=dtype)
+            arrays['p/{}/has'.format(key)] = np.frombuffer(bytes(has), dtype=np.uint8)
+        for name, (sizes, columns) in tables.items():
+            arrays['t/{}'.format(name)] = np.array(sizes, dtype=np.int32)
+            for key, column in columns.items():
+                arrays['t/{}/{}'.format(name, key)] = column
+                if column.lookup is not None:
+                    arrays['t/{}/{}/values'.format(name, key)] = np.array(list(column.lookup), dtype=str)
+                if column.missing is not None:
+                    arrays['t/{}/{}/missing'.format(name, key)] = column.missing
+                arrays['t/{}/{}/has'.format(name, key)] = np.array(column.has, dtype=bool)
+        header = {'version': cls.VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'digest': None,
+                  'count': count, 'properties': list(properties),
+                  'tables': {name: list(columns) for (name, (_, columns)) in tables.items()},
+                  'blocks': blocks, 'names': names}
+        return cls(file, header, arrays=arrays)
+
+    def save(self, digest_file=True):
+        if digest_file:
+            self.header['digest'] = digest(self.file)
+        layout = {}
+        offset = 0
+        for name, values in self._arrays.items():
+            if not isinstance(values, Column):
+                values = np.ascontiguousarray(values)
+            offset = (offset + self.ALIGN - 1) // self.ALIGN * self.ALIGN
+            layout[name] = [offset, values.dtype.str, list(values.shape)]
+            offset += values.nbytes
+        header = json.dumps(dict(self.header, arrays=layout)).encode()
+        start = len(self.MAGIC) + self.HEAD.size + len(header)
+        base = (start + self.ALIGN - 1) // self.ALIGN * self.ALIGN
+        sidecar = self.sidecar(self.file)
+        # renamed into place, so a reader never maps half a file
+        tmp = '{}.{}.tmp'.format(sidecar, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(self.MAGIC)
+            f.write(self.HEAD.pack(len(header), base))
+            f.write(header)
+            for name, values in self._arrays.items():
+                f.write(b'\0' * (base + layout[name][0] - f.tell()))
+                for chunk in values.chunks() if isinstance(values, Column) else [values]:
+                    f.write(np.ascontiguousarray(chunk).tobytes())
+        os.replace(tmp, sidecar)
+        return sidecar
+
+    @classmethod
+    def read(cls, file):
+        sidecar = cls.sidecar(file)
+        with open(sidecar, 'rb') as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                return None
+            length, base = cls.HEAD.unpack(f.read(cls.HEAD.size))
+            header = json.loads(f.read(length).decode())
+        if header.get('version') != cls.VERSION:
+            return None
+        header['arrays'] = {name: [base + offset, dtype, shape] for (name, (offset, dtype, shape)) in header['arrays'].items()}
+        buffer = np.memmap(sidecar, dtype=np.uint8, mode='r') if os.path.getsize(sidecar) > base else np.zeros(0, np.uint8)
+        return cls(file, header, buffer)
+
+    def fresh(self):
+        stat = os.stat(self.file)
+        if (stat.st_size, stat.st_mtime_ns) == (self.header['size'], self.header['mtime']):
+            return True
+        if stat.st_size != self.header['size'] or self.header['digest'] is None:
+            return False
+        return digest(self.file) == self.header['digest']
+
+    @classmethod
+    def load(cls, file, save=True):
+        # the cached structures, or the .mae parsed (and the cache written) when there is none or it is stale
+        if os.path.isfile(cls.sidecar(file)):
+            try:
+                cache = cls.read(file)
+            except (OSError, ValueError):
+                cache = None
+            if cache is not None and cache.fresh():
+                return cache
+        cache = cls.build(file)
+        if save:
+            try:
+                cache.save()
+            except OSError:
+                return cache
+            # mapped back, so the columns held while building are let go
+            return cls.read(file)
+        return cache
@@ -1,22 +1,51 @@
 import os
 from re import sub
-import shutil
 import sys
 import time
 import json
-import subprocess
-from matplotlib.pyplot import plot
 import logging
 from datetime import datetime
-import pandas as pd
 from pathlib import Path
-import threading
+import signal
+import asyncio
+import itertools
+from maestrowrapper import aio
 from maestrowrapper import inplib
-import multiprocessing as mp
+from maestrowrapper import mae
+from maestrowrapper import batching
+from maestrowrapper import plugins
+from maestrowrapper import capture
+from maestrowrapper.mae import MAE, write_structures
+from maestrowrapper.scheduler import Job, Scheduler
+from maestrowrapper.licenses import LicenseBroker
+from maestrowrapper.jobs import wait_unlocked
+from maestrowrapper.executors import LocalExecutor
+from maestrowrapper.metrics import Metrics
+from maestrowrapper.cache import ResultCache, schrodinger_version
+from maestrowrapper.journal import Journal
+from maestrowrapper.staging import Stager
+from maestrowrapper.results import ResultStore
+from maestrowrapper.campaign import Campaign
+from maestrowrapper.pipeline import Stage, Pipeline
+from maestrowrapper.watch import FolderWatch
+from maestrowrapper.tuning import AutoTuner, cpu_count
 
 class MaestroWrapper:
-    def __init__(self, schrodinger, path=None, files=None, prep_onload=False):
+    def __init__(self, schrodinger, path=None, files=None, prep_onload=False, cache=None, executor=None, metrics=None,
+                 campaign=None):
         self.schrodinger = schrodinger
+        self.version = schrodinger_version(schrodinger)
+        if isinstance(cache, str):
+            cache = ResultCache(cache)
+        self.cache = cache
+        # where and how commands run: LocalExecutor, HostExecutor or BatchExecutor
+        self.executor = executor if executor is not None else LocalExecutor()
+        # timings per job; a directory collects every stage's trace and .prom file in one place
+        self.metrics = metrics if isinstance(metrics, Metrics) else Metrics(metrics)
+        # results of every stage, joined by structure title in one database (a path or a Campaign)
+        self.campaign = Campaign(campaign) if isinstance(campaign, str) else campaign
+        # AutoTuner settings for stages run with nt='auto', e.g. {'interval': 60, 'max_nt': 16}
+        self.tuning = {}
         self._files = []
         self.prep_onload = prep_onload
         self.computer = os.environ['COMPUTERNAME']
@@ -31,11 +60,10 @@ class MaestroWrapper:
         else:
             self.path = os.getcwd()
         if files is None:
-            self.files = os.listdir(self.path)
+            self.files = self.listdir(self.path)
         else:
             self.files = files
         self.progress_tracker = 0
-        self.queue_ready = False
         self.pending_jobs = []
         self.active_jobs = []
         self.queued_jobs = []
@@ -48,7 +76,24 @@ class MaestroWrapper:
         self.lics_per_job = {
             'PSP_PLOP':8
         }
+        self.license_broker = LicenseBroker(self.environ, self.lics_per_job)
+        # the async stages share the in-process broker; nothing runs in other processes
+        self.licenses = aio.AsyncLicenses(self.license_broker)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # the result store is only written by the parent as jobs are collected
+        state.pop('results', None)
+        state.pop('campaign', None)
+        state.pop('watcher', None)
+        return state
     
+    @staticmethod
+    def listdir(path):
+        # hidden files are job locks, journals and index or cache sidecars, never inputs; nor are the output
+        # directories a pipeline makes inside its input directory
+        return [file for file in os.listdir(path) if not file.startswith('.') and os.path.isfile(os.path.join(path, file))]
+
     @property
     def num_active(self):
         return len(self.active_jobs)
@@ -65,167 +110,274 @@ class MaestroWrapper:
     def num_pending(self):
         return len(self.pending_jobs)
 
+    @property
+    def terminate(self):
+        return self._terminate
+
+    @terminate.setter
+    def terminate(self, value):
+        # setting it ends a running watch() straight away, from any thread
+        self._terminate = value
+        watcher = self.__dict__.get('watcher')
+        if value and watcher is not None:
+            watcher.stop()
+
+    def stop(self):
+        self.terminate = True
+
+    def watch(self, stages=('ligprep',), nt=4, pattern=None, settle=2.0, poll=5.0, backlog=64, existing=True,
+              resume=True, options=None):
+        return aio.run(self.awatch(stages=stages, nt=nt, pattern=pattern, settle=settle, poll=poll, backlog=backlog,
+                                   existing=existing, resume=resume, options=options))
+
+    async def awatch(self, stages=('ligprep',), nt=4, pattern=None, settle=2.0, poll=5.0, backlog=64, existing=True,
+                     resume=True, options=None):
+        # daemon mode: each file that lands in self.path (pattern, e.g. '*.mae', picks which) goes through the job
+        # types in stages one file at a time, moving on as soon as it clears a stage, until stop(), terminate = True,
+        # SIGTERM or Ctrl-C. no more than backlog files are in flight; past that, new ones wait on disk.
+        # files already collected by an earlier watch of the same directory are skipped (resume).
+        # nt is one number or per job type, options per job type, e.g. {'ligprep': {'output_type': 'mae'}}
+        options = options or {}
+        job_types = [plugins.get(name)(**options.get(name, {})) for name in stages]
+        self.terminate = False
+        self.watcher = FolderWatch(self.path, pattern, settle=settle, poll=poll, existing=existing)
+        # the stages run side by side and share one Stager, so staging is reported for the watch as a whole
+        self.stager = Stager()
+        paths = [job_type.path(self) for job_type in job_types]
+        journals = []
+        schedulers = []
+        pipeline_stages = []
+        for job_type, path in zip(job_types, paths):
+            if not os.path.isdir(path):
+                os.mkdir(path)
+            n = nt.get(job_type.name, 4) if isinstance(nt, dict) else nt
+            n = cpu_count() if n == 'auto' else n
+            journal = Journal.for_stage(path)
+            scheduler = Scheduler(self.arun_foreground if job_type.foreground else self.arun_job, nt=n,
+                                  collect=lambda job, job_type=job_type, path=path: job_type.collect(self, path, job),
+                                  name=job_type.name, cache=self.cache, version=self.version, journal=journal,
+                                  resume=resume, metrics=self.metrics)
+            self.metrics.start(job_type.name, path)
+            journals.append(journal)
+            schedulers.append(scheduler)
+            pipeline_stages.append(Stage(job_type.name, self.watch_stage(job_type, path, scheduler, journal), n, job_type.lic))
+        pipeline = Pipeline(pipeline_stages, licenses=self.licenses, name='watch')
+        calls, poll_time = self.license_broker.num_calls(), self.license_broker.poll_seconds()
+        loop = asyncio.get_running_loop()
+        handled = []
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+                handled.append(sig)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # Windows, or a loop off the main thread (aio.run inside Jupyter): stop() still works
+                pass
+        print('Watching {} for new files ({})...'.format(self.path, ' -> '.join(stage.name for stage in pipeline_stages)))
+        try:
+            await pipeline.stream(self.watcher.files(), backlog=backlog)
+        finally:
+            for sig in handled:
+                loop.remove_signal_handler(sig)
+            for journal in journals:
+                journal.close()
+            self.watcher = None
+        print('watch stopped: {}'.format(self.stager.report()))
+        for job_type, scheduler, path in zip(job_types, schedulers, paths):
+            self.metrics.finish(scheduler.name, licadmin_calls=self.license_broker.num_calls() - calls,
+                                licadmin_seconds=round(self.license_broker.poll_seconds() - poll_time, 6),
+                                cached=len(scheduler.cached), failed=len(scheduler.failed))
+            job_type.finish(self, path)
+            if self.campaign is not None:
+                self.campaign.add(job_type.name, path)
+        return pipeline
+
+    def watch_stage(self, job_type, path, scheduler, journal):
+        # job numbers carry on from the journal, so a restarted watch never reuses a tmpdir
+        numbers = itertools.count(journal.next_id(job_type.name))
+
+        async def run(file):
+            job = job_type.file_job(self, path, next(numbers), file)
+            # the pipeline stage holds the licence for the job
+            job.lic = None
+            job = await scheduler.asubmit(job)
+            # a daemon sees no end of jobs, so the scheduler only keeps their ids
+            scheduler.jobs.pop(job.job_id, None)
+            if job.stats is not None:
+                self.stager.add(job.stats['staging'])
+            if job.status != 0:
+                raise RuntimeError(job.status)
+            return job_type.products(job.outputs or [])
+        return run
 
-    def divide_files(self, n):
-        # Calculate the target size of each smaller list
-        target_size = len(self.files) // n
-        remainder = len(self.files) % n
+    async def arun_job(self, job):
+        tmpdir = os.path.abspath(job.tmpdir)
+        stager = Stager()
+        start = time.time()
+        stager.stage_in(job.files, tmpdir, job.writes())
+        if job.setup is not None:
+            job.setup(tmpdir)
+        job.timings['stage_in'] = time.time() - start
+        start = time.time()
+        reservation = await self.licenses.acquire(job.lic)
+        job.timings['licence_wait'] = time.time() - start
+        try:
+            await self.executor.run(job, env=self.environ, computer=self.computer)
+        finally:
+            await self.licenses.release(reservation)
+        return {'staging': stager.stats, 'host': job.host, 'timings': job.timings}
 
-        divided_files = []
-        start = 0
+    async def arun_foreground(self, job):
+        tmpdir = os.path.abspath(job.tmpdir)
+        stager = Stager()
+        start = time.time()
+        stager.stage_in(job.files, tmpdir, job.writes())
+        if job.setup is not None:
+            job.setup(tmpdir)
+        job.timings['stage_in'] = time.time() - start
+        start = time.time()
+        log = self.executor.job_log(job)
+        try:
+            await capture.arun(job.cmd, tmpdir, log, env=self.environ, hang_timeout=self.executor.hang_timeout)
+        finally:
+            job.timings['run'] = time.time() - start
+        return {'staging': stager.stats, 'timings': job.timings}
 
-        for i in range(n):
-            end = start + target_size + (1 if i < remainder else 0)
-            smaller_list = self.files[start:end]
-            divided_files.append(smaller_list)
-            start = end
+    def autotuner(self, jobs, name):
+        # sized against the executor's hosts when it has any, else this machine's cores
+        lic = next((job.lic for job in jobs if job.lic is not None), None)
+        return AutoTuner(**dict({'cores': self.executor.slots, 'broker': self.license_broker, 'lic': lic, 'name': name},
+                                **self.tuning))
 
-        return divided_files
+    async def arun_jobs(self, jobs, nt=4, cost=None, collect=None, name='job', path=None, resume=False, runner=None):
+        # nt is how many jobs are in flight at once, all of them driven from this loop;
+        # nt='auto' lets an AutoTuner pick it, and the CPUs per job, and adjust both as the stage runs
+        journal = Journal.for_stage(path) if path is not None else None
+        runner = self.arun_job if runner is None else runner
+        tuner = self.autotuner(jobs, name) if nt == 'auto' else None
+        scheduler = Scheduler(runner, nt=1 if tuner is not None else nt, cost=cost, collect=collect, name=name,
+                              cache=self.cache, version=self.version, journal=journal, resume=resume,
+                              metrics=self.metrics, tuner=tuner)
+        self.pending_jobs = scheduler.queued
+        self.active_jobs = scheduler.running
+        self.completed_jobs = scheduler.completed
+        self.total_jobs = len(jobs)
+        self.stager = Stager()
+        self.metrics.start(name, path)
+        calls, poll_time = self.license_broker.num_calls(), self.license_broker.poll_seconds()
+        try:
+            completed = await scheduler.arun(jobs)
+        finally:
+            if journal is not None:
+                journal.close()
+        self.finish_stage(scheduler, calls, poll_time)
+        return completed
 
-    def queue(self):
-        while True:
-            if (not self.queue_ready):
-                print('queue waiting... currently running {} jobs'.format(self.running))
-                time.sleep(2)
+    def finish_stage(self, scheduler, calls=0, poll_time=0.0):
+        for job in scheduler.jobs.values():
+            if job.stats is not None:
+                self.stager.add(job.stats['staging'])
+        print('{}: {}'.format(scheduler.name, self.stager.report()))
+        self.metrics.finish(scheduler.name, licadmin_calls=self.license_broker.num_calls() - calls,
+                            licadmin_seconds=round(self.license_broker.poll_seconds() - poll_time, 6),
+                            cached=len(scheduler.cached), failed=len(scheduler.failed))
+
+    def collect(self, job, path):
+        tmpdir = os.path.abspath(job.tmpdir)
+        # a rename keeps cache hits as links instead of copying them. the staged inputs are not outputs
+        pairs = []
+        for file in os.listdir(tmpdir):
+            if self.stager.is_input(os.path.join(tmpdir, file), job.files):
+                os.remove(os.path.join(tmpdir, file))
             else:
-                if not self.num_pending == 0:
-                    print('FOUND JOB IN QUEUE')
-                    job = self.pending_jobs.pop(0)
-                    self.active_jobs.append(job)
-            if self.terminate:
-                break
-
-    def run_subjob(self, subjob_params,):
-        job_id = subjob_params['job_id']
-        files = subjob_params['files']
-        cmds = subjob_params['cmds']
-        tmpdir = subjob_params['tmpdir']
-        lic = subjob_params['lic']
-        if not os.path.isdir(tmpdir):
-            os.mkdir(tmpdir)
-        os.chdir(tmpdir)
-        total_jobs = len(cmds)
-        completed_jobs = 0
-        for file in files:
-            shutil.copy2(file, os.getcwd())
-        for cmd in cmds:
-            while not self.lics_avail(lic, debug=True, job_id=tmpdir):
-                time.sleep(3)
-            process = subprocess.Popen(cmd.split(), shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.environ)
-            while not self.is_launched(os.getcwd()):
-                time.sleep(3)
-            while self.is_launched(os.getcwd()):
-                time.sleep(3)
-            completed_jobs += 1
-            if completed_jobs % 4 == 0:
-                print('Subjob {}: {}/{} sub-jobs completed'.format(job_id, completed_jobs, total_jobs))
-            
-        print('Subjob {}: Complete'.format(job_id))
-        os.chdir(self.path)
+                pairs.append((os.path.join(tmpdir, file), os.path.join(path, file)))
+        outputs = self.stager.stage_out(pairs)
+        os.rmdir(tmpdir)
+        return outputs
 
-    def run_cmd(self, cmd):
-        process = subprocess.Popen(cmd.split(), shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.environ)
-        while not self.is_launched(os.getcwd()):
-            time.sleep(3)
-        while self.is_launched(os.getcwd()):
-            time.sleep(3)
-        stdout, stderr = process.communicate()
-        return stdout, stderr
-    
-    def is_launched(self, path):
-        job_id = '.{}'.format(self.computer)
-        for file in os.listdir(path):
-            if file.startswith(job_id):
-                return True
-        return False
+    def run_cmd(self, cmd, cwd=None):
+        job = Job(0, cmd, tmpdir=cwd if cwd is not None else os.getcwd())
+        return aio.run(self.executor.run(job, env=self.environ, computer=self.computer))
 
     def lics_avail(self, lic, debug=False, job_id=None):
-        process = subprocess.Popen(['licadmin', 'stat'], shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.environ)
-        stdout, stderr = process.communicate()
-        for line in stdout.decode().split('\n'):
-            if line.startswith('Users'):
-                _lic = line.split(':')[0].split()[-1]
-                if lic.upper() == _lic.upper():
-                    issued = int(line.split(';')[0].split('of')[-1].strip().split()[0])
-                    inuse = int(line.split(';')[-1].split('of')[-1].strip().split()[0])
-                    if debug:
-                        if job_id is None:
-                            speaker = 'NONE'
-                        else:
-                            speaker = job_id
-                        print('JobID {}: {} issued, {} in use'.format(job_id, issued, inuse))
-                    if (inuse == issued) or (inuse == issued-1):
-                        return False
-        return True
+        start = time.time()
+        available = self.license_broker.available(lic)
+        self.metrics.observe('licences', 'lics_avail', time.time() - start)
+        if debug:
+            issued, inuse = self.license_broker.stat(lic) or (None, None)
+            print('JobID {}: {} issued, {} in use'.format(job_id, issued, inuse))
+        return available
     
     def listener(self, path):
-        job_id = '.{}'.format(self.computer)
-        running = True
-        running_jobs = 0
-        while running:
-            for file in os.listdir(path):
-                if file.startswith(job_id):
-                    running_jobs += 1
-            if running_jobs > 0:
-                continue
-            else:
-                running = False
-            running_jobs = 0
+        wait_unlocked(path, self.computer)
         return 0
     
-    def ligprep(self, output_type='sd', nt=4, export_to='ligprep', options = [], kwarg_options= {}):
-        path = os.path.join(os.path.dirname(self.path), export_to)
+    def ligprep(self, output_type='sd', nt=4, export_to='ligprep', options = [], kwarg_options= {}, cost=None, resume=False, batch_size=1):
+        return aio.run(self.aligprep(output_type=output_type, nt=nt, export_to=export_to, options=options,
+                                     kwarg_options=kwarg_options, cost=cost, resume=resume, batch_size=batch_size))
+
+    async def aligprep(self, output_type='sd', nt=4, export_to='ligprep', options = [], kwarg_options= {}, cost=None, resume=False, batch_size=1):
+        await self.arun_stage('ligprep', nt=nt, export_to=export_to, cost=cost, resume=resume, output_type=output_type,
+                              options=options, kwarg_options=kwarg_options, batch_size=batch_size)
+
+    def run_stage(self, name, nt=4, export_to=None, cost=None, resume=False, **options):
+        return aio.run(self.arun_stage(name, nt=nt, export_to=export_to, cost=cost, resume=resume, **options))
+
+    async def arun_stage(self, name, nt=4, export_to=None, cost=None, resume=False, **options):
+        # runs a job type from the plugins registry over self.files; options go to the job type
+        job_type = plugins.get(name)(**options)
+        path = job_type.path(self, export_to)
         if not os.path.isdir(path):
             os.mkdir(path)
         os.chdir(path)
-        jobs = self.divide_files(nt)
-        job_params = []
-        for job_index, files in enumerate(jobs):
-            tmpdir = 'ligprep{}'.format(job_index)
-            subjob_params = {
-                'job_id':job_index,
-                'files':[os.path.join(self.path, file) for file in files],
-                'cmds':[],
-                'tmpdir':tmpdir,
-                'lic':'LIGPREP_MAIN'
-            }
-            if not os.path.isdir(tmpdir):
-                os.mkdir(tmpdir)
-            for file in files:
-                basename, ext = os.path.splitext(os.path.basename(file))
-                inp_option = '-i{}'.format(ext[1:])
-                out_option = '-o{}'.format(output_type)
-                out_file = '{}{}'.format(basename, '.{}'.format(output_type))
-                cmd = f'ligprep -HOST localhost:12 {inp_option} {file} {out_option} {out_file}'
-                for option in options:
-                    cmd = cmd + ' {}'.format(option)
-                for k, v in kwarg_options.items():
-                    cmd = cmd + ' {} {}'.format(k, str(v))
-                subjob_params['cmds'].append(cmd)
-            print(subjob_params['cmds'][0])
-            job_params.append(subjob_params)
-        print('There are {} subjobs'.format(nt))
-        tj = 0
-        for sj in job_params:
-            print('Subjob {} has {} jobs'.format(sj['job_id'], len(sj['files'])))
-            tj += len(sj['files'])
-        print('Total {} jobs to be completed.'.format(tj))
-        print('Launching ligprep job(s)...')
-        if nt > 1:
-            pool = mp.Pool(processes=nt)
-            results = pool.map(self.run_subjob, job_params)
-        else:
-            self.run_subjob(job_params[0])
-        print('ligprep complete.')
-        print('Cleaning...')
-        for job_param in job_params:
-            tmpdir = job_param['tmpdir']
-            for file in os.listdir(tmpdir):
-                src = os.path.join(tmpdir, file)
-                dest = os.path.join(path, file)
-                shutil.copy2(src, dest)
-                os.remove(src)
-            os.rmdir(tmpdir)
+        jobs = job_type.jobs(self, path)
+        print('Total {} jobs to be completed on {} workers.'.format(len(jobs), nt))
+        print('Launching {} job(s)...'.format(job_type.name))
+        collect = lambda job: job_type.collect(self, path, job)
+        await self.arun_jobs(jobs, nt=nt, cost=cost, collect=collect, name=job_type.name, path=path, resume=resume,
+                             runner=self.arun_foreground if job_type.foreground else None)
+        print('{} complete.'.format(job_type.name))
+        result = job_type.finish(self, path)
+        if self.campaign is not None:
+            self.campaign.add(job_type.name, path)
+        return result
+
+    def batches(self, batch_size):
+        files = [os.path.join(self.path, file) for file in self.files]
+        if batch_size <= 1:
+            return [{file: None} for file in files]
+        return batching.make_batches(files, batch_size)
+
+    @staticmethod
+    def batch_file(batch, job_index):
+        # the file a batch runs on and who owns each title in it; a batch of one runs on its input file as before.
+        # the combined file is only written by write_batch, as the job's setup
+        files = list(batch)
+        if len(files) == 1:
+            return os.path.basename(files[0]), None
+        file = 'batch{}{}'.format(job_index, batching.ext(files[0]))
+        owners = {title: os.path.basename(f)[:-len(batching.ext(f))] for (f, titles) in batch.items() for title in titles}
+        return file, owners
+
+    @staticmethod
+    def write_batch(batch, file):
+        def setup(tmpdir):
+            batching.write_batch(list(batch), os.path.join(tmpdir, file))
+        return setup
+
+    def collect_batch(self, job, path, split, suffix):
+        # combined results are split back into one file per input, named as a single-file run would name them
+        # and the combined output is only removed once every input has its results; the batch fails otherwise
+        outputs = []
+        if job.batch is not None:
+            tmpdir = os.path.abspath(job.tmpdir)
+            batch_in, batch_out, owners = job.batch
+            if not os.path.isfile(os.path.join(tmpdir, batch_out)):
+                raise RuntimeError('no {} written'.format(batch_out))
+            outputs += split(os.path.join(tmpdir, batch_out), owners, path, suffix)
+            os.remove(os.path.join(tmpdir, batch_out))
+            if os.path.isfile(os.path.join(tmpdir, batch_in)):
+                os.remove(os.path.join(tmpdir, batch_in))
+        return outputs + self.collect(job, path)
 
     @staticmethod
     def getPrepOut(file):
@@ -233,142 +385,112 @@ class MaestroWrapper:
         return f'prep_{base}.mae'
     
     @staticmethod
-    def mae2pdb(mae, pdb):
-        environ = os.environ.copy()
-        schrodinger = 'D:/Schrodinger2022-3'
-        pathlist = [schrodinger]
-        program_dirs = ['unxutils', 'utilities', 'tools']
-        for program_dir in program_dirs:
-            pathlist.append(os.path.join(schrodinger, program_dir))
-        environ['PATH'] += os.pathsep + os.pathsep.join(pathlist)
-        cmd = str('pdbconvert -noindex -imae ' + mae + ' -opdb ' + pdb)
-        process = subprocess.Popen(cmd.split(), shell=False, stdout=None, stderr=None, env=environ)
-        return pdb
+    def mae2pdb(mae, pdb, schrodinger=None):
+        from maestrowrapper import convert
+        return convert.mae2pdb(mae, pdb, schrodinger)
     
     def separate_mae(self, mae, basename=None, export_to=None):
-        n_structs = 0
-        with open(mae, 'r') as f:
-            lines = f.readlines()
-        for line in lines:
-            if line.startswith('f_m_ct'):
-                n_structs += 1
         if export_to is None:
             export_to = os.path.dirname(mae)
-        outs = []
-        for struct in range(1, n_structs+1):
-            cmd = 'maesubset -n {} {}'.format(struct, mae)
-            process = subprocess.Popen(cmd.split(), shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.environ)
-            stdout, stderr = process.communicate()
-            if basename is None:
-                base = os.path.splitext(os.path.basename(mae))[0]
-            else:
-                base = basename
-            out = os.path.join(export_to, '{}_{}.mae'.format(base, struct))
-            with open(out, 'w') as f:
-                f.write(stdout.decode())
-            outs.append(out)
-        return outs
-
-    def prepWizard(self, write_pdb=True, options=[], **kwargs):
+        if basename is None:
+            base = os.path.basename(mae)[:-len(batching.ext(mae))]
+        else:
+            base = basename
+        outs = {n: os.path.join(export_to, '{}_{}.mae'.format(base, n + 1)) for n in range(len(MAE(mae)))}
+        return write_structures(mae, outs)
+
+    @staticmethod
+    def subset(mae, structs, output):
+        # structs are 1-based, as for maesubset -n
+        return MAE(mae).subset([struct-1 for struct in structs], output)
+
+    def prepWizard(self, write_pdb=True, options=[], nt=4, cost=None, resume=False, **kwargs):
+        return aio.run(self.aprepWizard(write_pdb=write_pdb, options=options, nt=nt, cost=cost, resume=resume, **kwargs))
+
+    async def aprepWizard(self, write_pdb=True, options=[], nt=4, cost=None, resume=False, **kwargs):
         print('Starting PrepWizard on {} files...'.format(len(self.files)))
         _home = os.getcwd()
         os.chdir(self.path)
-        jobs = range(1, len(self.files)+1)  # Total jobs is number of files
-        self.total_jobs = len(self.files)
-        self.completed_jobs = 0
-        jobs = self.divide_files(4)
-        prepwizard_path = os.path.join(self.schrodinger, 'utilities', 'prepwizard.exe')
-        job_params = []
-        temp_dirs = []
-        for (job_index, files) in enumerate(jobs):
-            subjob_params = {
-                'job_id':job_index,
-                'files':[os.path.join(self.path, file) for file in files],
-                'cmds':[],
-                'tmpdir':'prepwizard{}'.format(job_index),
-                'lic':'MAESTRO_MAIN'
-            }
-            temp_dirs.append('prepwizard{}'.format(job_index))
-            for file in files:
-                cmd = '{} {} {}'.format(prepwizard_path, file, self.getPrepOut(file))
-                for option in options:
-                    cmd = cmd + ' {}'.format(option)
-                subjob_params['cmds'].append(cmd)
-            job_params.append(subjob_params)
-        pool = mp.Pool(processes=4)
-        print('Launching...')
-        results = pool.map(self.run_subjob, job_params)
-        print('PrepWizard complete.')
-        print('Cleaning...')
-        # cleanup 
         if not os.path.isdir('prepped_mae'):
             os.mkdir('prepped_mae')
         if not os.path.isdir('prepwizard_logs'):
             os.mkdir('prepwizard_logs')
-        for job_param in job_params:
-            tmpdir = job_param['tmpdir']
-            for file in os.listdir(tmpdir):
-                path = os.path.join(tmpdir, file)
-                if os.path.isdir(path):
-                    print(path, os.path.join('prepwizard_logs', file))
-                    shutil.copytree(path, os.path.join('prepwizard_logs', file))
-                    for f in os.listdir(path):
-                        os.remove(os.path.join(path, f))
-                    os.rmdir(path)
-                else:
-                    if file.endswith('log'):
-                        shutil.copy2(path, os.path.join('prepwizard_logs', file))
-                    if file.startswith('prep'):
-                        shutil.copy2(path, os.path.join('prepped_mae', file))
-                    os.remove(path)
-            os.rmdir(tmpdir)
+        jobs = [self.prepwizard_job(job_index, file, options) for (job_index, file) in enumerate(self.files)]
+        print('Launching...')
+        await self.arun_jobs(jobs, nt=nt, cost=cost, collect=self.collect_prepwizard, name='prepwizard', path=self.path, resume=resume)
+        print('PrepWizard complete.')
         prepped_mae = os.path.join(self.path, 'prepped_mae')
         if write_pdb:
             print('Writing PDBs...')
             prepped_pdb = os.path.join(self.path, 'prepped_pdb')
             if not os.path.isdir(prepped_pdb):
                 os.mkdir(prepped_pdb)
+            pairs = []
             for file in os.listdir(prepped_mae):
-                print(file)
                 if (file.startswith('prep')) and (file.endswith('mae')):
                     pdb_basename = os.path.splitext(os.path.basename(file))[0] + '.pdb'
                     mae = os.path.join(self.path, 'prepped_mae', file)
                     pdb = os.path.join(prepped_pdb, pdb_basename)
-                    self.mae2pdb(mae, pdb)
+                    pairs.append((mae, pdb))
+            from maestrowrapper import convert
+            await asyncio.to_thread(convert.mae2pdb_batch, pairs, nt=cpu_count() if nt == 'auto' else nt,
+                                    schrodinger=self.schrodinger)
+            print('Wrote {} PDBs.'.format(len(pairs)))
         self.path = os.path.join(self.path, 'prepped_mae')
         self._files = [file for file in os.listdir(self.path) if (file.startswith('prep')) and (file.endswith('mae'))]
         os.chdir(_home)
 
-    def concat(self, files=None, output='concat.mae'):
+    def prepwizard_job(self, job_index, file, options=[]):
+        prepwizard_path = os.path.join(self.schrodinger, 'utilities', 'prepwizard.exe')
+        cmd = '{} {} {}'.format(prepwizard_path, file, self.getPrepOut(file))
+        for option in options:
+            cmd = cmd + ' {}'.format(option)
+        return Job(job_index, cmd, files=[os.path.join(self.path, file)],
+                   tmpdir=os.path.join(self.path, 'prepwizard{}'.format(job_index)), lic='MAESTRO_MAIN')
+
+    def collect_prepwizard(self, job):
+        tmpdir = os.path.abspath(job.tmpdir)
+        logs = os.path.join(self.path, 'prepwizard_logs')
+        prepped = os.path.join(self.path, 'prepped_mae')
+        pairs = []
+        for file in os.listdir(tmpdir):
+            path = os.path.join(tmpdir, file)
+            if os.path.isdir(path):
+                pairs.append((path, os.path.join(logs, file)))
+                continue
+            dests = []
+            if self.stager.is_input(path, job.files):
+                os.remove(path)
+                continue
+            if file.endswith('log'):
+                dests.append(os.path.join(logs, file))
+            if file.startswith('prep'):
+                dests.append(os.path.join(prepped, file))
+            if not dests:
+                os.remove(path)
+                continue
+            # a file wanted in both places is linked into the first and moved into the last
+            for dest in dests[:-1]:
+                self.stager.place(path, dest)
+            pairs.append((path, dests[-1]))
+        outputs = self.stager.stage_out(pairs)
+        os.rmdir(tmpdir)
+        return outputs
+
+    def concat(self, files=None, output='concat.mae', nt=4):
         if files is None:
             files = self.files
         _home = os.getcwd()
         if not _home == self.path:
             os.chdir(self.path)
-        header = ['{' ,
-        's_m_m2io_version',
-        ':::',
-        '2.0.0 ',
-        '} ']
-        with open(output, 'w') as f:
-            for line in header:
-                f.write(f'{line}\n')
-            f.write('\n')
-            for file in files:
-                with open(file, 'r') as mae:
-                    contents = mae.readlines()
-                start = False
-                for line in contents:
-                    if line.startswith('f_m_ct {'):
-                        start = True
-                        f.write(line)
-                    elif start is False:
-                        continue
-                    else:
-                        f.write(line)
+        mae.concat(files, output, threads=nt)
         os.chdir(_home)
+        return output
 
-    def complex(self, files=None, protein='prep_protein.mae', export_to='complex'):
+    def complex(self, files=None, protein='prep_protein.mae', export_to='complex', nt=4):
+        return aio.run(self.acomplex(files=files, protein=protein, export_to=export_to, nt=nt))
+
+    async def acomplex(self, files=None, protein='prep_protein.mae', export_to='complex', nt=4):
         _home = os.getcwd()
         os.chdir(self.path)
         export_path = os.path.join(os.path.dirname(self.path), export_to)
@@ -377,199 +499,196 @@ class MaestroWrapper:
         os.chdir(self.path)
         if files is None:
             files = self.files
-        for file in files:
-            if file == protein:
-                continue
-            base = os.path.splitext(file)[0] + '_complex' + os.path.splitext(file)[-1]
-            out = os.path.join(export_path, base)
-            cmd = ['structcat', '-imae', protein, file, '-omae', out]
-            # print(' '.join(cmd))
-            process = subprocess.Popen(cmd, shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.environ)
-            process.communicate()
+        slots = asyncio.Semaphore(cpu_count() if nt == 'auto' else nt)
+
+        async def structcat(file):
+            async with slots:
+                return await self.structcat(protein, file, export_path)
+
+        await asyncio.gather(*[structcat(file) for file in files if file != protein])
         self.path = export_path
-        self.files = os.listdir(self.path)
+        self.files = self.listdir(self.path)
         os.chdir(_home)
     
+    async def structcat(self, protein, file, export_path):
+        base = os.path.splitext(os.path.basename(file))[0] + '_complex' + os.path.splitext(file)[-1]
+        out = os.path.join(export_path, base)
+        cmd = ['structcat', '-imae', protein, file, '-omae', out]
+        log = capture.JobLog(os.path.join(export_path, '.logs', '{}.out'.format(os.path.splitext(base)[0])),
+                             tail=self.executor.tail)
+        await capture.arun(cmd, self.path, log, env=self.environ, hang_timeout=self.executor.hang_timeout)
+        return out
+
     @staticmethod
     def getINP(job_name, mae):
         return inplib.get(job_name, mae)
 
     @staticmethod
     def writeINP(inp, out, **kwargs):
-        f = open(out, 'w')
-        for line in inp:
-            f.write(line)
-        for k, v in kwargs.items():
-            f.write(f'{k.upper()} {v} \n')
-        f.close()
-
-    def qikprop(self, export_to='qikprop', nt=4, options = []):
-        path = os.path.join(os.path.dirname(self.path), export_to)
-        if not os.path.isdir(path):
-            os.mkdir(path)
-        os.chdir(path)
-        jobs = self.divide_files(nt)
-        job_params = []
-        for job_index, files in enumerate(jobs):
-            tmpdir = 'primeMMGBSA{}'.format(job_index)
-            subjob_params = {
-                'job_id':job_index,
-                'files':[os.path.join(self.path, file) for file in files],
-                'cmds':[],
-                'tmpdir':tmpdir,
-                'lic':'QIKPROP_MAIN'
-            }
-            if not os.path.isdir(tmpdir):
-                os.mkdir(tmpdir)
-            for file in files:
-                cmd = f'qikprop -HOST localhost:12 {file}'
-                for option in options:
-                    if not option.startswith('-'):
-                        raise ValueError('needs to be a -flag')
-                    cmd = cmd + f' {option}'
-                subjob_params['cmds'].append(cmd)
-            job_params.append(subjob_params)
-        print('There are {} subjobs'.format(nt))
-        tj = 0
-        for sj in job_params:
-            print('Subjob {} has {} jobs'.format(sj['job_id'], len(sj['files'])))
-            tj += len(sj['files'])
-        print('Total {} jobs to be completed.'.format(tj))
-        print('Launching qikprop job(s)...')
-        if nt > 1:
-            pool = mp.Pool(processes=nt)
-            results = pool.map(self.run_subjob, job_params)
-        else:
-            self.run_subjob(job_params[0])
-        print('qikprop complete.')
-        print('Cleaning...')
-        for job_param in job_params:
-            tmpdir = job_param['tmpdir']
-            for file in os.listdir(tmpdir):
-                src = os.path.join(tmpdir, file)
-                dest = os.path.join(path, file)
-                shutil.copy2(src, dest)
-                os.remove(src)
-            os.rmdir(tmpdir)
-
-    def primeMMGBSA(self, export_to='primeMMGBSA', nt=4, schrod_kwargs={}):
-        path = os.path.join(self.path, export_to)
+        inplib.write(inp, out, **kwargs)
 
-        if not os.path.isdir(path):
-            os.mkdir(path)
-        os.chdir(path)
-        jobs = self.divide_files(nt)
-        job_params = []
-        for job_index, files in enumerate(jobs):
-            tmpdir = 'primeMMGBSA{}'.format(job_index)
-            subjob_params = {
-                'job_id':job_index,
-                'files':[os.path.join(self.path, file) for file in files],
-                'cmds':[],
-                'tmpdir':tmpdir,
-                'lic':'PSP_PLOP'
-            }
-            if not os.path.isdir(tmpdir):
-                os.mkdir(tmpdir)
-            for file in files:
-                basename = os.path.splitext(os.path.basename(file))[0]
-                inp = os.path.join(tmpdir, f'{basename}.inp')
-                self.writeINP(self.getINP('primeMMGBSA', file), inp, **schrod_kwargs)
-                cmd = f'prime_mmgbsa -HOST localhost:12 -prime_opt OPLS_VERSION=OPLS3e {os.path.basename(inp)}'
-                subjob_params['cmds'].append(cmd)
-            job_params.append(subjob_params)
-        print('There are {} subjobs'.format(nt))
-        tj = 0
-        for sj in job_params:
-            print('Subjob {} has {} jobs'.format(sj['job_id'], len(sj['files'])))
-            tj += len(sj['files'])
-        print('Total {} jobs to be completed.'.format(tj))
-        print('Launching primeMMGBSA job(s)...')
-        if nt > 1:
-            pool = mp.Pool(processes=nt)
-            results = pool.map(self.run_subjob, job_params)
-        else:
-            self.run_subjob(job_params[0])
-        print('primeMMGBSA complete.')
-        print('Cleaning...')
-        for job_param in job_params:
-            tmpdir = job_param['tmpdir']
-            for file in os.listdir(tmpdir):
-                src = os.path.join(tmpdir, file)
-                dest = os.path.join(path, file)
-                shutil.copy2(src, dest)
-                os.remove(src)
-            os.rmdir(tmpdir)
-        self.mmgbsa_path = path
-        self.path = path
-        self.mmgbsa_concat()
+    def qikprop(self, export_to='qikprop', nt=4, options = [], cost=None, resume=False, batch_size=1):
+        return aio.run(self.aqikprop(export_to=export_to, nt=nt, options=options, cost=cost, resume=resume,
+                                     batch_size=batch_size))
+
+    async def aqikprop(self, export_to='qikprop', nt=4, options = [], cost=None, resume=False, batch_size=1):
+        await self.arun_stage('qikprop', nt=nt, export_to=export_to, cost=cost, resume=resume, options=options,
+                              batch_size=batch_size)
+
+    def primeMMGBSA(self, export_to='primeMMGBSA', nt=4, schrod_kwargs={}, cost=None, resume=False):
+        return aio.run(self.aprimeMMGBSA(export_to=export_to, nt=nt, schrod_kwargs=schrod_kwargs, cost=cost, resume=resume))
+
+    async def aprimeMMGBSA(self, export_to='primeMMGBSA', nt=4, schrod_kwargs={}, cost=None, resume=False):
+        await self.arun_stage('primeMMGBSA', nt=nt, export_to=export_to, cost=cost, resume=resume,
+                              schrod_kwargs=schrod_kwargs)
+
+    def mmgbsa_job(self, job_index, file, path, schrod_kwargs={}):
+        return plugins.get('primeMMGBSA')(schrod_kwargs).job(job_index, file, path)
+
+    prime_mmgbsa = primeMMGBSA
+    aprime_mmgbsa = aprimeMMGBSA
 
     def prep(self, struct):
         pass
 
 
+    def collect_mmgbsa(self, job):
+        # results are appended as each job lands, so they can be queried mid-run
+        outputs = self.collect(job, self.mmgbsa_path)
+        for output in outputs:
+            if output.lower().endswith('.csv'):
+                self.results.ingest(output)
+        return outputs
+
     def mmgbsa_concat(self):
-        dfs = []
-        names = []
-        for file in os.listdir(self.mmgbsa_path):
-            if (file == 'mmgbsa_all.csv'):
-                continue
-            else:
-                if file.endswith('csv'):
-                    name = file.split('complex')[0][:-1]
-                    df = pd.read_csv(os.path.join(self.mmgbsa_path, file))
-                    if not df.empty:
-                        dfs.append(df)
-                        names.append(name)
-        df = pd.concat(dfs).reset_index(drop=True)
-        df['title'] = names
+        results = getattr(self, 'results', None)
+        if results is None or os.path.dirname(results.path) != os.path.abspath(self.mmgbsa_path):
+            self.results = results = ResultStore.for_stage(self.mmgbsa_path)
+        # only files that are new or changed since the last call are read
+        results.update(self.mmgbsa_path, exclude=('mmgbsa_all.csv',))
+        # mmgbsa_all.csv keeps its layout: the csvs' own columns, titled after the file they came from
+        # (prep_lig1 for prep_lig1_complex-out.csv). the store's keys and bookkeeping stay in SQLite
+        df = results.frame(order_by='source')
+        df = df.sort_values(['source', 'row'], kind='stable')
+        titles = [os.path.basename(source).split('complex')[0][:-1] for source in df['source']]
+        df = df.drop(columns=list(ResultStore.KEYS)).rename(columns={'csv_title': 'title'}).reset_index(drop=True)
+        df['title'] = titles
         print(df)
-        df.to_csv('mmgbsa_all.csv')
+        df.to_csv(os.path.join(self.mmgbsa_path, 'mmgbsa_all.csv'))
         return df
 
-    def fingerprint(self, complex=True):
+    def pipeline(self, protein='protein.mae', nt=None, tokens=None, options=[], schrod_kwargs={}, resume=False):
+        return aio.run(self.apipeline(protein=protein, nt=nt, tokens=tokens, options=options,
+                                      schrod_kwargs=schrod_kwargs, resume=resume))
+
+    async def apipeline(self, protein='protein.mae', nt=None, tokens=None, options=[], schrod_kwargs={}, resume=False):
+        # prepWizard -> complex -> primeMMGBSA, one structure at a time: a ligand goes on to structcat as soon as
+        # it and the protein are prepared, and to MM-GBSA as soon as its complex exists.
+        # nt and tokens are per stage, e.g. nt={'primeMMGBSA': 2}, tokens={'primeMMGBSA': 8}
+        nt = dict({'prepwizard': 4, 'complex': 4, 'primeMMGBSA': 4}, **(nt or {}))
+        tokens = tokens or {}
+        if protein not in self.files:
+            raise ValueError('{} is not among the input files'.format(protein))
+        root = self.path
+        prepped_mae = os.path.join(root, 'prepped_mae')
+        complex_path = os.path.join(root, 'complex')
+        mmgbsa_path = os.path.join(complex_path, 'primeMMGBSA')
+        for path in (prepped_mae, os.path.join(root, 'prepwizard_logs'), complex_path, mmgbsa_path):
+            if not os.path.isdir(path):
+                os.mkdir(path)
+        self.stager = Stager()
+        self.mmgbsa_path = mmgbsa_path
+        self.results = ResultStore.for_stage(mmgbsa_path)
+        journals = [Journal.for_stage(root), Journal.for_stage(mmgbsa_path)]
+        # licences are taken per stage by the pipeline, so the jobs themselves ask for none
+        prep = Scheduler(self.arun_job, nt=nt['prepwizard'], collect=self.collect_prepwizard, name='prepwizard',
+                         cache=self.cache, version=self.version, journal=journals[0], resume=resume, metrics=self.metrics)
+        mmgbsa = Scheduler(self.arun_job, nt=nt['primeMMGBSA'], collect=self.collect_mmgbsa, name='primeMMGBSA',
+                           cache=self.cache, version=self.version, journal=journals[1], resume=resume, metrics=self.metrics)
+        self.metrics.start('prepwizard', root)
+        self.metrics.start('primeMMGBSA', mmgbsa_path)
+        calls, poll_time = self.license_broker.num_calls(), self.license_broker.poll_seconds()
+        prepped_protein = asyncio.get_running_loop().create_future()
+        # job numbers, and so tmpdirs, follow the input file whichever order structures finish in
+        index = {file: n for (n, file) in enumerate(self.files)}
+
+        async def run(scheduler, job):
+            job.lic = None
+            job = await scheduler.asubmit(job)
+            if job.status != 0:
+                raise RuntimeError(job.status)
+            return job.outputs or []
+
+        async def prepare(file):
+            try:
+                outputs = await run(prep, self.prepwizard_job(index[file], file, options))
+                prepped = [os.path.join(prepped_mae, self.getPrepOut(file))]
+                prepped = [output for output in outputs if output in prepped] or \
+                    [output for output in prepped if os.path.isfile(output)]
+                if not prepped:
+                    raise RuntimeError('no {} written'.format(self.getPrepOut(file)))
+            except Exception as e:
+                if file == protein and not prepped_protein.done():
+                    prepped_protein.set_exception(e)
+                raise
+            if file == protein:
+                prepped_protein.set_result(prepped[0])
+                return None
+            index[prepped[0]] = index[file]
+            return prepped[0]
+
+        async def complex(ligand):
+            receptor = await asyncio.shield(prepped_protein)
+            out = await self.structcat(receptor, ligand, complex_path)
+            if not os.path.isfile(out):
+                raise RuntimeError('structcat wrote no {}'.format(os.path.basename(out)))
+            index[out] = index[ligand]
+            return out
+
+        async def mmgbsa_stage(complex):
+            return await run(mmgbsa, self.mmgbsa_job(index[complex], complex, mmgbsa_path, schrod_kwargs))
+
+        pipeline = Pipeline([Stage('prepwizard', prepare, nt['prepwizard'], 'MAESTRO_MAIN', tokens.get('prepwizard')),
+                             Stage('complex', complex, nt['complex']),
+                             Stage('primeMMGBSA', mmgbsa_stage, nt['primeMMGBSA'], 'PSP_PLOP', tokens.get('primeMMGBSA'))],
+                            licenses=self.licenses)
+        # the protein goes first so the ligands are not kept waiting on it
+        files = [protein] + [file for file in self.files if file != protein]
+        print('Starting pipeline on {} files...'.format(len(files)))
+        try:
+            await pipeline.run(files)
+        finally:
+            # read here in case no ligand got as far as waiting on the protein
+            if prepped_protein.done() and not prepped_protein.cancelled():
+                prepped_protein.exception()
+            for journal in journals:
+                journal.close()
+        print('pipeline: {}'.format(self.stager.report()))
+        for scheduler in (prep, mmgbsa):
+            self.metrics.finish(scheduler.name, cached=len(scheduler.cached), failed=len(scheduler.failed))
+        self.metrics.finish('pipeline', licadmin_calls=self.license_broker.num_calls() - calls,
+                            licadmin_seconds=round(self.license_broker.poll_seconds() - poll_time, 6))
+        self.path = complex_path
+        self.files = self.listdir(complex_path)
+        self.mmgbsa_concat()
+        if self.campaign is not None:
+            self.campaign.add('primeMMGBSA', mmgbsa_path)
+        return pipeline
+
+    def fingerprint(self, complex=True, nt=4, resume=False):
+        return aio.run(self.afingerprint(complex=complex, nt=nt, resume=resume))
+
+    async def afingerprint(self, complex=True, nt=4, resume=False):
         if complex:
-            self.complex()
-        _home = os.getcwd()
-        csvs = self.run_fingerprint(complex=complex)
-
-    def run_fingerprint(self, complex=True):
-        base_path = os.path.dirname(self.path)
-        fingerprint_path = os.path.join(base_path, 'fingerprint')
-        if not os.path.isdir(fingerprint_path):
-            os.mkdir(fingerprint_path)
-        for file in self.files:
-            src = os.path.join(self.path, file)
-            dest = os.path.join(fingerprint_path, file)
-            shutil.copy2(src, dest)
-        os.chdir(fingerprint_path)
-        outs = []
-        for file in os.listdir(os.getcwd()):
-            print('****************')
-            print(file)
-            base, _ = os.path.splitext(file)
-            out = '{}_fingerprint.csv'.format(base)
-            cmd = 'run interaction_fingerprints.py -i {} -ocsv {}'.format(file, out)
-            process = subprocess.Popen(cmd.split(), shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=self.environ)
-            stdout, stderr = process.communicate()
-            print(stdout.decode())
-            print(stderr.decode())
-            f = open(out, 'r')
-            contents = f.readlines()
-            f.close()
-            parts = contents[1].split(',')
-            parts[0] = base
-            line = ','.join(parts)
-            contents[1] = line
-            f = open(out, 'w')
-            for line in contents:
-                f.write(line)
-            f.close()
-            os.remove(file)
-            outs.append(out)
-            print('****************')
-        return outs
+            await self.acomplex(nt=nt)
+        self.fingerprints = await self.arun_fingerprint(nt=nt, resume=resume)
+        return self.fingerprints
+
+    def run_fingerprint(self, nt=4, resume=False, output='fingerprints.fpm'):
+        return aio.run(self.arun_fingerprint(nt=nt, resume=resume, output=output))
 
+    async def arun_fingerprint(self, nt=4, resume=False, output='fingerprints.fpm'):
+        return await self.arun_stage('fingerprint', nt=nt, resume=resume, output=output)
 
 
 # if __name__ == '__main__':
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+
+# where a job's wall-clock time goes, in the order it is spent
+PHASES = ('queue_wait', 'stage_in', 'licence_wait', 'launch', 'run', 'collect')
+PREFIX = 'maestrowrapper'
+# samples kept per stage and phase for percentiles; counts and totals cover every job
+MAX_SAMPLES = 10000
+
+
+def percentile(values, q):
+    import numpy as np
+    return float(np.percentile(values, q)) if len(values) else 0.0
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    # per-job timings go to a JSON-lines trace as they are recorded; each stage ends with a summary
+    # and a Prometheus text file. with no directory, both sit hidden in the stage's own directory.
+    # starting a stage again (a second qikprop on the same wrapper) starts its numbers from nothing
+
+    def __init__(self, directory=None, echo=True, max_samples=MAX_SAMPLES):
+        self.directory = os.path.abspath(directory) if directory is not None else None
+        self.echo = echo
+        self.max_samples = max_samples
+        self.samples = {}
+        self.totals = {}
+        self.counters = {}
+        self.paths = {}
+        self.started = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def files(self, stage):
+        path = self.directory if self.directory is not None else self.paths.get(stage)
+        if path is None:
+            return None, None
+        if self.directory is not None:
+            return os.path.join(path, '{}.jsonl'.format(stage)), os.path.join(path, '{}.prom'.format(stage))
+        return os.path.join(path, '.metrics.jsonl'), os.path.join(path, '.metrics.prom')
+
+    def start(self, stage, path=None):
+        with self._lock:
+            for table in (self.samples, self.totals, self.counters):
+                for key in [key for key in table if key[0] == stage]:
+                    del table[key]
+        self.paths[stage] = path
+        self.started[stage] = time.time()
+        if self.directory is not None and not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def trace(self, stage, record):
+        file, _ = self.files(stage)
+        if file is None:
+            return
+        with self._lock, open(file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def observe(self, stage, phase, seconds):
+        with self._lock:
+            self.samples.setdefault((stage, phase), deque(maxlen=self.max_samples)).append(seconds)
+            count, total = self.totals.get((stage, phase), (0, 0.0))
+            self.totals[(stage, phase)] = (count + 1, total + seconds)
+
+    def count(self, stage, name, n=1):
+        with self._lock:
+            self.counters[(stage, name)] = self.counters.get((stage, name), 0) + n
+
+    def record(self, stage, job, timings, **fields):
+        for phase, seconds in timings.items():
+            if seconds is not None:
+                self.observe(stage, phase, seconds)
+        self.count(stage, 'jobs')
+        record = {'t': time.time(), 'stage': stage, 'job': job.job_id, 'cmd': job.cmd,
+                  'host': getattr(job, 'host', None), 'status': job.status, 'cached': job.cached,
+                  'log': getattr(job, 'log', None)}
+        record.update(fields)
+        record['timings'] = {phase: round(seconds, 6) for (phase, seconds) in timings.items() if seconds is not None}
+        self.trace(stage, record)
+
+    def summary(self, stage):
+        phases = {}
+        for (name, phase), values in self.samples.items():
+            if name != stage:
+                continue
+            import numpy as np
+            values = np.asarray(values, dtype=float)
+            count, total = self.totals[(name, phase)]
+            phases[phase] = {'count': count, 'total': total, 'mean': total / count,
+                             'p50': percentile(values, 50), 'p95': percentile(values, 95), 'max': float(values.max())}
+        counters = {name: value for ((s, name), value) in self.counters.items() if s == stage}
+        wall = time.time() - self.started[stage] if stage in self.started else None
+        return {'stage': stage, 'wall': wall, 'phases': phases, 'counters': counters}
+
+    def report(self, stage):
+        summary = self.summary(stage)
+        if not summary['phases']:
+            # nothing timed (the pipeline as a whole only counts licadmin calls)
+            return '{}: {}'.format(stage, ', '.join('{} {}'.format(name, value)
+                                                   for (name, value) in sorted(summary['counters'].items())))
+        lines = ['{} timings over {} job(s){}:'.format(
+            stage, summary['counters'].get('jobs', 0),
+            ', {:.1f} s wall'.format(summary['wall']) if summary['wall'] is not None else '')]
+        order = list(PHASES) + sorted(set(summary['phases']) - set(PHASES))
+        for phase in order:
+            if phase in summary['phases']:
+                p = summary['phases'][phase]
+                lines.append('  {:<14} total {:9.2f} s  mean {:8.3f}  p50 {:8.3f}  p95 {:8.3f}  max {:8.3f}'.format(
+                    phase, p['total'], p['mean'], p['p50'], p['p95'], p['max']))
+        for name, value in sorted(summary['counters'].items()):
+            if name != 'jobs':
+                lines.append('  {:<14} {}'.format(name, value))
+        return '\n'.join(lines)
+
+    def prometheus(self, stage=None):
+        lines = ['# HELP {}_phase_seconds Time jobs spent in each phase'.format(PREFIX),
+                 '# TYPE {}_phase_seconds summary'.format(PREFIX)]
+        for (name, phase), values in sorted(self.samples.items()):
+            if stage is not None and name != stage:
+                continue
+            labels = 'stage="{}",phase="{}"'.format(label_value(name), label_value(phase))
+            for q in (0.5, 0.95):
+                lines.append('{}_phase_seconds{{{},quantile="{}"}} {}'.format(PREFIX, labels, q, percentile(values, q * 100)))
+            count, total = self.totals[(name, phase)]
+            lines.append('{}_phase_seconds_sum{{{}}} {}'.format(PREFIX, labels, total))
+            lines.append('{}_phase_seconds_count{{{}}} {}'.format(PREFIX, labels, count))
+        names = sorted({name for (_, name) in self.counters})
+        for name in names:
+            lines.append('# TYPE {}_{}_total counter'.format(PREFIX, name))
+            for (s, n), value in sorted(self.counters.items()):
+                if n == name and (stage is None or s == stage):
+                    lines.append('{}_{}_total{{stage="{}"}} {}'.format(PREFIX, name, label_value(s), value))
+        return '\n'.join(lines) + '\n'
+
+    def finish(self, stage, **counters):
+        for name, value in counters.items():
+            self.count(stage, name, value)
+        _, prom = self.files(stage)
+        if prom is not None:
+            with open(prom + '.tmp', 'w') as f:
+                f.write(self.prometheus(stage))
+            os.replace(prom + '.tmp', prom)
+        summary = self.summary(stage)
+        if summary['phases']:
+            self.trace(stage, dict(summary, t=time.time(), event='summary'))
+        if self.echo and (summary['phases'] or summary['counters']):
+            print(self.report(stage))
+        return summary
@@ -1 +1,48 @@
-import openmm
\ No newline at end of file
+import os
+
+from maestrowrapper import inplib
+from maestrowrapper.plugins import JobType
+from maestrowrapper.results import ResultStore
+from maestrowrapper.scheduler import Job
+
+
+class PrimeMMGBSA(JobType):
+    # results land in a ResultStore as each job is collected, and mmgbsa_all.csv is written at the end
+
+    name = 'primeMMGBSA'
+    lic = 'PSP_PLOP'
+    inp = 'primeMMGBSA'
+    sibling = False
+
+    def __init__(self, schrod_kwargs={}):
+        self.schrod_kwargs = schrod_kwargs
+
+    def job(self, job_index, file, path):
+        tmpdir = os.path.join(path, 'primeMMGBSA{}'.format(job_index))
+        basename = os.path.splitext(os.path.basename(file))[0]
+        inp = f'{basename}.inp'
+        text = inplib.text(inplib.get(self.inp, os.path.basename(file)), **self.schrod_kwargs)
+        cmd = f'prime_mmgbsa -HOST localhost:12 -prime_opt OPLS_VERSION=OPLS3e {inp}'
+
+        def setup(tmpdir):
+            with open(os.path.join(tmpdir, inp), 'w') as f:
+                f.write(text)
+        return Job(job_index, cmd, files=[file], tmpdir=tmpdir, lic=self.lic, extra=[text], setup=setup)
+
+    def jobs(self, mw, path):
+        mw.mmgbsa_path = path
+        mw.results = ResultStore.for_stage(path)
+        return [self.job(job_index, os.path.join(mw.path, file), path) for (job_index, file) in enumerate(mw.files)]
+
+    def file_job(self, mw, path, job_index, file):
+        if getattr(mw, 'mmgbsa_path', None) != path:
+            mw.mmgbsa_path = path
+            mw.results = ResultStore.for_stage(path)
+        return self.job(job_index, file, path)
+
+    def collect(self, mw, path, job):
+        return mw.collect_mmgbsa(job)
+
+    def finish(self, mw, path):
+        mw.path = path
+        return mw.mmgbsa_concat()
@@ -0,0 +1,144 @@
+import time
+import asyncio
+from collections import deque
+
+
+class Stage:
+    # func is a coroutine function taking one item and returning the item(s) for the next stage,
+    # or None when the item goes no further
+
+    def __init__(self, name, func, nt=4, lic=None, tokens=None):
+        self.name = name
+        self.func = func
+        self.nt = nt
+        self.lic = lic
+        self.tokens = tokens
+        self.running = 0
+        self.done = 0
+        self.failed = []
+        self.busy_time = 0.0
+        self._slots = None
+
+    def slots(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.nt)
+        return self._slots
+
+    def __repr__(self):
+        return 'Stage({!r}, nt={})'.format(self.name, self.nt)
+
+
+class Pipeline:
+    # every item moves on to the next stage as soon as it clears the current one;
+    # stages only limit how many items they work on at once, they never wait for each other
+
+    def __init__(self, stages, licenses=None, report_interval=30, name='pipeline'):
+        self.stages = list(stages)
+        self.licenses = licenses
+        self.report_interval = report_interval
+        self.name = name
+        self.results = []
+        self.started = None
+
+    @property
+    def failed(self):
+        return [(stage.name, item, error) for stage in self.stages for (item, error) in stage.failed]
+
+    def report(self):
+        parts = ['{} {} running/{} done/{} failed'.format(stage.name, stage.running, stage.done, len(stage.failed))
+                 for stage in self.stages]
+        print('{}: {}'.format(self.name, ', '.join(parts)))
+
+    async def step(self, stage, item):
+        async with stage.slots():
+            reservation = None
+            if stage.lic is not None and self.licenses is not None:
+                reservation = await self.licenses.acquire(stage.lic, stage.tokens)
+            stage.running += 1
+            start = time.time()
+            try:
+                return await stage.func(item)
+            finally:
+                stage.running -= 1
+                stage.busy_time += time.time() - start
+                if reservation is not None:
+                    await self.licenses.release(reservation)
+
+    async def flow(self, item, index=0):
+        if index == len(self.stages):
+            self.results.append(item)
+            return
+        stage = self.stages[index]
+        try:
+            outputs = await self.step(stage, item)
+        except Exception as e:
+            print('{} {} failed: {!r}'.format(stage.name, item, e))
+            stage.failed.append((item, repr(e)))
+            return
+        stage.done += 1
+        if outputs is None:
+            return
+        if not isinstance(outputs, (list, tuple)):
+            outputs = [outputs]
+        await asyncio.gather(*[self.flow(output, index + 1) for output in outputs])
+
+    async def run(self, items):
+        self.started = time.time()
+
+        async def report():
+            while True:
+                await asyncio.sleep(self.report_interval)
+                self.report()
+
+        reporter = asyncio.ensure_future(report())
+        try:
+            await asyncio.gather(*[self.flow(item) for item in items])
+        finally:
+            reporter.cancel()
+        self.report()
+        return self.results
+
+    async def stream(self, items, backlog=64):
+        # run for an async iterator that may never end (a FolderWatch): each item starts as it arrives, and
+        # the next is only asked for while fewer than backlog are in the pipeline, so a slow stage holds the
+        # source back rather than queuing without limit. only the last backlog results are kept
+        self.started = time.time()
+        self.results = deque(maxlen=backlog)
+        room = asyncio.Semaphore(backlog)
+        flows = set()
+
+        async def report():
+            while True:
+                await asyncio.sleep(self.report_interval)
+                self.report()
+
+        async def flow(item):
+            try:
+                await self.flow(item)
+            finally:
+                room.release()
+
+        reporter = asyncio.ensure_future(report())
+        items = items.__aiter__()
+        try:
+            while True:
+                await room.acquire()
+                try:
+                    item = await items.__anext__()
+                except StopAsyncIteration:
+                    room.release()
+                    break
+                task = asyncio.ensure_future(flow(item))
+                flows.add(task)
+                task.add_done_callback(flows.discard)
+            # the source is done; what was taken is seen through
+            if flows:
+                await asyncio.gather(*flows)
+        except asyncio.CancelledError:
+            for task in flows:
+                task.cancel()
+            raise
+        finally:
+            reporter.cancel()
+        self.report()
+        return self.results
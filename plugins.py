@@ -0,0 +1,97 @@
+import os
+import importlib
+
+from maestrowrapper import batching
+
+
+# job types MaestroWrapper can run by name, as 'module:class'. nothing is imported until a job type is used,
+# so heavy dependencies (numpy for fingerprints, pandas for results) only load for the stages that need them.
+# other packages add job types through the 'maestrowrapper.job_types' entry point group, or with register()
+REGISTRY = {
+    'ligprep': 'maestrowrapper.ligprep:LigPrep',
+    'qikprop': 'maestrowrapper.qikprop:QikProp',
+    'primeMMGBSA': 'maestrowrapper.mmgbsa:PrimeMMGBSA',
+    'fingerprint': 'maestrowrapper.fingerprint:InteractionFingerprints',
+}
+ENTRY_POINTS = 'maestrowrapper.job_types'
+_loaded = {}
+_entry_points_read = False
+
+
+class JobType:
+    # one kind of job run over every input file (or batch of them). subclasses take their options in
+    # __init__, build the jobs, collect each one as it lands and tidy up once all are done; an instance
+    # lives for one run, so it can keep state between collect and finish
+
+    name = None
+    lic = None
+    export_to = None
+    # outputs go beside the input directory (ligprep/, qikprop/) rather than inside it
+    sibling = True
+    # the command does its work before returning instead of handing it to job control
+    foreground = False
+
+    def path(self, mw, export_to=None):
+        base = os.path.dirname(mw.path) if self.sibling else mw.path
+        return os.path.join(base, export_to or self.export_to or self.name)
+
+    def jobs(self, mw, path):
+        raise NotImplementedError
+
+    def file_job(self, mw, path, job_index, file):
+        # one job for one input file, for job types fed a file at a time (MaestroWrapper.watch)
+        raise NotImplementedError('{} cannot take files one at a time'.format(self.name))
+
+    def collect(self, mw, path, job):
+        return mw.collect(job, path)
+
+    def products(self, outputs):
+        # which collected files the next stage of a watch takes as its inputs: structures, not logs
+        return [output for output in outputs if batching.ext(output) in batching.SD + batching.MAE_EXTS + batching.SMILES]
+
+    def finish(self, mw, path):
+        return None
+
+
+def register(name, target):
+    # target is a JobType subclass or a 'module:class' string, imported on first use
+    REGISTRY[name] = target
+    _loaded.pop(name, None)
+
+
+def read_entry_points():
+    global _entry_points_read
+    if _entry_points_read:
+        return
+    _entry_points_read = True
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return
+    try:
+        found = entry_points(group=ENTRY_POINTS)
+    except TypeError:
+        # python < 3.10
+        found = entry_points().get(ENTRY_POINTS, [])
+    for entry in found:
+        REGISTRY.setdefault(entry.name, entry.value)
+
+
+def names():
+    read_entry_points()
+    return sorted(REGISTRY)
+
+
+def get(name):
+    if name in _loaded:
+        return _loaded[name]
+    if name not in REGISTRY:
+        read_entry_points()
+    if name not in REGISTRY:
+        raise KeyError('no job type {!r}; known are {}'.format(name, ', '.join(names())))
+    target = REGISTRY[name]
+    if isinstance(target, str):
+        module, _, attribute = target.partition(':')
+        target = getattr(importlib.import_module(module), attribute)
+    _loaded[name] = target
+    return target
@@ -0,0 +1,38 @@
+import os
+
+from maestrowrapper import batching
+from maestrowrapper.plugins import JobType
+from maestrowrapper.scheduler import Job
+
+
+class QikProp(JobType):
+
+    name = 'qikprop'
+    lic = 'QIKPROP_MAIN'
+
+    def __init__(self, options=[], batch_size=1):
+        for option in options:
+            if not option.startswith('-'):
+                raise ValueError('needs to be a -flag')
+        self.options = options
+        self.batch_size = batch_size
+
+    def jobs(self, mw, path):
+        return [self.batch_job(mw, path, job_index, batch) for (job_index, batch) in enumerate(mw.batches(self.batch_size))]
+
+    def batch_job(self, mw, path, job_index, batch):
+        tmpdir = os.path.join(path, 'qikprop{}'.format(job_index))
+        file, owners = mw.batch_file(batch, job_index)
+        cmd = f'qikprop -HOST localhost:12 {file}'
+        for option in self.options:
+            cmd = cmd + f' {option}'
+        out_file = '{}.CSV'.format(file[:-len(batching.ext(file))])
+        return Job(job_index, cmd, files=list(batch), tmpdir=tmpdir, lic=self.lic,
+                   batch=(file, out_file, owners) if owners else None,
+                   setup=mw.write_batch(batch, file) if owners else None)
+
+    def file_job(self, mw, path, job_index, file):
+        return self.batch_job(mw, path, job_index, {file: None})
+
+    def collect(self, mw, path, job):
+        return mw.collect_batch(job, path, batching.split_csv, '.CSV')
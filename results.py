@@ -0,0 +1,181 @@
+import os
+import csv
+import time
+import sqlite3
+import threading
+
+
+def column_type(name):
+    # Schrodinger property names carry their type in the prefix. plain csv headers (QikProp's mol_MW, #stars)
+    # are NUMERIC, which keeps numbers numbers and anything else text
+    if name.startswith('r_'):
+        return 'REAL'
+    if name.startswith('i_') or name.startswith('b_'):
+        return 'INTEGER'
+    if name.startswith('s_') or name == 'csv_title':
+        return 'TEXT'
+    return 'NUMERIC'
+
+
+def convert(value, kind):
+    if value is None:
+        return None
+    value = value.strip()
+    if value == '' or value == '<>':
+        return None
+    try:
+        if kind == 'REAL':
+            return float(value)
+        if kind == 'INTEGER':
+            return int(value)
+        if kind == 'NUMERIC':
+            try:
+                return int(value)
+            except ValueError:
+                return float(value)
+    except ValueError:
+        pass
+    return value
+
+
+def quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def structure_title(file):
+    # one input is lig1.mae, prep_lig1.mae, prep_lig1_complex.mae, prep_lig1_complex-out.csv and
+    # prep_lig1_complex_fingerprint.csv on its way through the stages; all of them are lig1 in every
+    # store, so results from different stages join on it
+    base = os.path.splitext(os.path.basename(file))[0]
+    for suffix in ('_fingerprint', '-out', '_complex'):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+    if base.startswith('prep_'):
+        base = base[len('prep_'):]
+    return base
+
+
+class ResultStore:
+
+    KEYS = ('title', 'source', 'row', 'ingested')
+
+    def __init__(self, path, table='results', conn=None, lock=None):
+        self.path = os.path.abspath(path)
+        self.table = table
+        # several stores can share one database (and connection, and its lock), one table each
+        self._owns_conn = conn is None
+        # the connection is used from whichever thread is running the stage: aio.run moves the event loop
+        # to a worker thread inside Jupyter, and a new one for each call. the lock keeps it to one at a time
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False) if conn is None else conn
+        self.lock = lock if lock is not None else threading.RLock()
+        # readers can query the table while a run is still appending to it
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.lock, self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS {} (
+                title TEXT, source TEXT, row INTEGER, ingested REAL,
+                PRIMARY KEY (source, row))'''.format(quote(table)))
+            self.conn.execute('CREATE INDEX IF NOT EXISTS {} ON {} (title)'.format(
+                quote(table + '_title'), quote(table)))
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS files (
+                source TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, rows INTEGER)''')
+
+    @classmethod
+    def for_stage(cls, path):
+        return cls(os.path.join(path, '.results.sqlite'))
+
+    def close(self):
+        if self._owns_conn:
+            with self.lock:
+                self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def columns(self):
+        with self.lock:
+            return [row[1] for row in self.conn.execute('PRAGMA table_info({})'.format(quote(self.table)))]
+
+    def types(self):
+        with self.lock:
+            return {row[1]: row[2] for row in self.conn.execute('PRAGMA table_info({})'.format(quote(self.table)))}
+
+    def add_columns(self, names):
+        known = set(self.columns())
+        for name in names:
+            if name not in known:
+                with self.lock:
+                    self.conn.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                        quote(self.table), quote(name), column_type(name)))
+                known.add(name)
+
+    def index(self, name):
+        with self.lock, self.conn:
+            self.conn.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'.format(
+                quote('{}_{}'.format(self.table, name)), quote(self.table), quote(name)))
+
+    def ingested(self, file):
+        stat = os.stat(file)
+        with self.lock:
+            row = self.conn.execute('SELECT size, mtime_ns FROM files WHERE source = ?', (os.path.abspath(file),)).fetchone()
+        return row is not None and tuple(row) == (stat.st_size, stat.st_mtime_ns)
+
+    def ingest(self, file, title=None):
+        # a file is read once; rewriting it replaces its rows
+        source = os.path.abspath(file)
+        if self.ingested(source):
+            return 0
+        title = structure_title(file) if title is None else title
+        with open(source, 'r', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            rows = list(reader) if header is not None else []
+        # the file name is the key; a title column in the csv is kept under its own name
+        header = ['csv_title' if name in self.KEYS else name for name in (header or [])]
+        stat = os.stat(source)
+        now = time.time()
+        with self.lock, self.conn:
+            self.add_columns(header)
+            types = self.types()
+            kinds = [types[name] for name in header]
+            self.conn.execute('DELETE FROM {} WHERE source = ?'.format(quote(self.table)), (source,))
+            if header:
+                names = ', '.join(quote(name) for name in list(self.KEYS) + header)
+                marks = ', '.join('?' for _ in range(len(self.KEYS) + len(header)))
+                self.conn.executemany('INSERT INTO {} ({}) VALUES ({})'.format(quote(self.table), names, marks),
+                                      [[title, source, n, now] + [convert(value, kind) for (value, kind) in zip(row, kinds)]
+                                       + [None] * (len(header) - len(row))
+                                       for (n, row) in enumerate(rows) if any(value.strip() for value in row)])
+            self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                              (source, stat.st_size, stat.st_mtime_ns, len(rows)))
+        return len(rows)
+
+    def update(self, path, exclude=()):
+        # picks up whatever is new in a directory, e.g. after a resumed run
+        count = 0
+        for file in sorted(os.listdir(path)):
+            if file.lower().endswith('.csv') and not file.startswith('.') and file not in exclude:
+                count += self.ingest(os.path.join(path, file))
+        return count
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM {}'.format(quote(self.table))).fetchone()[0]
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def frame(self, where=None, params=(), order_by='title'):
+        import pandas as pd
+        sql = 'SELECT * FROM {}'.format(quote(self.table))
+        if where is not None:
+            sql += ' WHERE ' + where
+        if order_by is not None:
+            sql += ' ORDER BY {}'.format(quote(order_by))
+        with self.lock:
+            return pd.read_sql_query(sql, self.conn, params=params)
@@ -0,0 +1,322 @@
+import os
+import re
+import time
+import shutil
+import asyncio
+
+from maestrowrapper.tuning import Limit
+
+
+class Job:
+
+    def __init__(self, job_id, cmd, files=None, tmpdir=None, lic=None, cost=0, extra=None, batch=None, setup=None):
+        self.job_id = job_id
+        self.cmd = cmd
+        self.files = files if files is not None else []
+        self.tmpdir = tmpdir
+        self.lic = lic
+        self.cost = cost
+        # anything besides cmd and files that decides the job's outputs, e.g. an INP written into tmpdir
+        self.extra = extra if extra is not None else []
+        # (input, output, {title: basename}) when several input files run as one job
+        self.batch = batch
+        # called with the tmpdir once the inputs are staged, to write anything else the job reads there. jobs
+        # write nothing when built, so those skipped on resume or restored from the cache leave no empty tmpdir
+        self.setup = setup
+        self.key = None
+        self.cached = False
+        self.status = None
+        # whatever the runner returned from the worker, e.g. staging counts
+        self.stats = None
+        # whatever collect returned
+        self.outputs = None
+        # where the executor ran it
+        self.host = None
+        # seconds spent per phase, see metrics.PHASES
+        self.timings = {}
+        self.queued_at = None
+        # CPUs to ask job control for, when something other than the command's -HOST decides
+        self.slots = None
+        # the file its output was captured to, see capture.JobLog
+        self.log = None
+
+    def __repr__(self):
+        return 'Job({}, {!r})'.format(self.job_id, self.cmd)
+
+    def writes(self):
+        # inputs the command names twice, as input and output (ligprep -imae lig1.mae -omae lig1.mae)
+        names = [os.path.basename(token) for token in (self.cmd.split() if isinstance(self.cmd, str) else self.cmd)]
+        return {os.path.basename(file) for file in self.files if names.count(os.path.basename(file)) > 1}
+
+
+def count_atoms(file):
+    # atom counts are declared in the m_atom[N] table headers, so there is no need to parse the tables
+    atoms = 0
+    ext = os.path.splitext(file)[-1].lower()
+    if ext == '.mae':
+        pattern = re.compile(r'^\s*m_atom\[(\d+)\]')
+        with open(file, 'r') as f:
+            for line in f:
+                match = pattern.match(line)
+                if match:
+                    atoms += int(match.group(1))
+    elif ext in ('.sd', '.sdf', '.mol'):
+        with open(file, 'r') as f:
+            line_no = 0
+            for line in f:
+                # counts line is the fourth line of each record
+                if line_no == 3:
+                    atoms += int(line[:3] or 0)
+                line_no = 0 if line.startswith('$$$$') else line_no + 1
+    else:
+        atoms = os.path.getsize(file)
+    return atoms
+
+
+def estimate_cost(job, hint):
+    if hint is None:
+        return 0
+    if callable(hint):
+        return hint(job)
+    files = [file for file in job.files if os.path.isfile(file)]
+    if hint == 'size':
+        return sum(os.path.getsize(file) for file in files)
+    if hint == 'atoms':
+        return sum(count_atoms(file) for file in files)
+    raise ValueError('unknown cost hint {}'.format(hint))
+
+
+class Scheduler:
+
+    def __init__(self, runner, nt=4, cost=None, collect=None, report_interval=30, name='job', cache=None, version='',
+                 journal=None, resume=False, metrics=None, tuner=None):
+        self.runner = runner
+        self.nt = nt
+        # a tuning.AutoTuner, which sets nt and per-job CPU slots as the stage runs
+        self.tuner = tuner
+        self.cost = cost
+        self.collect = collect
+        self.cache = cache
+        self.version = version
+        self.journal = journal
+        self.metrics = metrics
+        self.resume = resume
+        self.resumed = []
+        self.cached = []
+        self.report_interval = report_interval
+        self.name = name
+        self.jobs = {}
+        self.queued = set()
+        self.running = {}
+        self.completed = []
+        self.failed = []
+        self.busy_time = 0.0
+        self.started = None
+        self._free = list(range(nt))
+
+    @property
+    def depth(self):
+        return len(self.queued)
+
+    @property
+    def utilisation(self):
+        if self.started is None:
+            return 0.0
+        elapsed = time.time() - self.started
+        if elapsed <= 0:
+            return 0.0
+        busy = self.busy_time + sum(time.time() - t for (_, t) in self.running.values())
+        return busy / (self.nt * elapsed)
+
+    def report(self):
+        print('{}: {} queued, {} running, {}/{} complete ({} cached), {} failed, utilisation {:.0%}'.format(
+            self.name, self.depth, len(self.running), len(self.completed), len(self.jobs),
+            len(self.cached), len(self.failed), self.utilisation))
+
+    def order(self, jobs):
+        for job in jobs:
+            job.cost = estimate_cost(job, self.cost) if self.cost is not None else job.cost
+        # longest jobs first, so the tail of the run is made of the cheap ones
+        return sorted(jobs, key=lambda job: job.cost, reverse=True)
+
+    def record(self, job, state, **kwargs):
+        if self.journal is not None:
+            self.journal.record(self.name, job, state, **kwargs)
+
+    def finish(self, job):
+        start = time.time()
+        outputs = self.collect(job) if self.collect is not None else None
+        job.timings['collect'] = time.time() - start
+        job.outputs = outputs
+        self.record(job, 'collected', outputs=outputs)
+        if self.metrics is not None:
+            self.metrics.record(self.name, job, job.timings)
+
+    def handle(self, event):
+        kind, job_id, worker_id, t, status, result = event
+        job = self.jobs[job_id]
+        if kind == 'start':
+            if job.queued_at is not None:
+                job.timings['queue_wait'] = t - job.queued_at
+            self.queued.discard(job_id)
+            self.running[job_id] = (worker_id, t)
+            self.record(job, 'running', t=t, worker=worker_id)
+            return
+        _, start = self.running.pop(job_id)
+        self.busy_time += t - start
+        job.status = status
+        job.stats = result
+        if isinstance(result, dict):
+            job.timings.update(result.get('timings', {}))
+        if self.tuner is not None:
+            self.tuner.observe(t)
+        if status == 0:
+            self.record(job, 'done', t=t, status=status)
+            try:
+                if self.cache is not None:
+                    self.cache.store(job.key, self.name, os.path.abspath(job.tmpdir))
+                self.finish(job)
+            except Exception as e:
+                # e.g. an output Windows still has open; this job fails, not the stage and the jobs beside it
+                status = job.status = 'collect failed: {!r}'.format(e)
+            else:
+                self.completed.append(job_id)
+        if status != 0:
+            # left uncollected, with its tmpdir and logs where they are, so resume runs it again
+            print('{} {} failed: {}'.format(self.name, job_id, status))
+            self.failed.append(job_id)
+            self.record(job, 'failed', t=t, status=status)
+            if self.metrics is not None:
+                self.metrics.record(self.name, job, job.timings)
+
+    def restore(self, job):
+        job.key = self.cache.key(job, self.name, self.version)
+        if self.cache.restore(job.key, os.path.abspath(job.tmpdir)) is None:
+            return False
+        job.cached = True
+        job.status = 0
+        self.queued.discard(job.job_id)
+        self.cached.append(job.job_id)
+        self.completed.append(job.job_id)
+        self.record(job, 'cached')
+        self.finish(job)
+        return True
+
+    def skip(self, job, states):
+        # on resume, collected jobs are skipped and finished-but-uncollected ones are collected now.
+        # anything else, failed jobs included, runs again in an emptied tmpdir, so nothing the earlier run left
+        # there (lock files, a log saying it failed) is taken for this run's
+        state, tmpdir = states.get(job.cmd, (None, None))
+        if state == 'collected':
+            job.status = 0
+            job.outputs = self.journal.outputs(self.name, job.cmd)
+        elif state == 'done' and tmpdir is not None and os.path.isdir(tmpdir):
+            # a job numbered differently this time (files fed in as they arrive) still has its outputs there
+            job.tmpdir = tmpdir
+            job.status = 0
+            self.finish(job)
+        else:
+            if job.tmpdir is not None and os.path.isdir(job.tmpdir):
+                shutil.rmtree(job.tmpdir)
+            return False
+        self.queued.discard(job.job_id)
+        self.resumed.append(job.job_id)
+        self.completed.append(job.job_id)
+        return True
+
+    def prepare(self, jobs):
+        # everything short of running: ordering, journal resume and cache hits. returns the jobs left to run
+        jobs = self.order(list(jobs))
+        now = time.time()
+        for job in jobs:
+            job.queued_at = now
+        self.jobs = {job.job_id: job for job in jobs}
+        self.queued.clear()
+        self.queued.update(self.jobs)
+        self.started = time.time()
+        if self.journal is not None:
+            if self.resume:
+                states = self.journal.states(self.name)
+                jobs = [job for job in jobs if not self.skip(job, states)]
+                print('{}: resuming, {} job(s) already complete'.format(self.name, len(self.resumed)))
+            self.journal.queue(self.name, jobs)
+        if self.cache is not None:
+            jobs = [job for job in jobs if not self.restore(job)]
+        return jobs
+
+    async def _arun_one(self, job, slots=None):
+        if slots is not None:
+            await slots.acquire()
+        worker_id = self._free.pop() if self._free else self.nt + len(self.running)
+        if self.tuner is not None:
+            job.slots = self.tuner.slots
+        self.handle(('start', job.job_id, worker_id, time.time(), None, None))
+        result = None
+        try:
+            result = await self.runner(job)
+            status = 0
+        except Exception as e:
+            status = repr(e)
+        finally:
+            if slots is not None:
+                slots.release()
+        if worker_id < self.nt:
+            self._free.append(worker_id)
+        self.handle(('done', job.job_id, worker_id, time.time(), status, result))
+        return job
+
+    async def arun(self, jobs):
+        # the runner is a coroutine function; nt bounds how many jobs are in flight on the loop
+        jobs = self.prepare(jobs)
+        # the tuner asks the licence broker, which may shell out to licadmin, so it runs off the loop
+        if self.tuner is not None:
+            self.nt = await asyncio.to_thread(self.tuner.start, len(jobs))
+            self._free = list(range(self.nt))
+        slots = Limit(self.nt)
+
+        async def report():
+            while True:
+                await asyncio.sleep(self.report_interval)
+                self.report()
+
+        async def tune():
+            while True:
+                await asyncio.sleep(self.tuner.interval)
+                nt = await asyncio.to_thread(self.tuner.adjust, len(self.running), self.depth)
+                # worker ids stay below nt, so a larger pool gets the new ones
+                busy = {worker_id for (worker_id, _) in self.running.values()}
+                self._free += [n for n in range(self.nt, nt) if n not in busy]
+                self._free = [n for n in self._free if n < nt]
+                self.nt = nt
+                slots.resize(nt)
+
+        tasks = [asyncio.ensure_future(report())]
+        if self.tuner is not None:
+            tasks.append(asyncio.ensure_future(tune()))
+        runs = [asyncio.ensure_future(self._arun_one(job, slots)) for job in jobs]
+        try:
+            await asyncio.gather(*runs)
+        finally:
+            for task in tasks + runs:
+                task.cancel()
+            # whatever stopped the stage, no job is still running on it once the caller closes the journal
+            pending = [run for run in runs if not run.done()]
+            if pending:
+                await asyncio.wait(pending)
+        self.report()
+        return [self.jobs[job_id] for job_id in self.completed]
+
+    async def asubmit(self, job):
+        # one job at a time, as a pipeline produces them; the caller bounds concurrency
+        if self.started is None:
+            self.started = time.time()
+        self.jobs[job.job_id] = job
+        self.queued.add(job.job_id)
+        job.queued_at = time.time()
+        if self.journal is not None:
+            if self.resume and self.skip(job, self.journal.states(self.name)):
+                return job
+            self.journal.queue(self.name, [job])
+        if self.cache is not None and self.restore(job):
+            return job
+        return await self._arun_one(job)
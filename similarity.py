@@ -0,0 +1,156 @@
+import numpy as np
+
+
+if hasattr(np, 'bitwise_count'):
+    bit_counts = np.bitwise_count
+else:
+    _BYTE_COUNTS = np.array([bin(n).count('1') for n in range(256)], dtype=np.uint8)
+
+    def bit_counts(words):
+        # numpy < 2.0 has no popcount ufunc, so bytes are counted from a table
+        words = np.ascontiguousarray(words, dtype='<u8')
+        return _BYTE_COUNTS[words.view(np.uint8)].reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def popcount(words):
+    # on-bits per row of a packed (rows, words) matrix
+    return bit_counts(words).sum(axis=-1, dtype=np.int64)
+
+
+def as_packed(fingerprints):
+    # a FingerprintMatrix or a bare packed array
+    packed = getattr(fingerprints, 'packed', fingerprints)
+    return np.asarray(packed, dtype='<u8')
+
+
+def intersection(queries, database):
+    # common on-bits for every (query, database) pair, accumulated one word column at a time
+    # so the temporaries never exceed len(queries) x len(database)
+    common = np.zeros((len(queries), len(database)), dtype=np.uint32)
+    words = np.empty((len(queries), len(database)), dtype='<u8')
+    for w in range(queries.shape[1]):
+        np.bitwise_and(queries[:, w, None], database[None, :, w], out=words)
+        common += bit_counts(words)
+    return common
+
+
+def score(common, a, b, metric='tanimoto', alpha=1.0, beta=1.0):
+    # a and b are the on-bit counts of the query side and the database side
+    if metric == 'tanimoto':
+        union = a + b - common
+    elif metric == 'tversky':
+        union = alpha * (a - common) + beta * (b - common) + common
+    else:
+        raise ValueError('unknown metric {}'.format(metric))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sims = common / union
+    # two empty fingerprints are identical
+    return np.where(union > 0, sims, 1.0)
+
+
+def block_similarity(queries, database, metric='tanimoto', alpha=1.0, beta=1.0, query_counts=None, counts=None):
+    queries = np.atleast_2d(queries)
+    query_counts = popcount(queries) if query_counts is None else query_counts
+    counts = popcount(database) if counts is None else counts
+    return score(intersection(queries, database), query_counts[:, None], counts[None, :], metric, alpha, beta)
+
+
+def similarity(query, fingerprints, metric='tanimoto', alpha=1.0, beta=1.0, block=65536):
+    database = as_packed(fingerprints)
+    query = np.asarray(query, dtype='<u8').reshape(1, -1)
+    query_counts = popcount(query)
+    sims = np.empty(len(database), dtype=np.float64)
+    for start in range(0, len(database), block):
+        sims[start:start + block] = block_similarity(query, database[start:start + block], metric, alpha, beta,
+                                                     query_counts)[0]
+    return sims
+
+
+def top_k(query, fingerprints, k=10, metric='tanimoto', alpha=1.0, beta=1.0, block=65536):
+    # only k candidates are carried between blocks, so memory does not grow with the database
+    database = as_packed(fingerprints)
+    query = np.asarray(query, dtype='<u8').reshape(1, -1)
+    query_counts = popcount(query)
+    best = np.empty(0, dtype=np.int64)
+    best_sims = np.empty(0, dtype=np.float64)
+    for start in range(0, len(database), block):
+        sims = block_similarity(query, database[start:start + block], metric, alpha, beta, query_counts)[0]
+        index = np.concatenate([best, np.arange(start, start + len(sims))])
+        sims = np.concatenate([best_sims, sims])
+        if len(sims) > k:
+            keep = np.argpartition(-sims, k - 1)[:k]
+            index, sims = index[keep], sims[keep]
+        best, best_sims = index, sims
+    order = np.lexsort((best, -best_sims))
+    return best[order], best_sims[order]
+
+
+def pairwise(fingerprints, block=256, metric='tanimoto', alpha=1.0, beta=1.0):
+    # yields (row offset, column offset, scores) for the blocks on and above the diagonal;
+    # Tversky is not symmetric, so its lower blocks are yielded too
+    database = as_packed(fingerprints)
+    counts = popcount(database)
+    symmetric = metric == 'tanimoto' or alpha == beta
+    for i in range(0, len(database), block):
+        rows = np.ascontiguousarray(database[i:i + block])
+        for j in range(i if symmetric else 0, len(database), block):
+            yield i, j, block_similarity(rows, database[j:j + block], metric, alpha, beta,
+                                         counts[i:i + block], counts[j:j + block])
+
+
+def similarity_matrix(fingerprints, block=256, metric='tanimoto', alpha=1.0, beta=1.0):
+    n = len(as_packed(fingerprints))
+    sims = np.empty((n, n), dtype=np.float32)
+    for i, j, values in pairwise(fingerprints, block, metric, alpha, beta):
+        sims[i:i + values.shape[0], j:j + values.shape[1]] = values
+        if metric == 'tanimoto' or alpha == beta:
+            sims[j:j + values.shape[1], i:i + values.shape[0]] = values.T
+    return sims
+
+
+def neighbours(fingerprints, threshold, block=256, metric='tanimoto'):
+    # (i, j, score) for every pair i < j at or above threshold
+    parts = []
+    for i, j, values in pairwise(fingerprints, block, metric):
+        a, b = np.nonzero(values >= threshold)
+        keep = a + i < b + j
+        a, b = a[keep], b[keep]
+        parts.append((a + i, b + j, values[a, b]))
+    if not parts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    return tuple(np.concatenate(part) for part in zip(*parts))
+
+
+def leader_cluster(fingerprints, threshold=0.7, block=512, metric='tanimoto', alpha=1.0, beta=1.0):
+    # each pose joins its most similar leader at or above threshold, or leads a new cluster.
+    # only the leaders' fingerprints are kept, never the similarity matrix
+    database = as_packed(fingerprints)
+    counts = popcount(database)
+    labels = np.empty(len(database), dtype=np.int64)
+    leaders = np.empty(0, dtype=np.int64)
+    for start in range(0, len(database), block):
+        rows = np.ascontiguousarray(database[start:start + block])
+        row_counts = counts[start:start + block]
+        assigned = np.zeros(len(rows), dtype=bool)
+        if len(leaders):
+            sims = block_similarity(rows, database[leaders], metric, alpha, beta, row_counts, counts[leaders])
+            nearest = sims.argmax(axis=1)
+            assigned = sims[np.arange(len(rows)), nearest] >= threshold
+            labels[start:start + len(rows)][assigned] = nearest[assigned]
+        # the rest are settled in order against the leaders this block adds
+        rest = np.nonzero(~assigned)[0]
+        if not len(rest):
+            continue
+        sims = block_similarity(rows[rest], rows[rest], metric, alpha, beta, row_counts[rest], row_counts[rest])
+        new = []
+        for n in range(len(rest)):
+            if new:
+                candidates = sims[n, new]
+                nearest = candidates.argmax()
+                if candidates[nearest] >= threshold:
+                    labels[start + rest[n]] = len(leaders) + nearest
+                    continue
+            labels[start + rest[n]] = len(leaders) + len(new)
+            new.append(n)
+        leaders = np.concatenate([leaders, start + rest[new]])
+    return labels, leaders
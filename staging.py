@@ -0,0 +1,124 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, file)) for (root, _, files) in os.walk(path) for file in files)
+    return os.path.getsize(path)
+
+
+class Stager:
+
+    def __init__(self, threads=4):
+        self.threads = threads
+        self.stats = {'linked': 0, 'moved': 0, 'copied': 0, 'files': 0}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def count(self, kind, nbytes):
+        with self._lock:
+            self.stats[kind] += nbytes
+            self.stats['files'] += 1
+
+    def add(self, stats):
+        with self._lock:
+            for key, value in stats.items():
+                self.stats[key] = self.stats.get(key, 0) + value
+
+    @staticmethod
+    def _clear(dest):
+        if os.path.islink(dest) or os.path.isfile(dest):
+            os.remove(dest)
+
+    def place(self, src, dest, copy=False):
+        # inputs are only read by the jobs, so a link is as good as a copy. one the job also writes to (ligprep
+        # -imae lig1.mae -omae lig1.mae) is copied, since writing through a hard or symbolic link would
+        # overwrite the original, or the cache object it is linked to
+        nbytes = size(src)
+        self._clear(dest)
+        if copy:
+            shutil.copy2(src, dest)
+            self.count('copied', nbytes)
+            return dest
+        try:
+            os.link(src, dest)
+            self.count('linked', nbytes)
+            return dest
+        except OSError:
+            pass
+        try:
+            os.symlink(os.path.abspath(src), dest)
+            self.count('linked', nbytes)
+            return dest
+        except OSError:
+            pass
+        shutil.copy2(src, dest)
+        self.count('copied', nbytes)
+        return dest
+
+    def move(self, src, dest):
+        nbytes = size(src)
+        if os.path.isdir(src) and os.path.isdir(dest):
+            # merge into an existing directory one entry at a time
+            for name in os.listdir(src):
+                self.move(os.path.join(src, name), os.path.join(dest, name))
+            os.rmdir(src)
+            return dest
+        if os.path.exists(dest) and os.path.samefile(src, dest):
+            # a linked input coming back to where it was staged from
+            os.remove(src)
+            self.count('linked', nbytes)
+            return dest
+        try:
+            os.replace(src, dest)
+            self.count('moved', nbytes)
+        except OSError:
+            # across filesystems
+            self._clear(dest)
+            shutil.move(src, dest)
+            self.count('copied', nbytes)
+        return dest
+
+    @staticmethod
+    def is_input(path, files):
+        # a staged input, still linked to the file it came from. collect removes these from the tmpdir instead
+        # of moving them into the stage's directory
+        name = os.path.basename(path)
+        for file in files:
+            if os.path.basename(file) == name:
+                try:
+                    return os.path.samefile(path, file)
+                except OSError:
+                    return False
+        return False
+
+    def map(self, func, pairs):
+        if len(pairs) <= 1 or self.threads <= 1:
+            return [func(src, dest) for (src, dest) in pairs]
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            return list(pool.map(lambda pair: func(*pair), pairs))
+
+    def stage_in(self, files, dest, writes=()):
+        # writes are the names of inputs the job overwrites, which get a copy of their own
+        if not os.path.isdir(dest):
+            os.mkdir(dest)
+        return self.map(lambda src, dest: self.place(src, dest, os.path.basename(src) in writes),
+                        [(file, os.path.join(dest, os.path.basename(file))) for file in files])
+
+    def stage_out(self, pairs):
+        return self.map(self.move, pairs)
+
+    def report(self):
+        return '{} file(s) staged: {:.1f} MB linked, {:.1f} MB moved, {:.1f} MB copied'.format(
+            self.stats['files'], self.stats['linked'] / 1e6, self.stats['moved'] / 1e6, self.stats['copied'] / 1e6)
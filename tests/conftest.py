@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import importlib.util
+
+import pytest
+
+# the repository is the maestrowrapper package itself, so it is imported from here under that name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if 'maestrowrapper' not in sys.modules:
+    spec = importlib.util.spec_from_file_location('maestrowrapper', os.path.join(ROOT, '__init__.py'),
+                                                  submodule_search_locations=[ROOT])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['maestrowrapper'] = module
+    spec.loader.exec_module(module)
+
+from maestrowrapper.benchmarks import fake_schrodinger
+from maestrowrapper.benchmarks.synthetic import write_ligands
+
+
+class Fake:
+    # benchmarks/fake_schrodinger installed under tmp_path, with a licence pool and a directory of ligands
+
+    def __init__(self, root, pool, tokens=None):
+        self.root = str(root)
+        self.schrodinger = os.path.join(self.root, 'schrodinger')
+        self.state = os.path.join(self.root, 'licences')
+        self.inputs = os.path.join(self.root, 'inputs')
+        fake_schrodinger.install(self.schrodinger, self.state, pool, tokens)
+
+    def ligands(self, n):
+        return write_ligands(self.inputs, n, n_atoms=10)
+
+    def used(self):
+        with open(os.path.join(self.state, 'pool.json'), 'r') as f:
+            return json.load(f)['used']
+
+    def jobs(self):
+        # how job control recorded each job ending
+        records = []
+        for name in os.listdir(os.path.join(self.state, 'jobs')):
+            with open(os.path.join(self.state, 'jobs', name), 'r') as f:
+                records.append(json.load(f))
+        return records
+
+    def peak(self, lic):
+        used = peak = 0
+        with open(os.path.join(self.state, 'usage.log'), 'r') as f:
+            for line in f:
+                _, name, tokens = line.split()
+                if name == lic:
+                    used += int(tokens)
+                    peak = max(peak, used)
+        return peak
+
+    def tmpdirs(self, path, name):
+        # job tmpdirs left in a stage's directory
+        return [d for d in os.listdir(path) if d.startswith(name) and os.path.isdir(os.path.join(path, d))]
+
+    def wrapper(self, path=None, **kwargs):
+        from maestrowrapper import MaestroWrapper
+        mw = MaestroWrapper(self.schrodinger, path=path or self.inputs, **kwargs)
+        mw.metrics.echo = False
+        return mw
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    pool = {'LIGPREP_MAIN': 8, 'QIKPROP_MAIN': 8, 'MAESTRO_MAIN': 8, 'PSP_PLOP': 64}
+    fake = Fake(tmp_path, pool, {'PSP_PLOP': 8})
+    # MaestroWrapper copies the environment when it is made, so these go in first
+    monkeypatch.setenv('COMPUTERNAME', 'TESTPC')
+    monkeypatch.setenv('FAKE_STATE', fake.state)
+    monkeypatch.setenv('FAKE_RUNTIME', 'fixed:0.2')
+    monkeypatch.setenv('FAKE_SCALE', '1')
+    monkeypatch.setenv('FAKE_FAIL', '0')
+    monkeypatch.setenv('FAKE_HANG', '0')
+    monkeypatch.delenv('SCHRODINGER', raising=False)
+    # stages chdir into their output directory
+    monkeypatch.chdir(fake.root)
+    return fake
@@ -0,0 +1,60 @@
+import os
+import gzip
+
+import pytest
+
+from maestrowrapper import batching
+from maestrowrapper.mae import MAE, is_compressed
+
+
+def titles(path, suffix):
+    return {f[:-len(suffix)]: [structure.title for structure in MAE(os.path.join(path, f))]
+            for f in os.listdir(path) if f.endswith(suffix)}
+
+
+def test_batches_keep_titles_unique(tmp_path, fake):
+    files = fake.ligands(5)
+    # a second file with lig1's title goes in another batch
+    with open(files[0], 'r') as f, open(os.path.join(fake.inputs, 'again.mae'), 'w') as out:
+        out.write(f.read())
+    batches = batching.make_batches(files + [os.path.join(fake.inputs, 'again.mae')], 3)
+    assert [len(batch) for batch in batches] == [3, 3]
+    for batch in batches:
+        owned = [title for titles in batch.values() for title in titles]
+        assert len(owned) == len(set(owned))
+
+
+def test_split_refuses_a_short_batch(tmp_path, fake):
+    files = fake.ligands(3)
+    out = batching.write_batch(files[:2], str(tmp_path / 'batch0.mae'))
+    owners = {'lig1': 'lig1', 'lig2': 'lig2', 'lig3': 'lig3'}
+    with pytest.raises(RuntimeError, match='lig3'):
+        batching.split_structures(out, owners, str(tmp_path), '.mae')
+    assert not os.path.exists(str(tmp_path / 'lig1.mae'))
+
+
+@pytest.mark.parametrize('output_type', ['mae', 'maegz', 'sd'])
+def test_ligprep_batches_split_back(fake, output_type):
+    fake.ligands(5)
+    mw = fake.wrapper()
+    mw.ligprep(nt=2, output_type=output_type, batch_size=2)
+    assert len(fake.jobs()) == 3
+    ligprep = os.path.join(fake.root, 'ligprep')
+    outputs = sorted(f for f in os.listdir(ligprep) if f.endswith('.' + output_type))
+    assert outputs == ['lig{}.{}'.format(n, output_type) for n in range(1, 6)]
+    if output_type != 'sd':
+        suffix = '.' + output_type
+        assert titles(ligprep, suffix) == {'lig{}'.format(n): ['lig{}'.format(n)] for n in range(1, 6)}
+        assert all(is_compressed(os.path.join(ligprep, f)) == (output_type == 'maegz') for f in outputs)
+
+
+def test_compressed_inputs_batch(fake):
+    for file in fake.ligands(4):
+        with open(file, 'rb') as f, gzip.open(file + '.gz', 'wb') as out:
+            out.write(f.read())
+        os.remove(file)
+    mw = fake.wrapper()
+    mw.qikprop(nt=2, batch_size=2)
+    qikprop = os.path.join(fake.root, 'qikprop')
+    assert sorted(f for f in os.listdir(qikprop) if f.endswith('.CSV')) == ['lig{}.CSV'.format(n) for n in range(1, 5)]
+    assert fake.tmpdirs(qikprop, 'qikprop') == []
@@ -0,0 +1,22 @@
+import os
+
+from maestrowrapper.cache import ResultCache
+
+
+def test_cache_restores_without_running(fake):
+    fake.ligands(3)
+    cache = os.path.join(fake.root, 'cache')
+    mw = fake.wrapper(cache=cache)
+    mw.ligprep(nt=2, output_type='mae')
+    assert len(fake.jobs()) == 3
+
+    ligprep = os.path.join(fake.root, 'ligprep')
+    for file in os.listdir(ligprep):
+        if file.endswith('.mae'):
+            os.remove(os.path.join(ligprep, file))
+    mw = fake.wrapper(cache=ResultCache(cache))
+    mw.ligprep(nt=2, output_type='mae')
+    assert len(fake.jobs()) == 3
+    assert mw.metrics.summary('ligprep')['counters']['cached'] == 3
+    assert sorted(f for f in os.listdir(ligprep) if f.endswith('.mae')) == ['lig1.mae', 'lig2.mae', 'lig3.mae']
+    assert fake.tmpdirs(ligprep, 'ligprep') == []
@@ -0,0 +1,34 @@
+import os
+import asyncio
+import threading
+
+from maestrowrapper.campaign import Campaign
+
+
+def test_ingest_from_inside_a_running_loop(fake):
+    fake.ligands(3)
+    campaign = Campaign(fake.root)
+    mw = fake.wrapper(campaign=campaign)
+    threads = []
+    add = campaign.add
+
+    def record(stage, path):
+        threads.append(threading.current_thread())
+        return add(stage, path)
+
+    campaign.add = record
+
+    async def notebook():
+        # the sync API called from a cell: aio.run gives it a loop on a thread of its own
+        mw.qikprop(nt=2)
+
+    asyncio.run(notebook())
+    assert threads and threads[0] is not threading.main_thread()
+    # the connection made on the main thread was written from that one, and is read back here
+    assert campaign.count()['qikprop'] == 3
+    assert campaign.titles() == ['lig1', 'lig2', 'lig3']
+    assert len(list(campaign.select())) == 3
+    campaign.close()
+
+    with Campaign(os.path.join(fake.root, 'campaign.sqlite')) as reopened:
+        assert reopened.titles() == ['lig1', 'lig2', 'lig3']
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from maestrowrapper.convert import mae2pdb, mae2pdb_batch, native_mae2pdb
+from maestrowrapper.benchmarks.synthetic import write_mae
+
+
+COMPLEX = '''{
+ s_m_m2io_version
+ :::
+ 2.0.0
+}
+
+f_m_ct {
+ s_m_title
+ :::
+ cpx
+ m_atom[3] {
+  # First column is atom index #
+  r_m_x_coord
+  r_m_y_coord
+  r_m_z_coord
+  i_m_atomic_number
+  s_m_pdb_atom_name
+  s_m_pdb_residue_name
+  s_m_chain_name
+  i_m_residue_number
+  i_m_formal_charge
+  :::
+  1 1.000000 2.000000 3.000000 7 " N  " ALA A 12 0
+  2 -1.500000 0.250000 10.125000 6 <> LIG B 301 0
+  3 0.000000 0.000000 0.000000 8 " O1 " LIG B 301 -1
+  :::
+ }
+ m_bond[2] {
+  i_m_from
+  i_m_to
+  i_m_order
+  :::
+  1 1 2 1
+  2 2 3 1
+  :::
+ }
+}
+'''
+
+
+def test_native_records_are_fixed_columns(tmp_path):
+    mae = tmp_path / 'cpx.mae'
+    mae.write_text(COMPLEX)
+    pdb = native_mae2pdb(str(mae), str(tmp_path / 'cpx.pdb'))
+    lines = open(pdb).read().splitlines()
+    assert lines[0] == 'TITLE     cpx'
+    atom, carbon, oxygen = lines[1:4]
+    assert atom.startswith('ATOM      1  N   ALA A  12 ')
+    # no PDB name: the element, right-aligned in columns 13-14
+    assert carbon[:26] == 'HETATM    2  C   LIG B 301'
+    assert oxygen[12:16] == ' O1 '
+    assert float(carbon[30:38]) == -1.5 and float(carbon[38:46]) == 0.25 and float(carbon[46:54]) == 10.125
+    assert carbon[76:78] == ' C'
+    assert oxygen[76:80] == ' O1-'
+    # only bonds that touch a HETATM are written
+    assert lines[4:] == ['CONECT    2    1    3', 'CONECT    3    2', 'END']
+
+
+def test_multi_structure_files_fall_back_to_pdbconvert(tmp_path, monkeypatch):
+    mae = write_mae(str(tmp_path / 'poses.mae'), 2, 5)
+    calls = []
+    monkeypatch.setattr('maestrowrapper.convert.pdbconvert', lambda mae, pdb, schrodinger=None: calls.append(mae) or pdb)
+    assert mae2pdb(mae, str(tmp_path / 'poses.pdb')) == str(tmp_path / 'poses.pdb')
+    assert calls == [mae]
+    assert not os.path.exists(tmp_path / 'poses.pdb')
+
+
+def test_missing_coordinates_are_refused(tmp_path):
+    mae = tmp_path / 'bare.mae'
+    mae.write_text('{\n s_m_m2io_version\n :::\n 2.0.0\n}\n\nf_m_ct {\n s_m_title\n :::\n bare\n}\n')
+    with pytest.raises(ValueError):
+        native_mae2pdb(str(mae), str(tmp_path / 'bare.pdb'))
+
+
+def test_batch_converts_every_pair(tmp_path):
+    pairs = []
+    for i in range(3):
+        mae = write_mae(str(tmp_path / 'lig{}.mae'.format(i)), 1, 10 + i, seed=i)
+        pairs.append((mae, str(tmp_path / 'lig{}.pdb'.format(i))))
+    assert mae2pdb_batch(pairs, nt=2) == [pdb for (_, pdb) in pairs]
+    for i, (_, pdb) in enumerate(pairs):
+        lines = open(pdb).read().splitlines()
+        assert sum(line.startswith('HETATM') for line in lines) == 10 + i
+        assert lines[-1] == 'END'
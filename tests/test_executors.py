@@ -0,0 +1,122 @@
+import os
+import signal
+import shutil
+import asyncio
+
+import pytest
+
+from maestrowrapper.capture import JobFailed
+from maestrowrapper.scheduler import Job
+from maestrowrapper.executors import Executor, HostExecutor, BatchExecutor, job_slots, with_host
+
+
+@pytest.fixture
+def jobs(fake):
+    # qikprop jobs with their input already in the tmpdir, as the runners stage it
+    def make(n, slots=1):
+        made = []
+        for job_id, file in enumerate(fake.ligands(n)):
+            tmpdir = os.path.join(fake.root, 'run', 'qikprop{}'.format(job_id))
+            os.makedirs(tmpdir)
+            shutil.copy(file, tmpdir)
+            cmd = '{} -HOST localhost:{} {}'.format(os.path.join(fake.schrodinger, 'qikprop'), slots, os.path.basename(file))
+            made.append(Job(job_id, cmd, tmpdir=tmpdir))
+        return made
+    yield make
+    # nothing a test cancelled is left running
+    for name in os.listdir(os.path.join(fake.state, 'jobs')):
+        try:
+            os.kill(int(name), signal.SIGTERM)
+        except OSError:
+            pass
+
+
+def outputs(job):
+    return [file for file in os.listdir(job.tmpdir) if file.endswith('.CSV')]
+
+
+def test_host_option():
+    assert job_slots('qikprop -HOST localhost:12 lig1.mae') == 12
+    assert job_slots('structcat -imae a.mae') == 1
+    assert with_host('qikprop -HOST localhost:12 lig1.mae', 'node2', 4) == 'qikprop -HOST node2:4 lig1.mae'
+
+
+def test_default_executor_runs_the_command_as_given(jobs):
+    job, = jobs(1)
+    asyncio.run(Executor().run(job, env=dict(os.environ)))
+    assert job.host == 'localhost'
+    assert outputs(job) == ['lig1.CSV']
+
+
+def test_pick_clamps_big_jobs_to_the_biggest_host():
+    executor = HostExecutor({'a': 2, 'b': 4})
+    assert executor.slots == 6
+    assert executor.pick(1) == ('b', 1)
+    assert executor.pick(12) == ('b', 4)
+    executor.used['b'] = 1
+    assert executor.pick(12) == (None, 4)
+    assert executor.pick(2) == ('b', 2)
+
+
+def test_hosts_never_oversubscribed(jobs):
+    executor = HostExecutor({'a': 2, 'b': 1})
+    peaks = []
+
+    async def main(todo):
+        runs = asyncio.ensure_future(asyncio.gather(*[executor.run(job, env=dict(os.environ)) for job in todo]))
+        while not runs.done():
+            peaks.append(dict(executor.used))
+            await asyncio.sleep(0.01)
+        await runs
+
+    todo = jobs(6)
+    asyncio.run(main(todo))
+    assert all(all(used[host] <= executor.hosts[host] for host in used) for used in peaks)
+    assert max(sum(used.values()) for used in peaks) == 3
+    assert executor.used == {'a': 0, 'b': 0}
+    assert {job.host for job in todo} == {'a', 'b'}
+    assert all(outputs(job) for job in todo)
+
+
+def test_batch_submit_and_poll(jobs):
+    executor = BatchExecutor.background(interval=0.05)
+    todo = jobs(2)
+
+    async def main():
+        await asyncio.gather(*[executor.run(job, env=dict(os.environ)) for job in todo])
+
+    asyncio.run(main())
+    assert executor.submitted == 2
+    assert executor.polls >= 2
+    for job in todo:
+        assert job.host.startswith('batch:')
+        assert outputs(job)
+        # the script and its status file are gone once the job is
+        assert not os.path.exists(os.path.join(job.tmpdir, BatchExecutor.SCRIPT))
+        assert not os.path.exists(os.path.join(job.tmpdir, BatchExecutor.STATUS))
+
+
+def test_batch_failure(jobs, monkeypatch):
+    monkeypatch.setenv('FAKE_FAIL', '1')
+    job, = jobs(1)
+    with pytest.raises(JobFailed):
+        asyncio.run(BatchExecutor.background(interval=0.05).run(job, env=dict(os.environ)))
+
+
+def test_batch_cancel(jobs, monkeypatch):
+    monkeypatch.setenv('FAKE_RUNTIME', 'fixed:30')
+    job, = jobs(1)
+    executor = BatchExecutor.background(interval=0.05)
+
+    async def main():
+        run = asyncio.ensure_future(executor.run(job, env=dict(os.environ)))
+        while executor.submitted == 0:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.2)
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+        # the stand-in queue no longer has it
+        return await executor.queued(job.host.split(':', 1)[1])
+
+    assert asyncio.run(main()) is False
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+
+from maestrowrapper.fingerprint import (FingerprintBuilder, FingerprintMatrix, InteractionFingerprints, pack, read_csv,
+                                        unpack)
+
+
+def write_csv(path, labels, rows):
+    with open(path, 'w') as f:
+        f.write(','.join(['Title'] + labels) + '\n')
+        for title, bits in rows:
+            f.write(','.join([title] + [str(bit) for bit in bits]) + '\n')
+    return str(path)
+
+
+def test_pack_round_trips_across_words():
+    rng = np.random.default_rng(0)
+    bits = rng.random((5, 130)) < 0.3
+    packed = pack(bits)
+    assert packed.shape == (5, 3) and packed.dtype == np.dtype('<u8')
+    assert (unpack(packed, 130) == bits).all()
+    # bit j is bit j % 64 of word j // 64
+    assert packed[0, 1] >> np.uint64(1) & np.uint64(1) == bits[0, 65]
+
+
+def test_read_csv_keeps_the_on_columns(tmp_path):
+    file = write_csv(tmp_path / 'a.csv', ['A12_hbond', 'B7_pi', 'C3_any'], [('pose1', [1, 0, 1]), ('pose2', [0, 0, 0])])
+    labels, titles, rows = read_csv(file)
+    assert labels == ['A12_hbond', 'B7_pi', 'C3_any']
+    assert titles == ['pose1', 'pose2']
+    assert rows == [[0, 2], []]
+
+
+def test_builder_merges_label_sets(tmp_path):
+    builder = FingerprintBuilder()
+    builder.add_csv(write_csv(tmp_path / 'a.csv', ['x', 'y'], [('p', [1, 1])]), title='lig1')
+    builder.add_csv(write_csv(tmp_path / 'b.csv', ['y', 'z'], [('p', [0, 1]), ('q', [1, 0])]), title='lig2')
+    matrix = builder.build()
+    assert matrix.titles == ['lig1', 'lig2_1', 'lig2_2']
+    assert matrix.labels == ['x', 'y', 'z']
+    assert matrix.bits().tolist() == [[True, True, False], [False, False, True], [False, True, False]]
+    assert list(matrix.column('y')) == [1, 0, 1]
+    assert list(matrix.counts()) == [1, 2, 1]
+
+
+def test_matrix_round_trips_through_a_memmap(tmp_path):
+    rng = np.random.default_rng(1)
+    bits = rng.random((7, 70)) < 0.5
+    labels = ['r{}'.format(n) for n in range(70)]
+    matrix = FingerprintMatrix(['t{}'.format(n) for n in range(7)], labels, pack(bits))
+    loaded = FingerprintMatrix.load(matrix.save(str(tmp_path / 'fp.fpm')))
+    assert isinstance(loaded.packed, np.memmap)
+    assert loaded.titles == matrix.titles and loaded.labels == labels
+    assert (loaded.bits() == bits).all()
+    empty = FingerprintMatrix.load(FingerprintMatrix([], [], np.zeros((0, 0), dtype='<u8')).save(str(tmp_path / 'e.fpm')))
+    assert len(empty) == 0
+
+
+def test_finish_reads_csvs_from_an_earlier_run(tmp_path):
+    write_csv(tmp_path / 'lig1_fingerprint.csv', ['x'], [('lig1', [1])])
+    write_csv(tmp_path / 'lig2_fingerprint.csv', ['x', 'y'], [('lig2', [0, 1])])
+    job_type = InteractionFingerprints(output='fp.fpm')
+    matrix = job_type.finish(None, str(tmp_path))
+    assert os.path.isfile(tmp_path / 'fp.fpm')
+    assert matrix.titles == ['lig1', 'lig2']
+    assert matrix.bits().tolist() == [[True, False], [False, True]]
@@ -0,0 +1,29 @@
+import os
+import time
+
+from maestrowrapper.executors import LocalExecutor
+
+
+def test_hung_jobs_are_killed_and_fail(fake, monkeypatch):
+    monkeypatch.setenv('FAKE_HANG', '1')
+    fake.ligands(2)
+    mw = fake.wrapper(executor=LocalExecutor(hang_timeout=2))
+    start = time.time()
+    mw.ligprep(nt=2, output_type='mae')
+    assert time.time() - start < 30
+    assert mw.metrics.summary('ligprep')['counters']['failed'] == 2
+    # job control saw both killed, and gave their licences back
+    assert sorted(record['ExitStatus'] for record in fake.jobs()) == ['killed', 'killed']
+    assert fake.used().get('LIGPREP_MAIN', 0) == 0
+
+
+def test_failed_status_comes_from_job_control(fake, monkeypatch):
+    monkeypatch.setenv('FAKE_FAIL', '1')
+    fake.ligands(2)
+    mw = fake.wrapper()
+    mw.qikprop(nt=2)
+    assert mw.metrics.summary('qikprop')['counters']['failed'] == 2
+    assert sorted(record['ExitStatus'] for record in fake.jobs()) == ['died', 'died']
+    qikprop = os.path.join(fake.root, 'qikprop')
+    outputs = os.listdir(qikprop) if os.path.isdir(qikprop) else []
+    assert not [f for f in outputs if f.endswith('.CSV')]
@@ -0,0 +1,44 @@
+import os
+
+
+def test_resume_skips_collected_jobs(fake):
+    fake.ligands(4)
+    mw = fake.wrapper()
+    mw.qikprop(nt=2)
+    qikprop = os.path.join(fake.root, 'qikprop')
+    assert sorted(f for f in os.listdir(qikprop) if f.endswith('.CSV')) == ['lig{}.CSV'.format(n) for n in range(1, 5)]
+    runs = len(fake.jobs())
+
+    mw = fake.wrapper()
+    mw.qikprop(nt=2, resume=True)
+    assert len(fake.jobs()) == runs
+    # nothing ran, so no job left an empty qikpropN directory behind
+    assert fake.tmpdirs(qikprop, 'qikprop') == []
+
+
+def test_resume_runs_new_inputs(fake):
+    fake.ligands(3)
+    fake.wrapper().qikprop(nt=2)
+    qikprop = os.path.join(fake.root, 'qikprop')
+    # a new input arriving between runs is the only job resume runs
+    fake.ligands(4)
+    mw = fake.wrapper()
+    mw.qikprop(nt=2, resume=True)
+    assert os.path.isfile(os.path.join(qikprop, 'lig4.CSV'))
+    assert len(fake.jobs()) == 4
+
+
+def test_resume_reruns_failed_jobs(fake, monkeypatch):
+    fake.ligands(3)
+    monkeypatch.setenv('FAKE_FAIL', '1')
+    mw = fake.wrapper()
+    mw.qikprop(nt=2)
+    assert mw.metrics.summary('qikprop')['counters']['failed'] == 3
+
+    monkeypatch.setenv('FAKE_FAIL', '0')
+    mw = fake.wrapper()
+    mw.qikprop(nt=2, resume=True)
+    assert len(fake.jobs()) == 6
+    qikprop = os.path.join(fake.root, 'qikprop')
+    assert sorted(f for f in os.listdir(qikprop) if f.endswith('.CSV')) == ['lig1.CSV', 'lig2.CSV', 'lig3.CSV']
+    assert fake.tmpdirs(qikprop, 'qikprop') == []
@@ -0,0 +1,105 @@
+import os
+import time
+import threading
+
+from maestrowrapper.licenses import LicenseBroker
+from maestrowrapper.benchmarks.fake_schrodinger import Pool
+
+
+def broker(fake, **kwargs):
+    return LicenseBroker(os.environ.copy(), cmd=[os.path.join(fake.schrodinger, 'licadmin'), 'stat'], **kwargs)
+
+
+def test_pending_reservations_count_until_licadmin_sees_them(fake):
+    licenses = broker(fake, ttl=60)
+    assert licenses.free('QIKPROP_MAIN') == 7
+    first = licenses.acquire('QIKPROP_MAIN')
+    second = licenses.acquire('QIKPROP_MAIN')
+    # neither job has checked out yet, so both are held on top of the 0 licadmin reports
+    assert licenses.free('QIKPROP_MAIN') == 5
+
+    # the first checks out; licadmin now reports it, and it is no longer counted twice
+    with Pool() as pool:
+        pool.take('QIKPROP_MAIN')
+    assert licenses.stat('QIKPROP_MAIN', refresh=True) == (8, 1)
+    assert licenses.free('QIKPROP_MAIN') == 5
+
+    # releasing the one licadmin never saw leaves the cached in-use count alone
+    licenses.release(second)
+    assert licenses.stat('QIKPROP_MAIN') == (8, 1)
+    assert licenses.free('QIKPROP_MAIN') == 6
+    licenses.release(first)
+    assert licenses.stat('QIKPROP_MAIN') == (8, 0)
+    assert licenses.held() == 0
+
+
+def test_contention_never_oversubscribes(fake):
+    licenses = broker(fake, ttl=0.05)
+    lock = threading.Lock()
+    state = {'held': 0, 'peak': 0, 'refused': 0}
+
+    def job():
+        for _ in range(3):
+            reservation = licenses.acquire('QIKPROP_MAIN', timeout=30)
+            assert reservation is not None
+            with lock:
+                state['held'] += 1
+                state['peak'] = max(state['peak'], state['held'])
+            # the job checks its token out a little after it is granted, as a launched one does
+            time.sleep(0.01)
+            with Pool() as pool:
+                if not pool.take('QIKPROP_MAIN'):
+                    state['refused'] += 1
+            time.sleep(0.02)
+            with Pool() as pool:
+                pool.give('QIKPROP_MAIN', 1)
+            with lock:
+                state['held'] -= 1
+            licenses.release(reservation)
+
+    threads = [threading.Thread(target=job) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state['refused'] == 0
+    assert state['peak'] <= 8 - licenses.headroom
+    assert fake.peak('QIKPROP_MAIN') <= 8 - licenses.headroom
+    assert licenses.held() == 0
+
+
+def test_stage_stays_within_the_pool(fake):
+    with Pool() as pool:
+        pool.state['issued']['QIKPROP_MAIN'] = 3
+    fake.ligands(8)
+    mw = fake.wrapper()
+    mw.qikprop(nt=4)
+    qikprop = os.path.join(fake.root, 'qikprop')
+    assert len([f for f in os.listdir(qikprop) if f.endswith('.CSV')]) == 8
+    assert fake.peak('QIKPROP_MAIN') <= 3 - mw.license_broker.headroom
+    assert fake.used().get('QIKPROP_MAIN', 0) == 0
+
+
+def test_release_does_not_wait_for_licadmin(fake):
+    # licadmin taking a second, as it does against a busy licence server
+    slow = ['sh', '-c', 'sleep 1; exec "$0" stat', os.path.join(fake.schrodinger, 'licadmin')]
+    licenses = LicenseBroker(os.environ.copy(), cmd=slow, ttl=60)
+    reservation = licenses.acquire('QIKPROP_MAIN')
+    polling = threading.Thread(target=licenses.stat, kwargs={'refresh': True})
+    polling.start()
+    time.sleep(0.2)
+    start = time.time()
+    licenses.release(reservation)
+    assert time.time() - start < 0.5
+    polling.join()
+    assert licenses.num_calls() == 2
+
+
+def test_one_licadmin_call_for_threads_finding_it_stale(fake):
+    licenses = broker(fake, ttl=60)
+    threads = [threading.Thread(target=licenses.free, args=('QIKPROP_MAIN',)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert licenses.num_calls() == 1
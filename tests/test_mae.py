@@ -0,0 +1,171 @@
+import os
+import gzip
+
+import numpy as np
+import pytest
+
+from maestrowrapper.mae import MAE, MAEIndex, concat, is_compressed, write_structures
+from maestrowrapper.benchmarks.synthetic import write_mae
+
+
+TEXT = r'''{
+ s_m_m2io_version
+ :::
+ 2.0.0
+}
+
+f_m_ct {
+ s_m_title
+ r_i_docking_score
+ i_m_ct_format
+ b_m_flag
+ s_m_note
+ :::
+ "lig \"one\""
+ -7.250000
+ 2
+ 1
+ <>
+ m_atom[3] {
+  # First column is atom index #
+  i_m_mmod_type
+  r_m_x_coord
+  r_m_y_coord
+  r_m_z_coord
+  s_m_pdb_atom_name
+  i_m_formal_charge
+  :::
+  1 3 0.100000 1.000000 -1.000000 " C1 " 0
+  2 15 1.200000 2.000000 -2.000000 " O1 " <>
+  3 25 2.300000 3.000000 -3.000000 <> 1
+  :::
+ }
+ m_depend[1] {
+  i_m_depend_dependency
+  s_m_depend_property
+  :::
+  1 10 r_i_docking_score
+  :::
+ }
+}
+
+f_m_ct {
+ s_m_title
+ :::
+ lig2
+}
+'''
+
+
+@pytest.fixture
+def text_mae(tmp_path):
+    path = tmp_path / 'ligs.mae'
+    path.write_text(TEXT)
+    return str(path)
+
+
+def test_properties_are_typed(text_mae):
+    first, second = list(MAE(text_mae))
+    assert first.title == 'lig "one"'
+    assert first['r_i_docking_score'] == -7.25
+    assert first['i_m_ct_format'] == 2
+    assert first['b_m_flag'] is True
+    assert first['s_m_note'] is None
+    assert second.title == 'lig2'
+    assert len(second) == 0
+
+
+def test_tables_are_columns(text_mae):
+    first = next(iter(MAE(text_mae)))
+    atoms = first.atoms
+    assert len(first) == 3
+    assert atoms['i_m_mmod_type'].dtype == np.int64
+    assert list(atoms['s_m_pdb_atom_name']) == [' C1 ', ' O1 ', '']
+    # an integer column with a missing value holds NaN there
+    assert np.isnan(atoms['i_m_formal_charge'][1])
+    assert first.coordinates.shape == (3, 3)
+    assert first.coordinates[2].tolist() == [2.3, 3.0, -3.0]
+    assert list(first.tables['m_depend']['s_m_depend_property']) == ['r_i_docking_score']
+
+
+def test_reads_compressed_files(tmp_path):
+    file = write_mae(str(tmp_path / 'poses.mae'), 6, 8)
+    with open(file, 'rb') as f, gzip.open(str(tmp_path / 'poses.maegz'), 'wb') as out:
+        out.write(f.read())
+    plain = [structure.title for structure in MAE(file)]
+    assert plain == ['pose_{}'.format(n) for n in range(1, 7)]
+    assert [structure.title for structure in MAE(str(tmp_path / 'poses.maegz'))] == plain
+
+
+def compressed(file):
+    with open(file, 'rb') as f, gzip.open(file + 'gz', 'wb') as out:
+        out.write(f.read())
+    return file + 'gz'
+
+
+def test_index_finds_every_structure(tmp_path):
+    file = write_mae(str(tmp_path / 'poses.mae'), 5, 8)
+    index = MAEIndex.load(file)
+    assert len(index) == 5
+    assert os.path.isfile(MAEIndex.sidecar(file))
+    with index:
+        assert index.structure(3).title == 'pose_4'
+    # reused while the file is unchanged, rebuilt once it is not
+    assert MAEIndex.load(file).offsets == index.offsets
+    write_mae(file, 2, 8)
+    assert len(MAEIndex.load(file)) == 2
+
+
+def test_subset_and_split(tmp_path):
+    file = write_mae(str(tmp_path / 'poses.mae'), 5, 8)
+    mae = MAE(file)
+    assert len(mae) == 5
+    assert mae[-1].title == 'pose_5'
+    out = mae.subset([4, 1], str(tmp_path / 'subset.mae'))
+    assert [structure.title for structure in MAE(out)] == ['pose_5', 'pose_2']
+    outs = write_structures(file, {0: str(tmp_path / 'a.mae'), 2: str(tmp_path / 'a.mae'), 3: str(tmp_path / 'b.maegz')})
+    assert sorted(outs) == [str(tmp_path / 'a.mae'), str(tmp_path / 'b.maegz')]
+    assert [structure.title for structure in MAE(str(tmp_path / 'a.mae'))] == ['pose_1', 'pose_3']
+    assert is_compressed(str(tmp_path / 'b.maegz'))
+    assert [structure.title for structure in MAE(str(tmp_path / 'b.maegz'))] == ['pose_4']
+
+
+def test_compressed_files_stream_instead_of_indexing(tmp_path):
+    file = compressed(write_mae(str(tmp_path / 'poses.mae'), 5, 8))
+    with pytest.raises(ValueError):
+        MAEIndex.load(file)
+    assert not os.path.exists(MAEIndex.sidecar(file))
+    mae = MAE(file)
+    assert len(mae) == 5
+    assert mae[1].title == 'pose_2'
+    assert mae[-1].title == 'pose_5'
+    with pytest.raises(IndexError):
+        mae[5]
+    out = mae.subset([0, 4], str(tmp_path / 'subset.mae'))
+    assert [structure.title for structure in MAE(out)] == ['pose_1', 'pose_5']
+    assert not os.path.exists(MAEIndex.sidecar(file))
+
+
+def test_separate_mae(tmp_path, fake):
+    fake.ligands(1)
+    file = compressed(write_mae(str(tmp_path / 'poses.mae'), 3, 8))
+    outs = fake.wrapper().separate_mae(file, export_to=str(tmp_path))
+    assert [os.path.basename(out) for out in outs] == ['poses_1.mae', 'poses_2.mae', 'poses_3.mae']
+    assert [MAE(out)[0].title for out in outs] == ['pose_1', 'pose_2', 'pose_3']
+
+
+def test_concat_joins_files_without_a_final_newline(tmp_path):
+    files = []
+    for n in range(3):
+        file = write_mae(str(tmp_path / 'part{}.mae'.format(n)), 2, 5, seed=n)
+        with open(file, 'r') as f:
+            text = f.read()
+        # one file ends in '}' with no newline, as some exporters leave it
+        with open(file, 'w') as f:
+            f.write(text.rstrip() if n == 0 else text)
+        files.append(file)
+    files.append(compressed(files.pop()))
+    for output in ('all.mae', 'all.maegz'):
+        out = concat(files, str(tmp_path / output))
+        assert is_compressed(out) == output.endswith('gz')
+        assert [structure.title for structure in MAE(out)] == ['pose_1', 'pose_2'] * 3
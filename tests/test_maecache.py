@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+
+from maestrowrapper.mae import MAE
+from maestrowrapper.maecache import StructureCache
+from maestrowrapper.benchmarks.synthetic import write_mae
+
+
+def same(a, b):
+    assert a.name == b.name
+    assert a.properties == b.properties
+    assert a.tables.keys() == b.tables.keys()
+    for name in a.tables:
+        assert a.tables[name].size == b.tables[name].size
+        assert a.tables[name].columns.keys() == b.tables[name].columns.keys()
+        for key in a.tables[name].columns:
+            x, y = a.tables[name][key], b.tables[name][key]
+            assert x.dtype == y.dtype
+            assert np.array_equal(x, y, equal_nan=x.dtype.kind == 'f')
+    assert len(a.blocks) == len(b.blocks)
+
+
+def test_no_sidecar_unless_asked(tmp_path):
+    file = write_mae(str(tmp_path / 'poses.mae'), 5, 12)
+    mae = MAE(file)
+    assert len(list(mae)) == 5
+    assert mae[2].title == 'pose_3'
+    assert not os.path.exists(StructureCache.sidecar(file))
+
+
+def test_cache_round_trip(tmp_path):
+    file = write_mae(str(tmp_path / 'poses.mae'), 20, 15)
+    parsed = list(MAE(file).parse())
+    cached = list(MAE(file, cache=True).structures())
+    assert os.path.isfile(StructureCache.sidecar(file))
+    assert len(parsed) == len(cached) == 20
+    for a, b in zip(parsed, cached):
+        same(a, b)
+
+    # read back from the sidecar rather than built
+    cache = StructureCache.read(file)
+    assert cache.fresh()
+    assert cache.titles == ['pose_{}'.format(n) for n in range(1, 21)]
+    same(cache[-1], parsed[-1])
+    assert MAE(file, cache=True)[4].title == 'pose_5'
+
+
+def test_values_read_back_exactly(tmp_path):
+    file = str(tmp_path / 'exact.mae')
+    with open(file, 'w') as f:
+        f.write('{\n s_m_m2io_version\n :::\n 2.0.0\n}\n\n')
+        for n, charge in enumerate(['0', '<>', '1']):
+            f.write('f_m_ct {\n s_m_title\n r_i_docking_score\n :::\n lig%d\n -123.456789\n' % n)
+            f.write(' m_atom[2] {\n  r_m_x_coord\n  i_m_formal_charge\n  i_m_big\n  :::\n')
+            f.write('  1 49.123456 %s 3000000000\n  2 -0.000001 0 -7\n  :::\n }\n}\n\n' % charge)
+    parsed = list(MAE(file).parse())
+    MAE(file, cache=True)[0]
+    cached = list(StructureCache.read(file))
+    for a, b in zip(parsed, cached):
+        same(a, b)
+    assert cached[0]['r_i_docking_score'] == -123.456789
+    assert cached[0].atoms['r_m_x_coord'][0] == 49.123456
+    assert cached[0].atoms['i_m_big'].tolist() == [3000000000, -7]
+    # <> in one structure's integer column leaves the others integer
+    assert cached[0].atoms['i_m_formal_charge'].dtype == np.int64
+    assert np.isnan(cached[1].atoms['i_m_formal_charge'][0])
+
+
+def test_stale_cache_is_rebuilt(tmp_path):
+    file = write_mae(str(tmp_path / 'poses.mae'), 3, 10)
+    StructureCache.load(file)
+    write_mae(file, 4, 10, seed=1)
+    assert not StructureCache.read(file).fresh()
+    assert len(StructureCache.load(file)) == 4
+    assert StructureCache.read(file).fresh()
@@ -0,0 +1,137 @@
+import os
+import asyncio
+
+import pandas as pd
+
+from maestrowrapper.pipeline import Pipeline, Stage
+
+
+class Licenses:
+    # stands in for AsyncLicenses, recording what each stage holds
+
+    def __init__(self):
+        self.held = []
+        self.taken = []
+
+    async def acquire(self, lic, tokens=None):
+        self.held.append(lic)
+        self.taken.append((lic, tokens))
+        return lic
+
+    async def release(self, reservation):
+        self.held.remove(reservation)
+
+
+def test_items_move_on_without_waiting_for_the_stage():
+    events = []
+
+    async def first(item):
+        await asyncio.sleep(0.2 if item == 'slow' else 0)
+        events.append(('first', item))
+        return item
+
+    async def second(item):
+        events.append(('second', item))
+        return item.upper()
+
+    pipeline = Pipeline([Stage('first', first), Stage('second', second)], report_interval=60)
+    assert sorted(asyncio.run(pipeline.run(['slow', 'fast']))) == ['FAST', 'SLOW']
+    assert events.index(('second', 'fast')) < events.index(('first', 'slow'))
+
+
+def test_stages_limit_their_own_concurrency():
+    running = {'a': 0, 'b': 0}
+    peak = {'a': 0, 'b': 0}
+
+    def stage(name):
+        async def func(item):
+            running[name] += 1
+            peak[name] = max(peak[name], running[name])
+            await asyncio.sleep(0.01)
+            running[name] -= 1
+            return item
+        return func
+
+    licenses = Licenses()
+    pipeline = Pipeline([Stage('a', stage('a'), nt=3, lic='LIGPREP_MAIN', tokens=2), Stage('b', stage('b'), nt=1)],
+                        licenses=licenses, report_interval=60)
+    asyncio.run(pipeline.run(range(12)))
+    assert peak == {'a': 3, 'b': 1}
+    # only the stage with a licence takes one, and every one is handed back
+    assert licenses.taken == [('LIGPREP_MAIN', 2)] * 12
+    assert licenses.held == []
+
+
+def test_failures_and_fan_out_stay_with_their_items():
+    async def split(item):
+        if item == 'bad':
+            raise RuntimeError('no structures')
+        if item == 'empty':
+            return None
+        return [item + '1', item + '2']
+
+    async def keep(item):
+        return item
+
+    pipeline = Pipeline([Stage('split', split), Stage('keep', keep)], report_interval=60)
+    assert sorted(asyncio.run(pipeline.run(['a', 'bad', 'empty', 'b']))) == ['a1', 'a2', 'b1', 'b2']
+    assert pipeline.failed == [('split', 'bad', repr(RuntimeError('no structures')))]
+    assert [(stage.name, stage.done) for stage in pipeline.stages] == [('split', 3), ('keep', 4)]
+
+
+def test_stream_takes_no_more_than_the_backlog():
+    async def run():
+        release = asyncio.Event()
+        taken = []
+
+        async def source():
+            for n in range(10):
+                taken.append(n)
+                yield n
+
+        async def wait(item):
+            await release.wait()
+            return item
+
+        pipeline = Pipeline([Stage('wait', wait, nt=10)], report_interval=60)
+        stream = asyncio.ensure_future(pipeline.stream(source(), backlog=3))
+        await asyncio.sleep(0.05)
+        assert taken == [0, 1, 2]
+        release.set()
+        return list(await stream)
+
+    # only the last backlog results are kept
+    assert sorted(asyncio.run(run())) == [7, 8, 9]
+
+
+def write_protein(fake):
+    os.rename(os.path.join(fake.inputs, 'lig3.mae'), os.path.join(fake.inputs, 'protein.mae'))
+
+
+def test_pipeline_through_prepwizard_complex_and_mmgbsa(fake):
+    fake.ligands(3)
+    write_protein(fake)
+    mw = fake.wrapper()
+    pipeline = mw.pipeline(protein='protein.mae', nt={'prepwizard': 2, 'complex': 2, 'primeMMGBSA': 2})
+    assert pipeline.failed == []
+    assert [(stage.name, stage.done) for stage in pipeline.stages] == [('prepwizard', 3), ('complex', 2),
+                                                                      ('primeMMGBSA', 2)]
+    complex_path = os.path.join(fake.inputs, 'complex')
+    assert mw.path == complex_path
+    assert sorted(mw.files) == ['prep_lig1_complex.mae', 'prep_lig2_complex.mae']
+    written = pd.read_csv(os.path.join(complex_path, 'primeMMGBSA', 'mmgbsa_all.csv'), index_col=0)
+    assert list(written['title']) == ['prep_lig1', 'prep_lig2']
+    jobs = len(fake.jobs())
+    # a resumed run repeats no job
+    fake.wrapper().pipeline(protein='protein.mae', resume=True)
+    assert len(fake.jobs()) == jobs
+
+
+def test_a_failed_protein_fails_every_complex(fake, monkeypatch):
+    monkeypatch.setenv('FAKE_FAIL', '1')
+    fake.ligands(3)
+    write_protein(fake)
+    pipeline = fake.wrapper().pipeline(protein='protein.mae')
+    failed = {(stage, item) for (stage, item, _) in pipeline.failed}
+    assert failed == {('prepwizard', 'protein.mae'), ('prepwizard', 'lig1.mae'), ('prepwizard', 'lig2.mae')}
+    assert [stage.done for stage in pipeline.stages] == [0, 0, 0]
@@ -0,0 +1,82 @@
+import os
+import sys
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from maestrowrapper import plugins
+from maestrowrapper.ligprep import LigPrep
+from maestrowrapper.plugins import JobType
+
+from conftest import ROOT
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(plugins, 'REGISTRY', dict(plugins.REGISTRY))
+    monkeypatch.setattr(plugins, '_loaded', {})
+    monkeypatch.setattr(plugins, '_entry_points_read', False)
+    return plugins.REGISTRY
+
+
+def test_importing_the_wrapper_loads_no_job_type():
+    code = '\n'.join([
+        'import sys, importlib.util',
+        "spec = importlib.util.spec_from_file_location('maestrowrapper', {!r}, submodule_search_locations=[{!r}])".format(
+            os.path.join(ROOT, '__init__.py'), ROOT),
+        "sys.modules['maestrowrapper'] = module = importlib.util.module_from_spec(spec)",
+        'spec.loader.exec_module(module)',
+        'import maestrowrapper.maestro',
+        "print(' '.join(m for m in ('numpy', 'pandas', 'maestrowrapper.ligprep', 'maestrowrapper.fingerprint') if m in sys.modules))",
+    ])
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == ''
+
+
+def test_names_are_imported_on_first_use(registry):
+    assert plugins.get('ligprep') is LigPrep
+    assert plugins._loaded['ligprep'] is LigPrep
+    with pytest.raises(KeyError, match='fingerprint'):
+        plugins.get('docking')
+
+
+def test_register_replaces_a_loaded_job_type(registry):
+    class Docking(JobType):
+        name = 'docking'
+
+    plugins.get('ligprep')
+    plugins.register('ligprep', Docking)
+    plugins.register('glide', 'maestrowrapper.ligprep:LigPrep')
+    assert plugins.get('ligprep') is Docking
+    assert plugins.get('glide') is LigPrep
+    assert {'glide', 'ligprep', 'qikprop'} <= set(plugins.names())
+
+
+def test_entry_points_are_read_once(registry, monkeypatch):
+    calls = []
+
+    def entry_points(group=None):
+        calls.append(group)
+        return [SimpleNamespace(name='glide', value='maestrowrapper.ligprep:LigPrep'),
+                SimpleNamespace(name='ligprep', value='elsewhere:LigPrep')]
+
+    monkeypatch.setattr('importlib.metadata.entry_points', entry_points)
+    assert plugins.get('glide') is LigPrep
+    assert 'glide' in plugins.names()
+    assert calls == [plugins.ENTRY_POINTS]
+    # a name already registered keeps its built-in job type
+    assert registry['ligprep'] == 'maestrowrapper.ligprep:LigPrep'
+
+
+def test_run_stage_runs_a_registered_job_type(fake, registry):
+    class Prepared(LigPrep):
+        name = 'prepared'
+        export_to = 'prepared'
+
+    plugins.register('prepared', Prepared)
+    fake.ligands(3)
+    mw = fake.wrapper()
+    mw.run_stage('prepared', nt=2, output_type='mae')
+    outputs = [file for file in os.listdir(os.path.join(fake.root, 'prepared')) if file.endswith('.mae')]
+    assert len(outputs) == 3
@@ -0,0 +1,51 @@
+import os
+import time
+
+import pandas as pd
+
+from maestrowrapper.results import ResultStore, structure_title
+
+
+def write(path, name, rows):
+    with open(os.path.join(path, name), 'w') as f:
+        f.write('title,r_psp_MMGBSA_dG_Bind,r_psp_Lig_Strain_Energy\n')
+        for row in rows:
+            f.write(','.join(str(value) for value in row) + '\n')
+
+
+def test_structure_title():
+    for name in ('lig1.mae', 'prep_lig1.mae', 'prep_lig1_complex.mae', 'prep_lig1_complex-out.csv',
+                 'prep_lig1_complex_fingerprint.csv'):
+        assert structure_title(name) == 'lig1'
+
+
+def test_store_reads_each_file_once(tmp_path):
+    write(str(tmp_path), 'prep_lig1_complex-out.csv', [('prep_lig1_complex', -40.5, 3.25)])
+    with ResultStore(str(tmp_path / 'results.sqlite')) as store:
+        assert store.update(str(tmp_path)) == 1
+        assert store.update(str(tmp_path)) == 0
+        # a rewritten file replaces its rows
+        time.sleep(0.01)
+        write(str(tmp_path), 'prep_lig1_complex-out.csv', [('prep_lig1_complex', -41.0, 3.0)])
+        assert store.update(str(tmp_path)) == 1
+        assert store.count() == 1
+        (title, csv_title, dg), = store.query('SELECT title, csv_title, r_psp_MMGBSA_dG_Bind FROM results')
+        assert (title, csv_title, dg) == ('lig1', 'prep_lig1_complex', -41.0)
+
+
+def test_mmgbsa_all_keeps_its_layout(fake):
+    fake.ligands(1)
+    mw = fake.wrapper()
+    mw.mmgbsa_path = os.path.join(fake.root, 'primeMMGBSA')
+    os.mkdir(mw.mmgbsa_path)
+    write(mw.mmgbsa_path, 'prep_lig2_complex-out.csv', [('prep_lig2_complex', -30.5, 1.5)])
+    write(mw.mmgbsa_path, 'prep_lig1_complex-out.csv', [('prep_lig1_complex', -40.25, 2.5)])
+    mw.mmgbsa_concat()
+    write(mw.mmgbsa_path, 'prep_lig3_complex-out.csv', [('prep_lig3_complex', -20.0, 0.5)])
+    df = mw.mmgbsa_concat()
+    assert list(df.columns) == ['title', 'r_psp_MMGBSA_dG_Bind', 'r_psp_Lig_Strain_Energy']
+    written = pd.read_csv(os.path.join(mw.mmgbsa_path, 'mmgbsa_all.csv'), index_col=0)
+    assert list(written.columns) == ['title', 'r_psp_MMGBSA_dG_Bind', 'r_psp_Lig_Strain_Energy']
+    assert list(written['title']) == ['prep_lig1', 'prep_lig2', 'prep_lig3']
+    assert list(written['r_psp_MMGBSA_dG_Bind']) == [-40.25, -30.5, -20.0]
+    assert list(written.index) == [0, 1, 2]
@@ -0,0 +1,44 @@
+import asyncio
+
+from maestrowrapper.scheduler import Job, Scheduler
+
+
+def test_jobs_run_through_the_queue(tmp_path):
+    running = []
+    peak = []
+
+    async def runner(job):
+        running.append(job.job_id)
+        peak.append(len(running))
+        await asyncio.sleep(0.01 * (job.job_id % 3))
+        running.remove(job.job_id)
+        return {'timings': {}}
+
+    scheduler = Scheduler(runner, nt=3, name='test')
+    jobs = [Job(n, 'run {}'.format(n), tmpdir=str(tmp_path / str(n))) for n in range(10)]
+    completed = asyncio.run(scheduler.arun(jobs))
+    assert sorted(job.job_id for job in completed) == list(range(10))
+    assert max(peak) == 3
+    assert scheduler.failed == []
+
+
+def test_collect_error_fails_only_its_job(tmp_path):
+    collected = []
+
+    async def runner(job):
+        await asyncio.sleep(0.01)
+        return None
+
+    def collect(job):
+        if job.job_id == 1:
+            raise PermissionError('lig1.mae is open in another process')
+        collected.append(job.job_id)
+        return []
+
+    scheduler = Scheduler(runner, nt=2, collect=collect, name='test')
+    jobs = [Job(n, 'run {}'.format(n), tmpdir=str(tmp_path / str(n))) for n in range(4)]
+    completed = asyncio.run(scheduler.arun(jobs))
+    assert sorted(job.job_id for job in completed) == [0, 2, 3]
+    assert sorted(collected) == [0, 2, 3]
+    assert scheduler.failed == [1]
+    assert 'PermissionError' in scheduler.jobs[1].status
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from maestrowrapper import similarity
+from maestrowrapper.fingerprint import FingerprintMatrix, pack
+
+
+def brute(bits, metric='tanimoto', alpha=1.0, beta=1.0):
+    a = bits.astype(np.int64)
+    common = a @ a.T
+    counts = a.sum(axis=1)
+    if metric == 'tanimoto':
+        union = counts[:, None] + counts[None, :] - common
+    else:
+        union = alpha * (counts[:, None] - common) + beta * (counts[None, :] - common) + common
+    return np.where(union > 0, common / np.where(union > 0, union, 1), 1.0)
+
+
+@pytest.fixture
+def bits():
+    rng = np.random.default_rng(0)
+    bits = rng.random((40, 150)) < 0.2
+    bits[3] = False
+    bits[7] = False
+    return bits
+
+
+def test_popcount_matches_the_byte_table():
+    words = np.random.default_rng(2).integers(0, 2 ** 63, (6, 4), dtype=np.int64).view('<u8')
+    table = np.array([bin(n).count('1') for n in range(256)])
+    expected = table[words.view(np.uint8)].reshape(6, 32).sum(axis=1)
+    assert similarity.popcount(words).tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize('metric, alpha, beta', [('tanimoto', 1.0, 1.0), ('tversky', 0.7, 0.3)])
+def test_similarity_matrix_matches_brute_force(bits, metric, alpha, beta):
+    sims = similarity.similarity_matrix(pack(bits), block=16, metric=metric, alpha=alpha, beta=beta)
+    assert np.allclose(sims, brute(bits, metric, alpha, beta), atol=1e-6)
+    # two empty fingerprints are identical
+    assert sims[3, 7] == 1.0
+
+
+def test_top_k_across_blocks(bits):
+    packed = pack(bits)
+    rows, sims = similarity.top_k(packed[5], packed, k=6, block=7)
+    expected = brute(bits)[5]
+    assert rows[0] == 5 and sims[0] == 1.0
+    assert np.allclose(sims, np.sort(expected)[::-1][:6])
+    assert np.allclose(similarity.similarity(packed[5], packed, block=7), expected)
+    with pytest.raises(ValueError):
+        similarity.similarity(packed[5], packed, metric='cosine')
+
+
+def test_neighbours_are_the_pairs_above_threshold(bits):
+    i, j, sims = similarity.neighbours(pack(bits), 0.25, block=16)
+    full = brute(bits)
+    expected = {(a, b) for a in range(40) for b in range(a + 1, 40) if full[a, b] >= 0.25}
+    assert set(zip(i.tolist(), j.tolist())) == expected
+    assert np.allclose(sims, full[i, j])
+
+
+def test_leader_cluster_recovers_planted_groups():
+    # five groups on disjoint bits, each pose two flips away from its centroid
+    rng = np.random.default_rng(3)
+    groups = rng.integers(0, 5, 300)
+    bits = np.zeros((300, 200), dtype=bool)
+    for n, group in enumerate(groups):
+        bits[n, group * 40:group * 40 + 40] = True
+        bits[n, group * 40 + rng.choice(40, 2, replace=False)] = False
+    labels, leaders = similarity.leader_cluster(pack(bits), threshold=0.6, block=32)
+    assert len(leaders) == 5
+    assert (groups[leaders][labels] == groups).all()
+    assert (labels[leaders] == np.arange(5)).all()
+
+
+def test_matrix_search_and_cluster_use_titles(bits):
+    titles = ['pose{}'.format(n) for n in range(len(bits))]
+    matrix = FingerprintMatrix(titles, ['b{}'.format(n) for n in range(bits.shape[1])], pack(bits))
+    hits = matrix.search('pose5', k=3)
+    assert hits[0] == ('pose5', 1.0) and len(hits) == 3
+    assert matrix.search(5, k=3) == hits
+    clusters = matrix.cluster(threshold=0.99)
+    assert sorted(member for members in clusters.values() for member in members) == sorted(titles)
+    assert clusters['pose3'] == ['pose3', 'pose7']
@@ -0,0 +1,47 @@
+import os
+
+from maestrowrapper.scheduler import Job
+from maestrowrapper.staging import Stager
+
+
+def read(path):
+    with open(path, 'r') as f:
+        return f.read()
+
+
+def test_writes_are_inputs_named_as_outputs():
+    job = Job(0, 'ligprep -imae lig1.mae -omae lig1.mae', files=['/data/lig1.mae'])
+    assert job.writes() == {'lig1.mae'}
+    job = Job(0, ['qikprop', 'lig1.mae'], files=['/data/lig1.mae'])
+    assert job.writes() == set()
+
+
+def test_inputs_written_to_are_copied(tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'read.mae').write_text('read')
+    (src / 'written.mae').write_text('written')
+    dest = str(tmp_path / 'dest')
+    stager = Stager()
+    stager.stage_in([str(src / 'read.mae'), str(src / 'written.mae')], dest, writes={'written.mae'})
+    assert os.path.samefile(os.path.join(dest, 'read.mae'), str(src / 'read.mae'))
+    assert not os.path.samefile(os.path.join(dest, 'written.mae'), str(src / 'written.mae'))
+    with open(os.path.join(dest, 'written.mae'), 'w') as f:
+        f.write('changed')
+    assert (src / 'written.mae').read_text() == 'written'
+    assert Stager.is_input(os.path.join(dest, 'read.mae'), [str(src / 'read.mae')])
+    assert not Stager.is_input(os.path.join(dest, 'written.mae'), [str(src / 'written.mae')])
+
+
+def test_ligprep_leaves_inputs_alone(fake):
+    fake.ligands(3)
+    before = {name: read(os.path.join(fake.inputs, name)) for name in os.listdir(fake.inputs)}
+    mw = fake.wrapper()
+    mw.ligprep(nt=2, output_type='mae')
+    # the job writes lig1.mae over its staged input; the original is untouched and stays where it was
+    assert {name: read(os.path.join(fake.inputs, name)) for name in before} == before
+    ligprep = os.path.join(fake.root, 'ligprep')
+    outputs = sorted(f for f in os.listdir(ligprep) if f.endswith('.mae'))
+    assert outputs == sorted(before)
+    for name in outputs:
+        assert not os.path.samefile(os.path.join(ligprep, name), os.path.join(fake.inputs, name))
@@ -0,0 +1,81 @@
+import time
+import asyncio
+import threading
+
+from maestrowrapper import tuning
+from maestrowrapper.scheduler import Job, Scheduler
+from maestrowrapper.tuning import AutoTuner, Limit
+
+
+class Broker:
+    # what AutoTuner asks of a LicenseBroker, with the licadmin call's thread recorded
+
+    def __init__(self, free):
+        self.free_tokens = free
+        self.threads = set()
+
+    def tokens(self, lic):
+        return 2
+
+    def free(self, lic):
+        self.threads.add(threading.current_thread())
+        return self.free_tokens
+
+
+def test_bound_is_cores_licences_and_max():
+    tuner = AutoTuner(cores=8, broker=Broker(6), lic='QIKPROP_MAIN', interval=0.01)
+    assert tuner.tokens == 2
+    assert tuner.start(100) == 3
+    assert tuner.bound(running=3) == 6
+    assert AutoTuner(cores=8, max_nt=2).start(100) == 2
+    assert AutoTuner(cores=8).start(5) == 5
+    assert AutoTuner(cores=4).slots_for(2) == 2
+
+
+def test_adjust_climbs_while_licences_sit_idle(monkeypatch):
+    # the machine running the tests is not the one being tuned for
+    monkeypatch.setattr(tuning, 'cpu_load', lambda: None)
+    tuner = AutoTuner(cores=64, broker=Broker(2), lic='QIKPROP_MAIN', min_samples=100)
+    tuner.start(10)
+    assert tuner.nt == 1
+    tuner.broker.free_tokens = 10
+    assert tuner.adjust(running=1, queued=5) == 2
+    # nothing queued, nothing to grow for
+    assert tuner.adjust(running=2, queued=0) == 2
+    tuner.broker.free_tokens = 0
+    assert tuner.adjust(running=1, queued=5) == 1
+
+
+def test_limit_resizes_under_holders():
+    async def main():
+        limit = Limit(2)
+        await limit.acquire()
+        await limit.acquire()
+        waiter = asyncio.ensure_future(limit.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        limit.resize(3)
+        await asyncio.sleep(0)
+        assert waiter.done()
+        limit.resize(1)
+        limit.release()
+        assert limit.held == 2
+
+    asyncio.run(main())
+
+
+def test_licadmin_is_asked_off_the_loop(tmp_path):
+    broker = Broker(8)
+
+    async def runner(job):
+        # blocks nothing: the loop has to keep serving jobs while the tuner polls
+        await asyncio.sleep(0.02)
+        return None
+
+    tuner = AutoTuner(cores=4, broker=broker, lic='QIKPROP_MAIN', interval=0.01)
+    scheduler = Scheduler(runner, nt=1, name='test', tuner=tuner)
+    start = time.time()
+    asyncio.run(scheduler.arun([Job(n, 'run {}'.format(n), tmpdir=str(tmp_path / str(n))) for n in range(8)]))
+    assert len(scheduler.completed) == 8
+    assert time.time() - start < 5
+    assert broker.threads and threading.main_thread() not in broker.threads
@@ -0,0 +1,99 @@
+import os
+import time
+import asyncio
+
+from maestrowrapper.watch import FolderWatch
+from maestrowrapper.benchmarks.synthetic import write_ligands
+
+
+def touch(path, text='x', age=0):
+    with open(path, 'a') as f:
+        f.write(text)
+    if age:
+        now = time.time()
+        os.utime(path, (now - age, now - age))
+    return str(path)
+
+
+def test_scan_skips_partial_hidden_and_unmatched_files(tmp_path):
+    for name in ('a.mae', 'b.sdf', 'c.mae.part', 'd.mae~', '.e.mae', 'f.mae.crdownload'):
+        touch(tmp_path / name, age=60)
+    os.mkdir(tmp_path / 'g.mae')
+    assert FolderWatch(str(tmp_path), settle=1.0).scan() == ['a.mae', 'b.sdf']
+    assert FolderWatch(str(tmp_path), pattern='*.mae', settle=1.0).scan() == ['a.mae']
+    assert FolderWatch(str(tmp_path), pattern=['*.sdf', '*.mae'], settle=1.0).scan() == ['a.mae', 'b.sdf']
+
+
+def test_a_growing_file_waits_until_it_settles(tmp_path):
+    watcher = FolderWatch(str(tmp_path), settle=0.3)
+    file = touch(tmp_path / 'lig.mae')
+    assert watcher.scan() == []
+    time.sleep(0.2)
+    touch(file)
+    assert watcher.scan() == []
+    assert 'lig.mae' in watcher.changing
+    time.sleep(0.35)
+    assert watcher.scan() == ['lig.mae']
+
+
+def test_files_yields_each_file_once(tmp_path):
+    touch(tmp_path / 'before.mae', age=60)
+
+    async def watch(existing, wanted):
+        watcher = FolderWatch(str(tmp_path), pattern='*.mae', settle=0.2, poll=0.1, existing=existing)
+
+        async def write():
+            await asyncio.sleep(0.1)
+            touch(tmp_path / 'new.mae')
+            # copied under a partial name and renamed once whole
+            os.rename(touch(tmp_path / 'copy.mae.part'), tmp_path / 'copy.mae')
+
+        writer = asyncio.ensure_future(write())
+        seen = []
+        async for file in watcher.files():
+            seen.append(os.path.basename(file))
+            if len(seen) == wanted:
+                watcher.stop()
+        await writer
+        for name in ('new.mae', 'copy.mae'):
+            os.remove(tmp_path / name)
+        return seen
+
+    assert sorted(asyncio.run(asyncio.wait_for(watch(False, 2), 10))) == ['copy.mae', 'new.mae']
+    seen = asyncio.run(asyncio.wait_for(watch(True, 3), 10))
+    # one already there and untouched for a while is whole at once
+    assert seen[0] == 'before.mae'
+    assert sorted(seen[1:]) == ['copy.mae', 'new.mae']
+
+
+def test_watch_runs_each_landed_file_through_ligprep(fake):
+    fake.ligands(2)
+    for file in os.listdir(fake.inputs):
+        touch(os.path.join(fake.inputs, file), text='', age=60)
+    outputs = os.path.join(fake.root, 'ligprep')
+
+    def prepared():
+        return sorted(file for file in os.listdir(outputs) if file.endswith('.mae')) if os.path.isdir(outputs) else []
+
+    def seen(mw):
+        watcher = getattr(mw, 'watcher', None)
+        return len(watcher.seen) if watcher is not None else 0
+
+    async def watch(mw, dropped, wanted):
+        task = asyncio.ensure_future(mw.awatch(nt=2, settle=0.2, poll=0.1, options={'ligprep': {'output_type': 'mae'}}))
+        while seen(mw) < wanted - len(dropped) or len(prepared()) < wanted - len(dropped):
+            await asyncio.sleep(0.05)
+        # a ligand dropped in while the watch runs
+        for name in dropped:
+            os.rename(write_ligands(os.path.join(fake.root, 'incoming'), 3)[-1], os.path.join(fake.inputs, name))
+        while seen(mw) < wanted or len(prepared()) < wanted:
+            await asyncio.sleep(0.05)
+        mw.stop()
+        await task
+
+    asyncio.run(asyncio.wait_for(watch(fake.wrapper(), ['lig3.mae'], 3), 60))
+    assert len(prepared()) == 3
+    jobs = len(fake.jobs())
+    # a restarted watch skips what the last one collected
+    asyncio.run(asyncio.wait_for(watch(fake.wrapper(), [], 3), 60))
+    assert len(fake.jobs()) == jobs
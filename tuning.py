@@ -0,0 +1,164 @@
+import os
+import time
+import asyncio
+from collections import deque
+
+
+def cpu_count():
+    # cores this process may use, which under a batch system or taskset is fewer than the machine has
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def cpu_load():
+    # runnable processes per core over the last minute; None where the OS does not say (Windows)
+    try:
+        return os.getloadavg()[0] / cpu_count()
+    except (AttributeError, OSError):
+        return None
+
+
+class Limit:
+    # asyncio.Semaphore whose size can change while jobs hold it; shrinking never interrupts a running job,
+    # it only holds back the next ones
+
+    def __init__(self, n):
+        self.n = n
+        self.held = 0
+        self._waiters = deque()
+
+    async def acquire(self):
+        if self.held < self.n and not self._waiters:
+            self.held += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        self.held -= 1
+        self._wake()
+
+    def resize(self, n):
+        self.n = n
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.held < self.n:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.held += 1
+                waiter.set_result(None)
+
+
+class AutoTuner:
+    # picks how many jobs run at once (nt) and how many CPUs each asks job control for (-HOST host:slots),
+    # then revisits both every interval seconds while the stage runs. nt never goes past the cores, the
+    # licences free for the stage, or max_nt. within that it climbs towards more jobs while licences sit
+    # idle and the CPUs have room, backs off when the box is oversubscribed, and once enough jobs have
+    # finished per interval, keeps moving in whichever direction last raised jobs per minute
+
+    def __init__(self, cores=None, broker=None, lic=None, tokens=None, min_nt=1, max_nt=None, max_slots=12,
+                 interval=30, step=1, tolerance=0.05, min_samples=3, name='job'):
+        self.cores = cores if cores is not None else cpu_count()
+        self.broker = broker
+        self.lic = lic
+        self.tokens = tokens if tokens is not None else (broker.tokens(lic) if broker is not None and lic else 1)
+        self.min_nt = min_nt
+        self.max_nt = max_nt
+        self.max_slots = max_slots
+        self.interval = interval
+        self.step = step
+        self.tolerance = tolerance
+        self.min_samples = min_samples
+        self.name = name
+        self.nt = None
+        self.slots = None
+        self.direction = 1
+        self.last_rate = None
+        self.finished = deque()
+        self.history = []
+        self._window = None
+
+    def licence_bound(self, running=0):
+        # jobs the licence pool could carry: those already holding tokens plus what is free
+        if self.broker is None or self.lic is None:
+            return None
+        free = self.broker.free(self.lic)
+        if free is None:
+            return None
+        return running + free // max(self.tokens, 1)
+
+    def bound(self, running=0):
+        bounds = [self.cores]
+        if self.max_nt is not None:
+            bounds.append(self.max_nt)
+        licences = self.licence_bound(running)
+        if licences is not None:
+            bounds.append(licences)
+        return max(min(bounds), self.min_nt)
+
+    def slots_for(self, nt):
+        return max(1, min(self.max_slots, self.cores // max(nt, 1)))
+
+    def set(self, nt, rate=None, reason=''):
+        if nt != self.nt:
+            if self.nt is not None:
+                print('{}: autotune nt {} -> {}, {} cpu(s) per job{}{}'.format(
+                    self.name, self.nt, nt, self.slots_for(nt),
+                    ', {:.1f} jobs/min'.format(rate) if rate is not None else '', ', ' + reason if reason else ''))
+            self.history.append((time.time(), nt, self.slots_for(nt), rate))
+        self.nt = nt
+        self.slots = self.slots_for(nt)
+        return nt
+
+    def start(self, n_jobs):
+        self._window = time.time()
+        nt = self.set(max(min(self.bound(), max(n_jobs, 1)), self.min_nt))
+        print('{}: autotune starts with nt {}, {} cpu(s) per job ({} cores{})'.format(
+            self.name, nt, self.slots, self.cores,
+            ', {} tokens per job'.format(self.tokens) if self.lic is not None else ''))
+        return nt
+
+    def observe(self, t):
+        self.finished.append(t)
+
+    def adjust(self, running, queued):
+        now = time.time()
+        elapsed = now - self._window
+        # only this interval's jobs are counted; older ones are dropped instead of kept for the whole stage
+        while self.finished and self.finished[0] < self._window:
+            self.finished.popleft()
+        done = len(self.finished)
+        rate = done / elapsed * 60 if elapsed > 0 else None
+        self._window = now
+        bound = self.bound(running)
+        load = cpu_load()
+        nt = self.nt
+        if nt > bound:
+            nt, reason = bound, 'licences or cores short'
+        # the stage's own jobs keep the load near 1.0 per core when the tuner has it right, so only runnable
+        # processes beyond the cores by more than one job's cpus say the box is oversubscribed
+        elif load is not None and (load - 1.0) * self.cores > self.slots and nt > self.min_nt:
+            nt, reason = nt - self.step, 'load {:.2f} per core'.format(load)
+        elif not queued:
+            return self.nt
+        elif done >= self.min_samples and self.last_rate is not None:
+            if rate < self.last_rate * (1 - self.tolerance):
+                # the last move cost throughput
+                self.direction = -self.direction
+            nt, reason = nt + self.direction * self.step, 'hill climbing'
+        elif nt < bound:
+            nt, reason = nt + self.step, 'licences and cores idle'
+        else:
+            return self.nt
+        if done >= self.min_samples:
+            self.last_rate = rate
+        return self.set(max(self.min_nt, min(nt, bound)), rate, reason)
@@ -0,0 +1,102 @@
+import os
+import time
+import asyncio
+import fnmatch
+
+from maestrowrapper.jobs import DirectoryWatch
+
+
+# names copy tools and browsers give a file while it is still being written
+PARTIAL = ('.tmp', '.part', '.partial', '.crdownload', '.filepart', '~')
+
+
+class FolderWatch:
+    # the files that land in a directory, each yielded once, after it has stopped changing for settle seconds.
+    # a file written in several goes (a copy over the network, a docking run appending poses) is seen as it
+    # grows but only yielded when it is whole. inotify (through watchdog) says when to look; without it,
+    # or on filesystems that send no events, the directory is rescanned every poll seconds
+
+    def __init__(self, path, pattern=None, settle=2.0, poll=5.0, existing=True):
+        self.path = os.path.abspath(path)
+        self.patterns = [pattern] if isinstance(pattern, str) else list(pattern or [])
+        self.settle = settle
+        self.poll = poll
+        self.existing = existing
+        self.seen = set()
+        self.changing = {}
+        self._wake = None
+        self._stop = None
+        self._loop = None
+
+    def wanted(self, name):
+        if name.startswith('.') or name.endswith(PARTIAL):
+            return False
+        return not self.patterns or any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+
+    def scan(self):
+        # files that have sat unchanged for settle seconds; the rest are remembered as still changing
+        now = time.time()
+        ready = []
+        current = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name in self.seen or not self.wanted(entry.name):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                state = (stat.st_size, stat.st_mtime_ns)
+                last, since = self.changing.get(entry.name, (None, now))
+                if state != last:
+                    since = now
+                # one not touched for a while is whole the first time it is seen (already there at start)
+                if now - since >= self.settle or (last is None and now - stat.st_mtime >= self.settle):
+                    ready.append(entry.name)
+                else:
+                    current[entry.name] = (state, since)
+        self.changing = current
+        return sorted(ready)
+
+    def notify(self):
+        # called from the watchdog thread
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def stop(self):
+        # safe from any thread; files() returns at its next wait
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    @property
+    def stopped(self):
+        return self._stop is not None and self._stop.is_set()
+
+    async def files(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._stop = asyncio.Event()
+        if not self.existing:
+            self.seen.update(name for name in os.listdir(self.path) if self.wanted(name))
+        watch = DirectoryWatch(self.path, self.notify, thread=False).start()
+        try:
+            while not self._stop.is_set():
+                self._wake.clear()
+                for name in self.scan():
+                    self.seen.add(name)
+                    yield os.path.join(self.path, name)
+                    if self._stop.is_set():
+                        return
+                # files still settling are looked at again once they could have settled
+                timeout = self.settle if self.changing else (self.poll if watch.watch is not None else min(self.poll, 1.0))
+                stop = asyncio.ensure_future(self._stop.wait())
+                wake = asyncio.ensure_future(self._wake.wait())
+                try:
+                    await asyncio.wait([stop, wake], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    stop.cancel()
+                    wake.cancel()
+        finally:
+            watch.stop()